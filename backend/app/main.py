@@ -1,5 +1,8 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from app.routers import gray_sketch
 from app.routers import color_sketch
 from app.routers import sticker
@@ -10,12 +13,46 @@ from app.routers import manga
 from app.routers import popart
 from app.routers import style_transfer
 from app.routers import pixel_art
+from app.routers import batch
+from app.routers import fanout
+from app.routers import chain
+from app.routers import jobs
+from app.ml.batching import batcher_stats
+from app.ml.registry import model_registry
+from app.utils.effects import EFFECTS
+from app.utils.encoding import encode_stats
+from app.utils.executor import shutdown_pools
+from app.utils.image_io import RequestSizeLimit, upload_stats
+from app.utils.jobs import job_runner
+from app.utils.metrics import CONTENT_TYPE, MetricsMiddleware, ServerTimingMiddleware, render_metrics
+from app.utils import profiling
+from app.utils.result_cache import result_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm up ML models in the background; see /ready
+    model_registry.start_preload()
+    # Workers of the async job API (see /jobs)
+    await job_runner.start()
+    yield
+    # Drop running jobs, let an unfinished preload wrap up, then stop
+    # effect worker pools
+    await job_runner.stop()
+    model_registry.stop_preload()
+    shutdown_pools()
+
 
 app = FastAPI(
     title="Image Transformation API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# 413 for request bodies over UPLOAD_MAX_REQUEST_MB, before they are
+# read (added first so the CORS middleware wraps its responses)
+app.add_middleware(RequestSizeLimit)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +62,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server-Timing header with the stage durations of each request
+app.add_middleware(ServerTimingMiddleware)
+
+# cProfile of requests sending X-Profile: 1, only with PROFILING_ENABLED=1
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfileMiddleware)
+
+# Request counts and latency per route (outermost, so it sees every
+# response, 413s and CORS preflights included)
+app.add_middleware(MetricsMiddleware)
+
 # Register routers
 app.include_router(gray_sketch.router)
 app.include_router(color_sketch.router)
@@ -36,8 +84,80 @@ app.include_router(manga.router)
 app.include_router(popart.router)
 app.include_router(style_transfer.router)
 app.include_router(pixel_art.router)
+app.include_router(batch.router)
+app.include_router(fanout.router)
+app.include_router(chain.router)
+app.include_router(jobs.router)
+
+# Prometheus metrics: per-effect stage latency, input pixels, worker
+# pools, HTTP requests, result cache, uploads and models
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
 
 # Health check endpoint
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+# Readiness: preloaded models are loaded and warmed up
+@app.get("/ready")
+def readiness_check():
+    stats = model_registry.stats()
+    if not stats["ready"]:
+        status = "loading" if stats["preloading"] else "unavailable"
+        return JSONResponse(status_code=503, content={"status": status, **stats})
+    return {"status": "ready"}
+
+
+# Effect registry: styles, input/output formats, cost class and pool
+@app.get("/effects")
+def list_effects():
+    return [effect.describe() for effect in EFFECTS.values()]
+
+
+# Model load times and resident sizes, and micro-batcher batch sizes
+# and waits
+@app.get("/models/stats")
+def model_stats():
+    return {**model_registry.stats(), "batchers": batcher_stats()}
+
+
+# Result cache hit/miss counters
+@app.get("/cache/stats")
+def cache_stats():
+    return result_cache.stats()
+
+
+# Encode time and output size per effect and format
+@app.get("/encode/stats")
+def encode_statistics():
+    return encode_stats.stats()
+
+
+# Upload sizes, rejections and input memory held by requests
+@app.get("/upload/stats")
+def upload_statistics():
+    return upload_stats.stats()
+
+
+# Stored request profiles (see app/utils/profiling.py): a text summary,
+# or the pstats file with raw=true
+if profiling.ENABLED:
+    @app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+    def get_profile(
+        profile_id: str,
+        sort: str = Query("cumulative", description="cumulative, tottime or calls"),
+        raw: bool = Query(False, description="Download the pstats file")
+    ):
+        path = profiling.profile_path(profile_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        if raw:
+            return FileResponse(path, filename=path.name, media_type="application/octet-stream")
+        try:
+            return PlainTextResponse(profiling.profile_report(path, sort))
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=str(ve))
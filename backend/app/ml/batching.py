@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Empty, Queue
+from typing import Callable, Dict, List
+
+import torch
+
+from app.utils.metrics import Counter, Gauge, register_collector
+
+# Every batcher created, for /models/stats and /metrics
+BATCHERS: List["MicroBatcher"] = []
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching in front of a fixed-shape model.
+
+    Callers (worker threads) submit one (1, C, H, W) tensor each and block.
+    A background thread takes the first waiting request, keeps collecting
+    more for up to `max_wait_ms` or until `max_batch_size` is reached,
+    runs a single batched forward pass and hands each caller its slice.
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[torch.Tensor], torch.Tensor],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 10.0,
+        name: str = "model"
+    ):
+        self.forward = forward
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.name = name
+
+        self._queue: Queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Stats: totals plus recent timings (ms)
+        #   waits:   per item, enqueue -> forward start (includes queueing
+        #            behind a running batch)
+        #   windows: per batch, time spent holding the batch open
+        self.batches = 0
+        self.items = 0
+        self._recent_waits = deque(maxlen=1024)
+        self._recent_windows = deque(maxlen=1024)
+        self._recent_forwards = deque(maxlen=1024)
+
+        BATCHERS.append(self)
+
+    # ---------------------------------------------------------------
+    # Public API
+    # ---------------------------------------------------------------
+
+    def submit(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Runs the model on a single-item batch, sharing the forward
+        pass with any concurrent callers. Blocks until done.
+        """
+        if self.max_batch_size == 1:
+            with torch.no_grad():
+                return self.forward(input_tensor)
+
+        self._ensure_worker()
+
+        future: Future = Future()
+        self._queue.put((input_tensor, future, time.perf_counter()))
+        return future.result()
+
+    def stats(self) -> dict:
+        """
+        Batch sizes and the queue wait callers paid for batching.
+        """
+        waits = sorted(self._recent_waits)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        def mean(values):
+            return sum(values) / len(values) if values else 0.0
+
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "wait_ms_p50": percentile(0.50),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": waits[-1] if waits else 0.0,
+            "window_ms_mean": mean(self._recent_windows),
+            "forward_ms_mean": mean(self._recent_forwards),
+        }
+
+    # ---------------------------------------------------------------
+    # Worker
+    # ---------------------------------------------------------------
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"batcher-{self.name}",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        opened = time.perf_counter()
+        deadline = opened + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+
+        self._recent_windows.append((time.perf_counter() - opened) * 1000.0)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+
+            tensors = [item[0] for item in batch]
+            futures = [item[1] for item in batch]
+
+            for _, _, enqueued in batch:
+                self._recent_waits.append((started - enqueued) * 1000.0)
+
+            try:
+                with torch.no_grad():
+                    outputs = self.forward(torch.cat(tensors, dim=0))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            self._recent_forwards.append((time.perf_counter() - started) * 1000.0)
+
+            for i, future in enumerate(futures):
+                future.set_result(outputs[i:i + 1])
+
+
+def batcher_stats() -> Dict[str, dict]:
+    """
+    stats() of every batcher, by name.
+    """
+    return {batcher.name: batcher.stats() for batcher in BATCHERS}
+
+
+def _collect_batcher_metrics():
+    batches = Counter("batcher_batches_total", "Batched forward passes", ("batcher",))
+    items = Counter("batcher_items_total", "Items run through batched forward passes", ("batcher",))
+    size = Gauge("batcher_mean_batch_size", "Mean items per forward pass", ("batcher",))
+    wait = Gauge(
+        "batcher_wait_seconds",
+        "Recent item waits, enqueue to forward start (quantile 1 = max)",
+        ("batcher", "quantile")
+    )
+    window = Gauge("batcher_window_seconds", "Mean time a batch is held open (recent batches)", ("batcher",))
+    forward = Gauge("batcher_forward_seconds", "Mean forward pass time (recent batches)", ("batcher",))
+    for name, stats in batcher_stats().items():
+        batches.set(stats["batches"], name)
+        items.set(stats["items"], name)
+        size.set(stats["mean_batch_size"], name)
+        wait.set(stats["wait_ms_p50"] / 1000.0, name, "0.5")
+        wait.set(stats["wait_ms_p95"] / 1000.0, name, "0.95")
+        wait.set(stats["wait_ms_max"] / 1000.0, name, "1")
+        window.set(stats["window_ms_mean"] / 1000.0, name)
+        forward.set(stats["forward_ms_mean"] / 1000.0, name)
+    return [batches, items, size, wait, window, forward]
+
+
+register_collector(_collect_batcher_metrics)
@@ -0,0 +1,192 @@
+import copy
+import inspect
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import torch
+from torch import nn
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# "torch" (eager PyTorch) or "onnx" (ONNX Runtime). Services may have
+# their own override, e.g. STYLE_BACKEND / CARTOON_BACKEND.
+DEFAULT_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch").lower()
+
+# ONNX Runtime threading (0 = let ORT decide)
+ORT_INTRA_OP_THREADS = int(os.environ.get("ORT_INTRA_OP_THREADS", "0"))
+ORT_INTER_OP_THREADS = int(os.environ.get("ORT_INTER_OP_THREADS", "1"))
+
+ONNX_OPSET = 17
+
+VALID_BACKENDS = ("torch", "onnx")
+
+
+def backend_for(service_env: str) -> str:
+    """
+    Backend for a service: its own env override, else INFERENCE_BACKEND.
+    """
+    backend = os.environ.get(service_env, DEFAULT_BACKEND).lower()
+    if backend not in VALID_BACKENDS:
+        raise ValueError(f"Invalid inference backend '{backend}' in {service_env}")
+    return backend
+
+
+# -------------------------------------------------------------------
+# Export
+# -------------------------------------------------------------------
+
+def export_onnx(
+    model: nn.Module,
+    sample_input: torch.Tensor,
+    onnx_path: Path,
+    dynamic_spatial: bool = False
+) -> Path:
+    """
+    Exports an eval-mode model to ONNX with a dynamic batch axis
+    (and dynamic height/width if requested).
+
+    A CPU copy of the model is traced, so the caller's module (e.g. a
+    registry model other threads may be running, possibly on the GPU)
+    is left untouched.
+    """
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+
+    axes = {0: "batch"}
+    if dynamic_spatial:
+        axes.update({2: "height", 3: "width"})
+
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the torch.export based exporter;
+        # keep the TorchScript exporter these models were validated with.
+        export_kwargs["dynamo"] = False
+
+    # Write to a temp name so a crashed export never leaves a bad model
+    tmp_path = onnx_path.with_name(onnx_path.name + ".tmp")
+    export_model = copy.deepcopy(model).cpu().eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            export_model,
+            sample_input.cpu(),
+            str(tmp_path),
+            input_names=["input"],
+            output_names=["output"],
+            dynamic_axes={"input": axes, "output": axes},
+            opset_version=ONNX_OPSET,
+            do_constant_folding=True,
+            **export_kwargs
+        )
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def ensure_onnx(
+    model: nn.Module,
+    sample_input: torch.Tensor,
+    onnx_path: Path,
+    source_path: Optional[Path] = None,
+    dynamic_spatial: bool = False
+) -> Path:
+    """
+    Exports only when the ONNX file is missing or older than the
+    weights it was exported from.
+    """
+    onnx_path = Path(onnx_path)
+    stale = (
+        source_path is not None and onnx_path.exists() and
+        onnx_path.stat().st_mtime < Path(source_path).stat().st_mtime
+    )
+    if not onnx_path.exists() or stale:
+        export_onnx(model, sample_input, onnx_path, dynamic_spatial)
+    return onnx_path
+
+
+# -------------------------------------------------------------------
+# Runtime
+# -------------------------------------------------------------------
+
+class OrtModel:
+    """
+    ONNX Runtime session with a torch-module-like call signature:
+    takes and returns (N, C, H, W) float tensors, so it can replace
+    the eager model in existing service code.
+    """
+
+    def __init__(
+        self,
+        onnx_path: Path,
+        intra_op_threads: int = ORT_INTRA_OP_THREADS,
+        inter_op_threads: int = ORT_INTER_OP_THREADS
+    ):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+
+        self.onnx_path = Path(onnx_path)
+        self.session = ort.InferenceSession(
+            str(self.onnx_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        array = input_tensor.detach().cpu().numpy().astype(np.float32, copy=False)
+        output = self.session.run(None, {self.input_name: array})[0]
+        return torch.from_numpy(output)
+
+
+# -------------------------------------------------------------------
+# Parity & latency
+# -------------------------------------------------------------------
+
+def compare_backends(
+    torch_model: nn.Module,
+    ort_model: OrtModel,
+    inputs: Sequence[torch.Tensor],
+    repeats: int = 3
+) -> Dict[str, float]:
+    """
+    Max/mean absolute output difference and mean latency (ms) of the
+    eager model vs. its ONNX Runtime session on the same inputs.
+    """
+    max_diff = 0.0
+    mean_diffs = []
+    torch_ms = []
+    ort_ms = []
+
+    for x in inputs:
+        with torch.no_grad():
+            expected = torch_model(x)
+        actual = ort_model(x)
+
+        diff = (expected.cpu() - actual).abs()
+        max_diff = max(max_diff, diff.max().item())
+        mean_diffs.append(diff.mean().item())
+
+        for _ in range(repeats):
+            start = time.perf_counter()
+            with torch.no_grad():
+                torch_model(x)
+            torch_ms.append((time.perf_counter() - start) * 1000.0)
+
+            start = time.perf_counter()
+            ort_model(x)
+            ort_ms.append((time.perf_counter() - start) * 1000.0)
+
+    return {
+        "max_abs_diff": max_diff,
+        "mean_abs_diff": float(np.mean(mean_diffs)),
+        "torch_ms": float(np.mean(torch_ms)),
+        "onnx_ms": float(np.mean(ort_ms)),
+    }
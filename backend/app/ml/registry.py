@@ -0,0 +1,291 @@
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from torch import nn
+
+from app.utils.metrics import Counter, Gauge, Histogram, register, register_collector
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# Models loaded (and warmed up) at startup: "all", "none" or a
+# comma-separated list of registered names, e.g. "animegan,style:candy"
+PRELOAD = os.environ.get("MODEL_PRELOAD", "all").strip()
+
+# Warmup forward passes per model before it is reported ready
+WARMUP_RUNS = int(os.environ.get("MODEL_WARMUP_RUNS", "1"))
+
+# Resident budget for all loaded models; least recently used models
+# are unloaded once it is exceeded (0 disables eviction)
+MEMORY_BUDGET = int(float(os.environ.get("MODEL_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024)
+
+# Every load, including reloads after an eviction
+MODEL_LOAD_SECONDS = register(Histogram(
+    "model_load_seconds", "Model load time (without warmup)", ("model",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+))
+
+
+def resident_bytes(model: Any) -> int:
+    """
+    Approximate memory held by a loaded model.
+    """
+    if isinstance(model, nn.Module):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    size = getattr(model, "resident_bytes", None)
+    if size is not None:
+        return int(size)
+
+    path = getattr(model, "onnx_path", None)
+    if path is not None and Path(path).exists():
+        return Path(path).stat().st_size
+
+    return 0
+
+
+class _Entry:
+    def __init__(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]]):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.lock = threading.Lock()
+
+        self.model = None
+        self.size = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.warmup_seconds = 0.0
+        self.last_used = 0.0
+        self.error: Optional[str] = None
+
+
+class ModelRegistry:
+    """
+    Single place where ML services get their models.
+
+    Services register a loader (and optional warmup) at import time.
+    Models are loaded lazily on first use or eagerly by preload(),
+    tracked in LRU order and unloaded when the memory budget is
+    exceeded. Loading one model never blocks users of another.
+    """
+
+    def __init__(self, memory_budget: int = MEMORY_BUDGET, warmup_runs: int = WARMUP_RUNS):
+        self.memory_budget = memory_budget
+        self.warmup_runs = warmup_runs
+
+        self._entries: Dict[str, _Entry] = {}
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.ready = False
+        self.preloading = False
+        self._stop_preload = threading.Event()
+        self._preload_thread: Optional[threading.Thread] = None
+
+    # ---------------------------------------------------------------
+    # Registration & access
+    # ---------------------------------------------------------------
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        warmup: Optional[Callable[[Any], None]] = None
+    ) -> None:
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(name, loader, warmup)
+
+    def names(self):
+        return list(self._entries)
+
+    def get(self, name: str) -> Any:
+        """
+        Returns the loaded model, loading (and warming) it if needed.
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Model '{name}' is not registered")
+
+        model = entry.model
+        if model is None:
+            with entry.lock:
+                model = entry.model
+                if model is None:
+                    model = self._load(entry)
+
+        with self._lock:
+            entry.last_used = time.time()
+            if name in self._lru:
+                self._lru.move_to_end(name)
+
+        return model
+
+    def _load(self, entry: _Entry) -> Any:
+        started = time.perf_counter()
+        try:
+            model = entry.loader()
+        except Exception as e:
+            entry.error = f"{type(e).__name__}: {e}"
+            raise
+        entry.load_seconds = time.perf_counter() - started
+        MODEL_LOAD_SECONDS.observe(entry.load_seconds, entry.name)
+
+        if entry.warmup is not None and self.warmup_runs > 0:
+            started = time.perf_counter()
+            for _ in range(self.warmup_runs):
+                entry.warmup(model)
+            entry.warmup_seconds = time.perf_counter() - started
+
+        entry.size = resident_bytes(model)
+        entry.loads += 1
+        entry.error = None
+
+        with self._lock:
+            entry.model = model
+            self._lru[entry.name] = None
+            self._lru.move_to_end(entry.name)
+            self._evict(keep=entry.name)
+
+        return model
+
+    def _evict(self, keep: str) -> None:
+        if self.memory_budget <= 0:
+            return
+
+        while self._resident() > self.memory_budget:
+            victim = next((name for name in self._lru if name != keep), None)
+            if victim is None:
+                break
+            self.unload(victim, locked=True)
+
+    def _resident(self) -> int:
+        return sum(self._entries[name].size for name in self._lru)
+
+    def unload(self, name: str, locked: bool = False) -> None:
+        """
+        Drops the registry's reference; requests already holding the
+        model finish normally.
+        """
+        if not locked:
+            with self._lock:
+                return self.unload(name, locked=True)
+
+        entry = self._entries.get(name)
+        if entry is None:
+            return
+        entry.model = None
+        entry.size = 0
+        self._lru.pop(name, None)
+
+    # ---------------------------------------------------------------
+    # Startup
+    # ---------------------------------------------------------------
+
+    def preload_names(self):
+        if PRELOAD.lower() == "all":
+            return self.names()
+        if PRELOAD.lower() in ("", "none"):
+            return []
+        wanted = [name.strip() for name in PRELOAD.split(",") if name.strip()]
+        return [name for name in wanted if name in self._entries]
+
+    def preload(self) -> None:
+        """
+        Loads and warms up the configured models. A model that fails to
+        load is recorded (see stats()) instead of crashing the app, and
+        the registry is only marked ready if every model succeeded.
+        """
+        self.preloading = True
+        ok = True
+        try:
+            for name in self.preload_names():
+                if self._stop_preload.is_set():
+                    ok = False
+                    break
+                try:
+                    self.get(name)
+                except Exception:
+                    ok = False
+                    print(f"Model preload failed: {name}")
+                    traceback.print_exc()
+        finally:
+            self.preloading = False
+        self.ready = ok
+
+    def start_preload(self) -> threading.Thread:
+        """
+        Runs preload() in the background so the server can start
+        answering /health while models warm up.
+        """
+        self._stop_preload.clear()
+        thread = threading.Thread(target=self.preload, name="model-preload", daemon=True)
+        thread.start()
+        self._preload_thread = thread
+        return thread
+
+    def stop_preload(self) -> None:
+        """
+        Skips the models preload() has not started yet and waits for the
+        one in progress, so shutdown never tears down the interpreter
+        in the middle of a model load.
+        """
+        self._stop_preload.set()
+        if self._preload_thread is not None:
+            self._preload_thread.join()
+            self._preload_thread = None
+
+    # ---------------------------------------------------------------
+    # Metrics
+    # ---------------------------------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "preloading": self.preloading,
+                "memory_budget": self.memory_budget,
+                "resident_bytes": self._resident(),
+                "models": {
+                    name: {
+                        "loaded": entry.model is not None,
+                        "resident_bytes": entry.size,
+                        "loads": entry.loads,
+                        "load_seconds": entry.load_seconds,
+                        "warmup_seconds": entry.warmup_seconds,
+                        "last_used": entry.last_used,
+                        "error": entry.error,
+                    }
+                    for name, entry in self._entries.items()
+                },
+            }
+
+
+model_registry = ModelRegistry()
+
+
+def _collect_model_metrics():
+    stats = model_registry.stats()
+    loaded = Gauge("model_loaded", "1 if the model is in memory", ("model",))
+    resident = Gauge("model_resident_bytes", "Memory held by the model", ("model",))
+    warmup = Gauge("model_warmup_seconds", "Warmup time of the last load", ("model",))
+    loads = Counter("model_loads_total", "Model loads", ("model",))
+    for name, model in stats["models"].items():
+        loaded.set(int(model["loaded"]), name)
+        resident.set(model["resident_bytes"], name)
+        loads.set(model["loads"], name)
+        warmup.set(model["warmup_seconds"], name)
+    ready = Gauge("models_ready", "1 once the preloaded models are loaded and warmed up")
+    ready.set(int(stats["ready"]))
+    return [loaded, resident, warmup, loads, ready]
+
+
+register_collector(_collect_model_metrics)
@@ -0,0 +1,175 @@
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import torch
+from torch import nn
+
+
+class FixedStatsInstanceNorm(nn.Module):
+    """
+    InstanceNorm2d that normalizes with precomputed per-channel
+    statistics instead of the statistics of its current input.
+
+    Running every tile through the same statistics keeps colors and
+    contrast consistent across tile boundaries.
+    """
+
+    def __init__(self, norm: nn.InstanceNorm2d, mean: torch.Tensor, var: torch.Tensor):
+        super().__init__()
+        self.eps = norm.eps
+        self.weight = norm.weight
+        self.bias = norm.bias
+        self.register_buffer("mean", mean.reshape(1, -1, 1, 1))
+        self.register_buffer("var", var.reshape(1, -1, 1, 1))
+
+    def forward(self, x):
+        y = (x - self.mean) / torch.sqrt(self.var + self.eps)
+        if self.weight is not None:
+            y = y * self.weight.reshape(1, -1, 1, 1) + self.bias.reshape(1, -1, 1, 1)
+        return y
+
+
+def _instance_norms(model: nn.Module) -> Dict[str, nn.InstanceNorm2d]:
+    return {
+        name: module
+        for name, module in model.named_modules()
+        if isinstance(module, nn.InstanceNorm2d)
+    }
+
+
+def freeze_instance_norm(model: nn.Module, reference: torch.Tensor) -> nn.Module:
+    """
+    Returns a copy of `model` whose InstanceNorm layers use the
+    statistics they see when running on `reference` (typically a
+    downscaled version of the whole image).
+
+    The original model is left untouched, so it can keep serving
+    regular requests concurrently.
+    """
+    frozen = copy.deepcopy(model)
+    norms = _instance_norms(frozen)
+    stats: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = {}
+
+    def capture(name):
+        def hook(module, inputs, output):
+            x = inputs[0]
+            stats[name] = (
+                x.mean(dim=(0, 2, 3)),
+                x.var(dim=(0, 2, 3), unbiased=False),
+            )
+        return hook
+
+    handles = [norm.register_forward_hook(capture(name)) for name, norm in norms.items()]
+    try:
+        with torch.no_grad():
+            frozen(reference)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    for name, norm in norms.items():
+        parent_name, _, attr = name.rpartition(".")
+        parent = frozen.get_submodule(parent_name) if parent_name else frozen
+        mean, var = stats[name]
+        setattr(parent, attr, FixedStatsInstanceNorm(norm, mean, var))
+
+    return frozen
+
+
+def _tile_spans(length: int, tile: int, stride: int, align: int) -> List[Tuple[int, int]]:
+    """
+    (start, size) of each tile along one axis. Starts are multiples of
+    `align` (the model's total downsampling factor) so every tile sees
+    the same sampling phase; the last tile absorbs the remainder.
+    """
+    if length <= tile:
+        return [(0, length)]
+
+    stride = max(align, stride // align * align)
+    last = (length - tile) // align * align
+    spans = [(start, tile) for start in range(0, last, stride)]
+    spans.append((last, length - last))
+    return spans
+
+
+def _feather(length: int, ramp_before: int, ramp_after: int) -> torch.Tensor:
+    """
+    1D blending weights: linear ramps over the overlapping ends,
+    flat in the middle. Never exactly zero so every pixel is covered.
+    """
+    w = torch.ones(length)
+    if ramp_before > 0:
+        w[:ramp_before] = torch.linspace(1.0 / (ramp_before + 1), 1.0, ramp_before + 1)[:-1]
+    if ramp_after > 0:
+        w[length - ramp_after:] = torch.linspace(1.0, 1.0 / (ramp_after + 1), ramp_after + 1)[1:]
+    return w
+
+
+def run_tiled(
+    model: nn.Module,
+    input_tensor: torch.Tensor,
+    tile_size: int = 512,
+    overlap: int = 128,
+    workers: int = 1,
+    align: int = 4
+) -> torch.Tensor:
+    """
+    Runs a fully convolutional model over overlapping tiles of a
+    (1, C, H, W) tensor and blends the results with feathered edges.
+
+    Model activations are bounded by the tile size; only the output
+    accumulator grows with the image. Tiles can run on several threads.
+    The overlap should cover the model's receptive field.
+    """
+    _, _, h, w = input_tensor.shape
+    stride = max(1, tile_size - overlap)
+
+    rows = _tile_spans(h, tile_size, stride, align)
+    cols = _tile_spans(w, tile_size, stride, align)
+
+    output = None
+    weight = torch.zeros(1, 1, h, w)
+    lock = threading.Lock()
+
+    def process(y0, th, x0, tw, ramps):
+        nonlocal output
+        tile = input_tensor[:, :, y0:y0 + th, x0:x0 + tw]
+
+        with torch.no_grad():
+            out = model(tile)[:, :, :th, :tw].cpu()
+
+        ramp_top, ramp_bottom, ramp_left, ramp_right = ramps
+        mask = (
+            _feather(th, ramp_top, ramp_bottom)[:, None] *
+            _feather(tw, ramp_left, ramp_right)[None, :]
+        )[None, None]
+
+        with lock:
+            if output is None:
+                output = torch.zeros(1, out.shape[1], h, w)
+            output[:, :, y0:y0 + th, x0:x0 + tw] += out * mask
+            weight[:, :, y0:y0 + th, x0:x0 + tw] += mask
+
+    def ramps(spans, i):
+        # Ramp only where this tile overlaps a neighbour
+        start, size = spans[i]
+        before = spans[i - 1][0] + spans[i - 1][1] - start if i > 0 else 0
+        after = start + size - spans[i + 1][0] if i + 1 < len(spans) else 0
+        return before, after
+
+    jobs = []
+    for i, (y0, th) in enumerate(rows):
+        for j, (x0, tw) in enumerate(cols):
+            jobs.append((y0, th, x0, tw, ramps(rows, i) + ramps(cols, j)))
+
+    if workers > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile") as pool:
+            for future in [pool.submit(process, *job) for job in jobs]:
+                future.result()
+    else:
+        for job in jobs:
+            process(*job)
+
+    return output / weight
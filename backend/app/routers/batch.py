@@ -0,0 +1,278 @@
+# backend/app/routers/batch.py
+
+import asyncio
+import os
+import time
+import zipfile
+from pathlib import PurePosixPath
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from PIL import UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.effects import get_effect, render_effect
+from app.utils.encoding import OutputFormat, item_format
+from app.utils.executor import get_pool
+from app.utils.image_io import ALLOWED_MIME_TYPES, MAX_UPLOAD_BYTES, Upload, UploadTooLarge, spool_upload
+from app.utils.metrics import StageTimer
+from app.utils.streaming import multi_result_response
+
+router = APIRouter(
+    prefix="/batch",
+    tags=["Batch"]
+)
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# Images accepted per request (files + zip members)
+MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "500"))
+
+# Items of one batch processed at the same time (also capped by the
+# effect's worker pool capacity)
+CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+
+# Largest uncompressed zip member
+MAX_MEMBER_BYTES = int(float(os.environ.get("BATCH_MAX_MEMBER_MB", "50")) * 1024 * 1024)
+
+# How long an item waits for a saturated effect pool before failing
+SATURATED_WAIT_SECONDS = float(os.environ.get("BATCH_SATURATED_WAIT", "30"))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+ZIP_MIME_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+
+# -------------------------------------------------------------------
+# Inputs
+# -------------------------------------------------------------------
+
+# (index, name, loader) - loaders read the bytes only when the item runs
+BatchItem = Tuple[int, str, Callable[[], bytes]]
+
+
+class BatchInputs:
+    """
+    The batch's images, plus the spooled copies of the uploads they are
+    read from. The copies belong to the batch (not to the request form)
+    so they stay readable while the response streams.
+    """
+
+    def __init__(self):
+        self.items: List[BatchItem] = []
+        self._files = []
+
+    def spool(self, upload: UploadFile, limit: int = 0):
+        # Large copies spill to disk (see spool_upload)
+        copy, _ = spool_upload(upload.file, limit)
+        self._files.append(copy)
+        return copy
+
+    def add_upload(self, upload: Upload, name: str) -> None:
+        # An image already read and checked by read_upload()
+        self._files.append(upload)
+        self.items.append((len(self.items), name, upload.read))
+
+    def close(self) -> None:
+        for f in self._files:
+            f.close()
+        self._files.clear()
+
+
+def is_zip(upload: UploadFile) -> bool:
+    return (
+        upload.content_type in ZIP_MIME_TYPES or
+        (upload.filename or "").lower().endswith(".zip")
+    )
+
+
+def _add_zip(inputs: BatchInputs, upload: UploadFile) -> None:
+    try:
+        archive = zipfile.ZipFile(inputs.spool(upload))
+    except zipfile.BadZipFile:
+        raise ValueError(f"Invalid zip archive: {upload.filename}")
+
+    for info in archive.infolist():
+        path = PurePosixPath(info.filename)
+        if info.is_dir() or path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        if path.parts[0] == "__MACOSX" or path.name.startswith("."):
+            continue
+
+        def load(info=info):
+            if info.file_size > MAX_MEMBER_BYTES:
+                raise ValueError(f"Zip member too large: {info.filename}")
+            return archive.read(info)
+
+        inputs.items.append((len(inputs.items), path.name, load))
+
+
+def _add_file(inputs: BatchInputs, upload: UploadFile) -> None:
+    content_type = upload.content_type
+    try:
+        spooled = inputs.spool(upload, MAX_UPLOAD_BYTES)
+        too_large = None
+    except UploadTooLarge as e:
+        # Reported for this item only
+        spooled, too_large = None, e
+
+    def load():
+        if too_large is not None:
+            raise too_large
+        if content_type not in ALLOWED_MIME_TYPES:
+            raise ValueError(f"Unsupported file type: {content_type}")
+        spooled.seek(0)
+        contents = spooled.read()
+        if not contents:
+            raise ValueError("Uploaded file is empty")
+        return contents
+
+    index = len(inputs.items)
+    inputs.items.append((index, upload.filename or f"image_{index}", load))
+
+
+def collect_inputs(files: List[UploadFile]) -> BatchInputs:
+    """
+    Flattens the uploads (images and zip archives of images) into
+    indexed batch items, in upload order.
+    """
+    inputs = BatchInputs()
+    try:
+        for upload in files:
+            if is_zip(upload):
+                _add_zip(inputs, upload)
+            else:
+                _add_file(inputs, upload)
+
+            if len(inputs.items) > MAX_ITEMS:
+                raise ValueError(f"Too many images in batch (max {MAX_ITEMS})")
+
+        if not inputs.items:
+            raise ValueError("No images in batch")
+    except Exception:
+        inputs.close()
+        raise
+    return inputs
+
+
+# -------------------------------------------------------------------
+# Processing
+# -------------------------------------------------------------------
+
+async def _render_item(
+    effect: str,
+    style: Optional[str],
+    preview: bool,
+    image_format: OutputFormat,
+    item: BatchItem,
+    slots: asyncio.Semaphore
+) -> dict:
+    index, name, load = item
+    result = {"index": index, "name": name}
+
+    async with slots:
+        started = time.perf_counter()
+        try:
+            # Zip members decompress and spooled uploads read off the loop
+            contents = await run_in_threadpool(load)
+
+            # Share the effect pool fairly with single-image requests:
+            # wait for a slot instead of failing the item right away
+            output = await render_effect(
+                effect, contents, style, preview, image_format, saturated_wait=SATURATED_WAIT_SECONDS
+            )
+
+            result.update(
+                status=200,
+                output=output,
+                filename=_output_name(index, name, image_format.extension),
+                media_type=image_format.media_type
+            )
+        except HTTPException as e:
+            result.update(status=e.status_code, error=str(e.detail))
+        except ValueError as e:
+            result.update(status=400, error=str(e))
+        except UnidentifiedImageError:
+            result.update(status=400, error="Cannot decode image")
+        except Exception as e:
+            result.update(status=500, error=f"{type(e).__name__}: {e}")
+
+        result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+async def process_batch(
+    effect: str,
+    style: Optional[str],
+    inputs: BatchInputs,
+    preview: bool = False,
+    image_format: OutputFormat = None
+) -> AsyncIterator[dict]:
+    """
+    Renders every item with bounded parallelism and yields the results
+    as they complete. A failing item yields an error result and never
+    stops the rest of the batch.
+    """
+    concurrency = max(1, min(CONCURRENCY, get_pool(get_effect(effect).name).capacity))
+    slots = asyncio.Semaphore(concurrency)
+    image_format = image_format or OutputFormat()
+
+    tasks = [
+        asyncio.ensure_future(_render_item(effect, style, preview, image_format, item, slots))
+        for item in inputs.items
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away (or the response failed): drop the rest
+        for task in tasks:
+            task.cancel()
+        inputs.close()
+
+
+def _output_name(index: int, name: str, extension: str = "png") -> str:
+    stem = PurePosixPath(name).stem or "image"
+    return f"{index:04d}_{stem}.{extension}"
+
+
+# -------------------------------------------------------------------
+# Endpoint
+# -------------------------------------------------------------------
+
+@router.post("/{effect}/")
+async def batch_effect(
+    effect: str,
+    files: List[UploadFile] = File(...),
+    style: Optional[str] = Query(None, description="Style for pixel_art / style_transfer"),
+    output: str = Query("zip", description="Response body: zip or multipart"),
+    preview: bool = Query(False, description="Fast low-resolution previews"),
+    image_format: OutputFormat = Depends(item_format)
+):
+    """
+    Applies one effect to many images (multiple files and/or zip
+    archives) and streams the results back as they finish.
+    Failed items are reported per item instead of failing the batch.
+    """
+    try:
+        get_effect(effect).check_style(style)
+        if output not in ("zip", "multipart"):
+            raise ValueError(f"Invalid output '{output}', expected zip or multipart")
+
+        with StageTimer("batch", "read"):
+            inputs = await run_in_threadpool(collect_inputs, files)
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    count = len(inputs.items)
+    results = process_batch(effect, style, inputs, preview, image_format)
+    return multi_result_response(
+        results,
+        output,
+        zip_name=f"{get_effect(effect).name}_batch.zip",
+        header_prefix="X-Batch",
+        headers={"X-Batch-Items": str(count)}
+    )
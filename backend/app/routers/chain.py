@@ -0,0 +1,93 @@
+# backend/app/routers/chain.py
+
+import os
+from typing import List
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+
+from app.utils.effects import COST_WEIGHTS, EffectSpec, parse_effects, run_chain
+from app.utils.encoding import OutputFormat, encode_result, image_response, output_format
+from app.utils.image_io import decode_upload, read_upload
+from app.utils.result_cache import make_key, result_cache
+
+router = APIRouter(
+    prefix="/chain",
+    tags=["Chain"]
+)
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# Most effects in one chain
+MAX_STEPS = int(os.environ.get("CHAIN_MAX_STEPS", "6"))
+
+# Most work in one chain, as the sum of the steps' COST_WEIGHTS
+# (light 1, heavy 2, model 4)
+MAX_COST = int(os.environ.get("CHAIN_MAX_COST", "12"))
+
+
+def check_chain(steps: List[EffectSpec]) -> None:
+    cost = sum(COST_WEIGHTS[effect.cost] for effect, _, _ in steps)
+    if cost > MAX_COST:
+        raise ValueError(
+            f"Chain too expensive (cost {cost}, max {MAX_COST}; "
+            f"light effects count {COST_WEIGHTS['light']}, heavy {COST_WEIGHTS['heavy']}, "
+            f"model {COST_WEIGHTS['model']})"
+        )
+
+
+@router.post("/")
+async def chain_effects(
+    file: UploadFile = File(...),
+    effects: str = Query(
+        ...,
+        description="Comma-separated effects, applied in order, style after a colon, "
+                    "e.g. cartoon,pixel-art:8bit"
+    ),
+    preview: bool = Query(False, description="Fast low-resolution preview"),
+    output: OutputFormat = Depends(output_format)
+):
+    """
+    Applies several effects one after the other to the uploaded image
+    and returns the final result. Intermediate results are passed in
+    memory, never encoded. The image is decoded as the first effect
+    needs it; with preview=true it is shrunk first.
+    Output is PNG, WebP or JPEG (?format= or the Accept header).
+    """
+    upload = None
+    try:
+        steps = parse_effects(effects, unique=False, max_effects=MAX_STEPS)
+        check_chain(steps)
+        first = steps[0][0]
+
+        # Load image
+        upload = await read_upload(file, first.input_spec, effect="chain")
+
+        # Serve repeated uploads from the result cache
+        labels = ",".join(label for _, _, label in steps)
+        cache_key = make_key("chain", upload.sha256, effects=labels, preview=preview, **output.cache_params())
+        cached = await result_cache.get("chain", cache_key)
+        if cached is not None:
+            return image_response(cached, output, cached=True)
+
+        image = await decode_upload(upload, preview=preview, spec=first.input_spec, effect="chain")
+
+        # Run every step in its effect's worker pool
+        result = await run_chain(steps, image, preview)
+
+        # Encode off the event loop and return
+        data = await encode_result("chain", result, output, preview)
+        await result_cache.put("chain", cache_key, data)
+
+        return image_response(data, output)
+
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Effect chain failed: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.close()
@@ -0,0 +1,166 @@
+# backend/app/routers/fanout.py
+
+import asyncio
+import functools
+import time
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from PIL import UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.effects import DecodedImage, EffectSpec, parse_effects
+from app.utils.encoding import OutputFormat, item_format
+from app.utils.image_io import InputSpec, Upload, decode_image_bytes, read_upload
+from app.utils.result_cache import result_cache
+from app.utils.streaming import multi_result_response
+
+router = APIRouter(
+    prefix="/fanout",
+    tags=["Fan-out"]
+)
+
+# Most effects one request may ask for
+MAX_EFFECTS = 16
+
+
+class _SharedDecode:
+    """
+    Decodes the upload on first need only: when every effect is served
+    from the result cache the image is never decoded. The decode is the
+    smallest one serving every requested effect (see InputSpec.merge).
+    It runs once, in a worker thread, however many effects wait for it.
+    """
+
+    def __init__(self, upload: Upload, spec: InputSpec, preview: bool = False):
+        self.upload = upload
+        self.spec = spec
+        self.preview = preview
+        self._decoding: Optional[asyncio.Future] = None
+
+    def _decode(self) -> DecodedImage:
+        pil_img = decode_image_bytes(
+            self.upload, preview=self.preview, spec=self.spec, effect="fanout"
+        )
+        return DecodedImage(pil_img, share=True)
+
+    async def get(self) -> DecodedImage:
+        if self._decoding is None:
+            self._decoding = asyncio.ensure_future(run_in_threadpool(self._decode))
+        # A cancelled effect must not cancel the decode others wait for
+        return await asyncio.shield(self._decoding)
+
+    async def close(self) -> None:
+        if self._decoding is not None:
+            decoding = self._decoding
+            await asyncio.gather(decoding, return_exceptions=True)
+            if not decoding.cancelled() and decoding.exception() is None:
+                decoding.result().close()
+        self.upload.close()
+
+
+async def _render(
+    index: int,
+    spec: EffectSpec,
+    decode: _SharedDecode,
+    image_format: OutputFormat
+) -> dict:
+    effect, style, label = spec
+    result = {"index": index, "effect": effect.name, "style": style}
+    started = time.perf_counter()
+
+    try:
+        # Over this effect's pixel budget: fail it alone, before decoding
+        decode.upload.check_pixels(effect.input_spec)
+
+        cache_key = effect.cache_key(decode.upload.sha256, style, decode.preview, image_format)
+        output = await result_cache.get(effect.name, cache_key)
+        result["cached"] = output is not None
+
+        if output is None:
+            output = await effect.run(await decode.get(), style, decode.preview, image_format)
+            await result_cache.put(effect.name, cache_key, output)
+
+        result.update(
+            status=200,
+            output=output,
+            filename=f"{label}.{image_format.extension}",
+            media_type=image_format.media_type
+        )
+    except HTTPException as e:
+        result.update(status=e.status_code, error=str(e.detail))
+    except ValueError as e:
+        result.update(status=400, error=str(e))
+    except UnidentifiedImageError:
+        result.update(status=400, error="Cannot decode image")
+    except Exception as e:
+        result.update(status=500, error=f"{type(e).__name__}: {e}")
+
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+async def fan_out(
+    specs: List[EffectSpec],
+    upload: Upload,
+    preview: bool = False,
+    image_format: OutputFormat = None
+) -> AsyncIterator[dict]:
+    """
+    Runs every effect on one shared decode, in parallel (each in its
+    own worker pool), and yields results as they complete. Closes the
+    upload when done.
+    """
+    input_spec = functools.reduce(InputSpec.merge, (effect.input_spec for effect, _, _ in specs))
+    decode = _SharedDecode(upload, input_spec, preview)
+    image_format = image_format or OutputFormat()
+    tasks = [
+        asyncio.ensure_future(_render(index, spec, decode, image_format))
+        for index, spec in enumerate(specs)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Wait for running effects before releasing the shared pixels
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await decode.close()
+
+
+@router.post("/")
+async def fan_out_effects(
+    file: UploadFile = File(...),
+    effects: str = Query(
+        ...,
+        description="Comma-separated effects, style after a colon, "
+                    "e.g. gray-sketch,cartoon,pixel-art:8bit"
+    ),
+    output: str = Query("zip", description="Response body: zip or multipart"),
+    preview: bool = Query(False, description="Fast low-resolution previews"),
+    image_format: OutputFormat = Depends(item_format)
+):
+    """
+    Applies several effects to one uploaded image. The image is read
+    and decoded once and shared by all effects, which run in parallel;
+    results stream back together as they finish.
+    """
+    try:
+        specs = parse_effects(effects, max_effects=MAX_EFFECTS)
+        if output not in ("zip", "multipart"):
+            raise ValueError(f"Invalid output '{output}', expected zip or multipart")
+
+        upload = await read_upload(file, effect="fanout")
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    return multi_result_response(
+        fan_out(specs, upload, preview, image_format),
+        output,
+        zip_name="fanout.zip",
+        header_prefix="X-Effect",
+        headers={"X-Effects": ",".join(label for _, _, label in specs)}
+    )
@@ -1,14 +1,15 @@
 # backend/app/routers/gray_sketch.py
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
 
-from app.services.gray_sketch_service import convert_to_gray_sketch
+from app.services.gray_sketch_service import convert_to_gray_sketch, INPUT_SPEC
+from app.utils.executor import run_effect
 from app.utils.image_io import (
-    read_upload_file,
-    pil_to_cv,
-    cv_to_png_bytes
+    read_upload,
+    decode_upload_array
 )
+from app.utils.encoding import OutputFormat, encode_result, image_response, output_format
+from app.utils.result_cache import result_cache, make_key
 
 router = APIRouter(
     prefix="/gray-sketch",
@@ -17,26 +18,44 @@ router = APIRouter(
 
 
 @router.post("/")
-async def generate_gray_sketch(file: UploadFile = File(...)):
+async def generate_gray_sketch(
+    file: UploadFile = File(...),
+    preview: bool = Query(False, description="Fast low-resolution preview"),
+    output: OutputFormat = Depends(output_format)
+):
     """
     Accepts an uploaded image and returns a grayscale pencil sketch.
     Supports jpg, png, webp.
+    With preview=true a fast low-resolution preview is returned.
+    Output is PNG, WebP or JPEG (?format= or the Accept header).
     """
+    upload = None
     try:
-        # --- Read and validate image ---
-        pil_img = await read_upload_file(file)
+        # --- Read and validate upload ---
+        upload = await read_upload(file, INPUT_SPEC, effect="gray_sketch")
 
-        # --- Convert to OpenCV BGR ---
-        cv_img = pil_to_cv(pil_img)
+        # --- Serve repeated uploads from the result cache ---
+        cache_key = make_key("gray_sketch", upload.sha256, preview=preview, **output.cache_params())
+        cached = await result_cache.get("gray_sketch", cache_key)
+        if cached is not None:
+            return image_response(cached, output, cached=True)
+
+        # --- Decode and convert to OpenCV (off the event loop) ---
+        cv_img = await decode_upload_array(upload, preview=preview, spec=INPUT_SPEC, effect="gray_sketch")
 
         # --- Process image ---
-        sketch_array = convert_to_gray_sketch(cv_img)
+        sketch_array = await run_effect(
+            "gray_sketch", convert_to_gray_sketch, cv_img
+        )
 
-        # --- Encode result ---
-        buf = cv_to_png_bytes(sketch_array)
+        # --- Encode result (off the event loop) ---
+        data = await encode_result("gray_sketch", sketch_array, output, preview)
+        await result_cache.put("gray_sketch", cache_key, data)
 
-        return StreamingResponse(buf, media_type="image/png")
+        return image_response(data, output)
 
+    except HTTPException:
+        raise
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
@@ -44,3 +63,6 @@ async def generate_gray_sketch(file: UploadFile = File(...)):
             status_code=500,
             detail=f"Failed to generate gray sketch: {str(e)}"
         )
+    finally:
+        if upload is not None:
+            upload.close()
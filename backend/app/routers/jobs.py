@@ -0,0 +1,180 @@
+# backend/app/routers/jobs.py
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.routers.batch import BatchInputs, collect_inputs, is_zip, process_batch
+from app.utils.encoding import OutputFormat, item_format
+from app.utils.effects import get_effect
+from app.utils.image_io import read_upload
+from app.utils.jobs import Job, JobFailed, job_runner
+from app.utils.streaming import stream_zip
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"]
+)
+
+# Seconds clients are asked to wait between status polls
+POLL_SECONDS = 2
+
+
+def _job_body(job: Job) -> dict:
+    body = job.to_dict()
+    body["status_url"] = f"/jobs/{job.id}"
+    body["result_url"] = f"/jobs/{job.id}/result"
+    if job.status == "queued":
+        body["position"] = job_runner.position(job.id)
+    return body
+
+
+async def _get_job(job_id: str) -> Job:
+    job = await job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+def _render(inputs: BatchInputs, image_format: OutputFormat):
+    """
+    The job's work (see JobWork): one image, or a zip archive of every
+    item with its manifest, like the batch endpoint returns.
+    """
+    async def work(job: Job, writer) -> None:
+        results = process_batch(
+            job.effect, job.style, inputs, job.params["preview"], image_format
+        )
+
+        if job.kind == "image":
+            async for result in results:
+                if result["status"] != 200:
+                    raise JobFailed(result["status"], result["error"])
+                await run_in_threadpool(writer.write, result["output"])
+                job.completed = 1
+                job.media_type = result["media_type"]
+                job.filename = result["filename"]
+            return
+
+        async def progress():
+            async for result in results:
+                if result["status"] == 200:
+                    job.completed += 1
+                else:
+                    job.failed += 1
+                await job_runner.save_progress(job)
+                yield result
+
+        async for chunk in stream_zip(progress()):
+            await run_in_threadpool(writer.write, chunk)
+        job.media_type = "application/zip"
+        job.filename = f"{job.effect}_batch.zip"
+
+    return work
+
+
+@router.post("/{effect}/", status_code=202)
+async def submit_job(
+    effect: str,
+    files: List[UploadFile] = File(...),
+    style: Optional[str] = Query(None, description="Style for pixel_art / style_transfer"),
+    preview: bool = Query(False, description="Fast low-resolution previews"),
+    image_format: OutputFormat = Depends(item_format)
+):
+    """
+    Queues an effect render and returns its job id at once; poll
+    status_url, then download result_url. One image gives an image
+    result; several files or zip archives give a zip of every result
+    with a manifest, like /batch. Results expire after
+    JOBS_RESULT_TTL_MINUTES.
+    """
+    inputs = None
+    try:
+        fx = get_effect(effect)
+        style = fx.check_style(style)
+
+        if len(files) == 1 and not is_zip(files[0]):
+            # Checked now (type, size, pixels) rather than when it runs
+            upload = await read_upload(files[0], fx.input_spec, effect="jobs")
+            inputs = BatchInputs()
+            inputs.add_upload(upload, files[0].filename or "image")
+            kind = "image"
+        else:
+            inputs = await run_in_threadpool(collect_inputs, files)
+            kind = "zip"
+
+        job = Job(
+            fx.name,
+            style,
+            params={"preview": preview, "format": image_format.name,
+                    "quality": image_format.quality, "speed": image_format.speed},
+            kind=kind,
+            items=len(inputs.items)
+        )
+        await job_runner.submit(job, _render(inputs, image_format), inputs.close)
+    except HTTPException:
+        if inputs is not None:
+            inputs.close()
+        raise
+    except ValueError as ve:
+        if inputs is not None:
+            inputs.close()
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    return JSONResponse(
+        status_code=202,
+        content=_job_body(job),
+        headers={"Location": f"/jobs/{job.id}", "Retry-After": str(POLL_SECONDS)}
+    )
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    """
+    Status and progress of a job.
+    """
+    job = await _get_job(job_id)
+    headers = {} if job.status in ("done", "failed") else {"Retry-After": str(POLL_SECONDS)}
+    return JSONResponse(content=_job_body(job), headers=headers)
+
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str):
+    """
+    The result of a finished job. 409 while it is queued or running;
+    a failed job answers with its error and status.
+    """
+    job = await _get_job(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=job.status_code or 500, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job.status}",
+            headers={"Retry-After": str(POLL_SECONDS)}
+        )
+
+    chunks = await job_runner.read_result(job.id)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Job result expired")
+    return StreamingResponse(
+        chunks,
+        media_type=job.media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=\"{job.filename}\"",
+            "Content-Length": str(job.size)
+        }
+    )
+
+
+@router.delete("/{job_id}", status_code=204)
+async def cancel_job(job_id: str):
+    """
+    Cancels a queued or running job, or deletes a finished one and its
+    result.
+    """
+    if not await job_runner.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return Response(status_code=204)
@@ -1,59 +1,68 @@
 # backend/app/routers/manga.py
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
-from app.services.manga_service import convert_to_manga
-from pathlib import Path
-import tempfile
-import os
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+
+from app.services.manga_service import convert_to_manga_from_array, INPUT_SPEC
+from app.utils.executor import run_effect
+from app.utils.image_io import (
+    read_upload,
+    decode_upload_array
+)
+from app.utils.encoding import OutputFormat, encode_result, image_response, output_format
+from app.utils.result_cache import result_cache, make_key
 
 router = APIRouter(
     prefix="/manga",
     tags=["Manga"]
 )
 
-def cleanup_files(*paths):
-    """
-    Safely delete temporary files after the response is fully sent.
-    Works correctly on Windows and Linux.
-    """
-    for path in paths:
-        try:
-            if path and os.path.exists(path):
-                os.remove(path)
-        except Exception:
-            pass
 
 @router.post("/")
 async def generate_manga(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    preview: bool = Query(False, description="Fast low-resolution preview"),
+    output: OutputFormat = Depends(output_format)
 ):
-    # Determine file extension
-    suffix = Path(file.filename).suffix or ".png"
+    """
+    Accepts an uploaded image and returns a black & white manga panel.
+    Supports jpg, png, webp.
+    With preview=true a fast low-resolution preview is returned.
+    Output is PNG, WebP or JPEG (?format= or the Accept header).
+    """
+    upload = None
+    try:
+        # --- Read and validate upload ---
+        upload = await read_upload(file, INPUT_SPEC, effect="manga")
 
-    # Save uploaded file to temporary path
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_input:
-        tmp_input.write(await file.read())
-        tmp_input_path = tmp_input.name
+        # --- Serve repeated uploads from the result cache ---
+        cache_key = make_key("manga", upload.sha256, preview=preview, **output.cache_params())
+        cached = await result_cache.get("manga", cache_key)
+        if cached is not None:
+            return image_response(cached, output, cached=True)
 
-    tmp_output_path = tmp_input_path + "_out.png"
+        # --- Decode and convert to OpenCV (off the event loop) ---
+        cv_img = await decode_upload_array(upload, preview=preview, spec=INPUT_SPEC, effect="manga")
 
-    try:
-        # Process image
-        convert_to_manga(tmp_input_path, tmp_output_path)
+        # --- Process image ---
+        result_array = await run_effect(
+            "manga", convert_to_manga_from_array, cv_img
+        )
 
-        # Schedule cleanup after response
-        background_tasks.add_task(cleanup_files, tmp_input_path, tmp_output_path)
+        # --- Encode result (off the event loop) ---
+        data = await encode_result("manga", result_array, output, preview)
+        await result_cache.put("manga", cache_key, data)
 
-        return StreamingResponse(
-            open(tmp_output_path, "rb"),
-            media_type="image/png"
-        )
+        return image_response(data, output)
 
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
-        cleanup_files(tmp_input_path, tmp_output_path)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate manga: {str(e)}"
         )
+    finally:
+        if upload is not None:
+            upload.close()
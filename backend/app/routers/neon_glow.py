@@ -1,68 +1,72 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
-from pathlib import Path
-from app.services.neon_glow_service import convert_to_neon_glow
-import tempfile
-import os
+# backend/app/routers/neon_glow.py
+
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+
+from app.services.neon_glow_service import convert_to_neon_glow_from_array, INPUT_SPEC
+from app.utils.executor import run_effect
+from app.utils.image_io import (
+    read_upload,
+    decode_upload_array
+)
+from app.utils.encoding import OutputFormat, encode_result, image_response, output_format
+from app.utils.result_cache import result_cache, make_key
 
 router = APIRouter(
     prefix="/neon-glow",
     tags=["NeonGlow"]
 )
 
-# -------------------------
-# Cleanup function
-# -------------------------
-def cleanup_files(*paths):
-    for path in paths:
-        try:
-            if path and os.path.exists(path):
-                os.remove(path)
-        except Exception:
-            pass
 
-# -------------------------
-# Endpoint
-# -------------------------
 @router.post("/")
 async def generate_neon_glow(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    preview: bool = Query(False, description="Fast low-resolution preview"),
+    output: OutputFormat = Depends(output_format)
 ):
-    # Save uploaded file to a temporary path
-    suffix = Path(file.filename).suffix or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_input:
-        tmp_input.write(await file.read())
-        tmp_input_path = tmp_input.name
-
-    # Output temp file
-    tmp_output_path = tmp_input_path + "_out.png"
-
+    """
+    Accepts an uploaded image and returns a neon glow sign image.
+    Supports jpg, png, webp.
+    With preview=true a fast low-resolution preview is returned.
+    Output is PNG, WebP or JPEG (?format= or the Accept header).
+    """
+    upload = None
     try:
-        # Apply neon glow effect with color mapping
-        convert_to_neon_glow(tmp_input_path, tmp_output_path, use_color_mapping=True)
+        # --- Read and validate upload ---
+        upload = await read_upload(file, INPUT_SPEC, effect="neon_glow")
 
-        # Schedule cleanup after response is sent
-        background_tasks.add_task(cleanup_files, tmp_input_path, tmp_output_path)
+        # --- Serve repeated uploads from the result cache ---
+        cache_key = make_key("neon_glow", upload.sha256, preview=preview, **output.cache_params())
+        cached = await result_cache.get("neon_glow", cache_key)
+        if cached is not None:
+            return image_response(cached, output, cached=True)
 
-        # Stream result back
-        with open(tmp_output_path, "rb") as f:
-            result_bytes = f.read()
-        return StreamingResponse(
-            iter([result_bytes]),
-            media_type="image/png"
+        # --- Decode and convert to OpenCV (off the event loop) ---
+        cv_img = await decode_upload_array(upload, preview=preview, spec=INPUT_SPEC, effect="neon_glow")
+
+        # --- Process image ---
+        result_array = await run_effect(
+            "neon_glow",
+            convert_to_neon_glow_from_array,
+            cv_img,
+            use_color_mapping=True
         )
 
+        # --- Encode result (off the event loop) ---
+        data = await encode_result("neon_glow", result_array, output, preview)
+        await result_cache.put("neon_glow", cache_key, data)
+
+        return image_response(data, output)
+
+    except HTTPException:
+        raise
     except ValueError as ve:
-        cleanup_files(tmp_input_path, tmp_output_path)
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid image: {str(ve)}"
-        )
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(ve)}")
     except Exception as e:
         print("Neon Glow Error:", e)  # Log full error
-        cleanup_files(tmp_input_path, tmp_output_path)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate Neon Glow: {str(e)}"
         )
+    finally:
+        if upload is not None:
+            upload.close()
@@ -1,37 +1,58 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from starlette.concurrency import run_in_threadpool
-from PIL import Image
-from io import BytesIO
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
 
-from app.services.pixel_art_service import convert_pixel_art, VALID_PIXEL_STYLES
+from app.services.pixel_art_service import convert_pixel_art, VALID_PIXEL_STYLES, INPUT_SPEC
+from app.utils.executor import run_effect
+from app.utils.encoding import OutputFormat, encode_result, image_response, output_format
+from app.utils.image_io import decode_upload, read_upload
+from app.utils.result_cache import result_cache, make_key
 
 router = APIRouter(prefix="/pixel-art", tags=["Pixel Art"])
 
 @router.post("/{style_name}/")
-async def pixel_art(style_name: str, file: UploadFile = File(...)):
+async def pixel_art(
+    style_name: str,
+    file: UploadFile = File(...),
+    preview: bool = Query(False, description="Fast low-resolution preview"),
+    output: OutputFormat = Depends(output_format)
+):
     """
     Apply Pixel Art filter to uploaded image.
     Supports styles: 8bit, 16bit, modern, mosaic
+    With preview=true a fast low-resolution preview is returned.
+    Output is PNG, WebP or JPEG (?format= or the Accept header).
     """
     style_name = style_name.lower()
     if style_name not in VALID_PIXEL_STYLES:
         raise HTTPException(status_code=400, detail=f"Invalid pixel art style '{style_name}'")
 
+    upload = None
     try:
         # Load image
-        img_bytes = await file.read()
-        pil_img = Image.open(BytesIO(img_bytes)).convert("RGB")
+        upload = await read_upload(file, INPUT_SPEC, effect="pixel_art")
 
-        # Run pixel art conversion in threadpool
-        output_img = await run_in_threadpool(convert_pixel_art, pil_img, style_name)
+        # Serve repeated uploads from the result cache
+        cache_key = make_key("pixel_art", upload.sha256, style=style_name, preview=preview, **output.cache_params())
+        cached = await result_cache.get("pixel_art", cache_key)
+        if cached is not None:
+            return image_response(cached, output, cached=True)
 
-        # Convert PIL image to BytesIO and return as streaming response
-        buf = BytesIO()
-        output_img.save(buf, format="PNG")
-        buf.seek(0)
+        pil_img = await decode_upload(upload, preview=preview, spec=INPUT_SPEC, effect="pixel_art", mode="RGB")
 
-        return StreamingResponse(buf, media_type="image/png")
+        # Run pixel art conversion in the effect's worker pool
+        output_img = await run_effect("pixel_art", convert_pixel_art, pil_img, style_name)
 
+        # Encode off the event loop and return
+        data = await encode_result("pixel_art", output_img, output, preview)
+        await result_cache.put("pixel_art", cache_key, data)
+
+        return image_response(data, output)
+
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Pixel art conversion failed: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.close()
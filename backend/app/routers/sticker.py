@@ -1,10 +1,12 @@
 # backend/app/routers/sticker.py
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
 from PIL import Image
-from app.services.sticker_service import convert_to_sticker
-from app.utils.image_io import read_upload_file, pil_to_bytes
+from app.services.sticker_service import convert_to_sticker, INPUT_SPEC
+from app.utils.executor import run_effect
+from app.utils.encoding import OutputFormat, encode_result, image_response, output_format
+from app.utils.image_io import read_upload, decode_upload
+from app.utils.result_cache import result_cache, make_key
 
 router = APIRouter(
     prefix="/sticker",
@@ -14,16 +16,36 @@ router = APIRouter(
 ALLOWED_MIME_TYPES = ["image/jpeg", "image/png", "image/webp"]
 
 @router.post("/")
-async def generate_sticker(file: UploadFile = File(...)):
+async def generate_sticker(
+    file: UploadFile = File(...),
+    preview: bool = Query(False, description="Fast low-resolution preview"),
+    output: OutputFormat = Depends(output_format)
+):
     """
     Accepts an uploaded image and returns a sticker (transparent PNG).
+    With preview=true a fast low-resolution preview is returned.
+    WebP keeps the transparency; JPEG is flattened onto white.
     """
+    upload = None
     try:
-        pil_img = await read_upload_file(file)
-        sticker_img = convert_to_sticker(pil_img)
-        buf = pil_to_bytes(sticker_img, fmt="PNG")
-        return StreamingResponse(buf, media_type="image/png")
+        upload = await read_upload(file, INPUT_SPEC, effect="sticker")
+
+        cache_key = make_key("sticker", upload.sha256, preview=preview, **output.cache_params())
+        cached = await result_cache.get("sticker", cache_key)
+        if cached is not None:
+            return image_response(cached, output, cached=True)
+
+        pil_img = await decode_upload(upload, preview=preview, spec=INPUT_SPEC, effect="sticker")
+        sticker_img = await run_effect("sticker", convert_to_sticker, pil_img)
+        data = await encode_result("sticker", sticker_img, output, preview)
+        await result_cache.put("sticker", cache_key, data)
+        return image_response(data, output)
+    except HTTPException:
+        raise
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate sticker: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.close()
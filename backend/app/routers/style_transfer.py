@@ -1,42 +1,72 @@
 # backend/app/routers/style_transfer.py
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse
-from fastapi.concurrency import run_in_threadpool
-from PIL import Image
-import io
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
 import traceback
 
-from app.services.style_transfer_service import convert_style_transfer
+from app.services.style_transfer_service import (
+    convert_style_transfer,
+    INPUT_SPEC,
+    TILED_INPUT_SPEC
+)
+from app.utils.effects import get_effect
+from app.utils.executor import run_effect
+from app.utils.encoding import OutputFormat, encode_result, image_response, output_format
+from app.utils.image_io import decode_upload, read_upload
+from app.utils.result_cache import result_cache, make_key
 
 router = APIRouter(prefix="/style-transfer", tags=["Style Transfer"])
 
 
 @router.post("/{style_name}/")
-async def style_transfer(style_name: str, file: UploadFile = File(...)):
+async def style_transfer(
+    style_name: str,
+    file: UploadFile = File(...),
+    tiled: bool = Query(False, description="Full-resolution tiled inference"),
+    preview: bool = Query(False, description="Fast low-resolution preview (overrides tiled)"),
+    output: OutputFormat = Depends(output_format)
+):
+    spec = TILED_INPUT_SPEC if tiled and not preview else INPUT_SPEC
+    upload = None
     try:
-        # 1. Read uploaded file
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        # Unknown styles get a 400 before the upload is read, like on
+        # /chain, /batch and /jobs
+        style_name = get_effect("style_transfer").check_style(style_name)
 
-        # 2. Run heavy AI inference in threadpool
-        output_image = await run_in_threadpool(
+        # 1. Read uploaded file (size and pixel limits checked here)
+        upload = await read_upload(file, spec, effect="style_transfer")
+
+        # Serve repeated uploads from the result cache
+        cache_key = make_key(
+            "style_transfer", upload.sha256,
+            style=style_name, tiled=tiled, preview=preview, **output.cache_params()
+        )
+        cached = await result_cache.get("style_transfer", cache_key)
+        if cached is not None:
+            return image_response(cached, output, cached=True)
+
+        image = await decode_upload(upload, preview=preview, spec=spec, effect="style_transfer", mode="RGB")
+
+        # 2. Run heavy AI inference in the effect's worker pool
+        output_image = await run_effect(
+            "style_transfer",
             convert_style_transfer,
             image,
-            style_name
+            style_name,
+            tiled,
+            preview
         )
 
-        # 3. Convert PIL image → bytes
-        img_bytes = io.BytesIO()
-        output_image.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
+        # 3. Encode PIL image → bytes (off the event loop)
+        img_bytes = await encode_result("style_transfer", output_image, output, preview)
+        await result_cache.put("style_transfer", cache_key, img_bytes)
 
         # 4. Return image response
-        return StreamingResponse(
-            img_bytes,
-            media_type="image/png"
-        )
+        return image_response(img_bytes, output)
 
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         # CRITICAL: expose error during development
         print("STYLE TRANSFER ERROR:")
@@ -46,3 +76,6 @@ async def style_transfer(style_name: str, file: UploadFile = File(...)):
             status_code=500,
             detail=str(e)
         )
+    finally:
+        if upload is not None:
+            upload.close()
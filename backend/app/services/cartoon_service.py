@@ -2,7 +2,13 @@ from pathlib import Path
 import torch
 from PIL import Image
 import torchvision.transforms as T
+import numpy as np
+import cv2
 from app.ml.animegan_generator import Generator
+from app.ml.batching import MicroBatcher
+from app.ml.onnx_backend import OrtModel, backend_for, ensure_onnx
+from app.ml.registry import model_registry
+from app.utils.image_io import InputSpec, ensure_bgr, pixel_budget
 import os
 
 # -------------------------------------------------------------------
@@ -11,26 +17,70 @@ import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 MODEL_PATH = BASE_DIR / "models" / "face_paint_512_v2.pt"
+ONNX_PATH = BASE_DIR / "models" / "onnx" / "face_paint_512_v2.onnx"
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Micro-batching: concurrent requests share one forward pass.
+# CARTOON_MAX_BATCH=1 disables batching.
+MAX_BATCH_SIZE = int(os.environ.get("CARTOON_MAX_BATCH", "4"))
+MAX_WAIT_MS = float(os.environ.get("CARTOON_MAX_WAIT_MS", "10"))
+
+# "torch" or "onnx" (falls back to INFERENCE_BACKEND)
+BACKEND = backend_for("CARTOON_BACKEND")
+
 # -------------------------------------------------------------------
-# Load AnimeGANv2 generator (LOCAL, OFFLINE)
+# Load AnimeGANv2 generator (LOCAL, OFFLINE, via the model registry)
 # -------------------------------------------------------------------
 
-if not MODEL_PATH.exists():
-    raise FileNotFoundError(f"AnimeGAN model not found: {MODEL_PATH}")
+MODEL_NAME = "animegan"
+
+def _load_generator():
+    if not MODEL_PATH.exists():
+        raise FileNotFoundError(f"AnimeGAN model not found: {MODEL_PATH}")
+
+    model = Generator()
+    state_dict = torch.load(MODEL_PATH, map_location=DEVICE)
+    model.load_state_dict(state_dict)
+    model.eval()
+    model.to(DEVICE)
+
+    # Eager model, or an ONNX Runtime session exported from it
+    if BACKEND == "onnx":
+        return OrtModel(ensure_onnx(
+            model,
+            torch.zeros(1, 3, 512, 512),
+            ONNX_PATH,
+            source_path=MODEL_PATH
+        ))
+    return model
+
+def _warmup_generator(model) -> None:
+    with torch.no_grad():
+        model(torch.zeros(1, 3, 512, 512, device=DEVICE))
+
+model_registry.register(MODEL_NAME, _load_generator, warmup=_warmup_generator)
+
+def _forward(batch: torch.Tensor) -> torch.Tensor:
+    return model_registry.get(MODEL_NAME)(batch)
 
-_model = Generator()
-state_dict = torch.load(MODEL_PATH, map_location=DEVICE)
-_model.load_state_dict(state_dict)
-_model.eval()
-_model.to(DEVICE)
+# AnimeGAN runs on a 512x512 canvas (the image resized to fit, then
+# padded); larger images need not be decoded at full size
+CANVAS_SIZE = 512
+INPUT_SPEC = InputSpec(max_size=CANVAS_SIZE, max_pixels=pixel_budget("cartoon"))
+
+# Every input is padded to CANVAS_SIZE, so requests can be stacked
+_batcher = MicroBatcher(
+    _forward,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
+    name=MODEL_NAME
+)
 
 # -------------------------------------------------------------------
 # Image helpers
 # -------------------------------------------------------------------
 
-def resize_and_pad(img: Image.Image, target_size: int = 512):
+def resize_and_pad(img: Image.Image, target_size: int = CANVAS_SIZE):
     """
     Resize image so the longest side == target_size,
     then pad to (target_size, target_size) without cropping.
@@ -54,12 +104,18 @@ def resize_and_pad(img: Image.Image, target_size: int = 512):
 # Public service function
 # -------------------------------------------------------------------
 
-def convert_to_cartoon(input_path: str, output_path: str) -> None:
+def convert_to_cartoon_from_array(img: np.ndarray) -> np.ndarray:
     """
-    Convert an input image to anime/cartoon style using AnimeGANv2.
+    Convert an image array (BGR) to anime/cartoon style using AnimeGANv2.
     Preserves full image content regardless of aspect ratio.
+
+    Args:
+        img (np.ndarray): Input image in BGR format
+
+    Returns:
+        np.ndarray: Cartoon image in BGR format
     """
-    img = Image.open(input_path).convert("RGB")
+    img = Image.fromarray(cv2.cvtColor(ensure_bgr(img), cv2.COLOR_BGR2RGB))
 
     padded_img, meta = resize_and_pad(img)
     pad_x, pad_y, w, h = meta
@@ -71,19 +127,33 @@ def convert_to_cartoon(input_path: str, output_path: str) -> None:
 
     input_tensor = transform(padded_img).unsqueeze(0).to(DEVICE)
 
-    with torch.no_grad():
-        output_tensor = _model(input_tensor)
+    output_tensor = _batcher.submit(input_tensor)
 
     # Denormalize
     output_tensor = (output_tensor.squeeze(0) * 0.5 + 0.5).clamp(0, 1)
-    output_img = T.ToPILImage()(output_tensor)
+    output_img = T.ToPILImage()(output_tensor.cpu())
 
     # Remove padding to restore original aspect
     final_img = output_img.crop(
         (pad_x, pad_y, pad_x + w, pad_y + h)
     )
 
-    final_img.save(output_path)
+    return cv2.cvtColor(np.array(final_img), cv2.COLOR_RGB2BGR)
+
+# -------------------------------------------------------------------
+# TEMPORARY COMPATIBILITY LAYER (DO NOT REMOVE YET)
+# -------------------------------------------------------------------
+
+def convert_to_cartoon(input_path: str, output_path: str) -> None:
+    """
+    Compatibility wrapper around convert_to_cartoon_from_array
+    for path-based callers.
+    """
+    img = cv2.imread(input_path)
+    if img is None:
+        raise ValueError("Failed to read input image")
+
+    cv2.imwrite(output_path, convert_to_cartoon_from_array(img))
 
     # Optionally delete temp input if needed
     if os.path.exists(input_path):
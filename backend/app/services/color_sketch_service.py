@@ -3,6 +3,13 @@
 import cv2
 import numpy as np
 
+from app.utils.image_io import InputSpec, ensure_bgr, pixel_budget
+from app.utils.textures import diagonal_hatching
+
+# Full resolution, color. Needs ~75 MB of working memory per
+# megapixel, hence a smaller pixel budget than the default
+INPUT_SPEC = InputSpec(max_pixels=pixel_budget("color_sketch", 16))
+
 
 def convert_to_color_sketch_from_array(img: np.ndarray) -> np.ndarray:
     """
@@ -14,8 +21,7 @@ def convert_to_color_sketch_from_array(img: np.ndarray) -> np.ndarray:
     Returns:
         np.ndarray: Color pencil sketch image in BGR format
     """
-    if img is None or img.size == 0:
-        raise ValueError("Invalid input image")
+    img = ensure_bgr(img)
 
     # --- Step 1: Smooth colors while preserving edges ---
     color_smooth = cv2.bilateralFilter(img, d=9, sigmaColor=90, sigmaSpace=90)
@@ -37,25 +43,14 @@ def convert_to_color_sketch_from_array(img: np.ndarray) -> np.ndarray:
     pencil_strokes = 255 - edges_dilated
     pencil_strokes = cv2.GaussianBlur(pencil_strokes, (5, 5), 1.0)
 
-    # --- Step 5: Cross-hatching texture ---
-    h, w = img.shape[:2]
-
-    hatching_1 = np.zeros((h, w), dtype=np.uint8)
-    for i in range(0, h, 4):
-        cv2.line(hatching_1, (0, i), (w, i + w), 200, 1)
-
-    hatching_2 = np.zeros((h, w), dtype=np.uint8)
-    for i in range(-w, h, 4):
-        cv2.line(hatching_2, (0, i), (w, i + w), 180, 1)
-
-    hatching = cv2.bitwise_or(hatching_1, hatching_2)
-    hatching = cv2.GaussianBlur(hatching, (3, 3), 0)
+    # --- Step 5: Cross-hatching texture (cached per image size) ---
+    hatching = diagonal_hatching(img.shape, weight=0.4)
 
     # --- Step 6: Blend strokes and texture ---
-    edge_strength = cv2.cvtColor(pencil_strokes, cv2.COLOR_GRAY2BGR).astype(np.float32) / 255.0
-    hatching_3ch = cv2.cvtColor(hatching, cv2.COLOR_GRAY2BGR).astype(np.float32) / 255.0
+    # Both layers are gray, so blend single-channel and broadcast over BGR
+    edge_strength = pencil_strokes.astype(np.float32)[:, :, None] / 255.0
 
-    texture = edge_strength * 0.6 + hatching_3ch * 0.4
+    texture = edge_strength * 0.6 + hatching
     texture = np.clip(texture, 0, 1)
 
     # --- Step 7: Apply texture ---
@@ -4,18 +4,40 @@ import cv2
 import numpy as np
 import os
 
-def convert_to_comic_art(input_path: str, output_path: str) -> None:
+from app.utils.image_io import InputSpec, ensure_bgr, pixel_budget
+from app.utils.palette import fit_palette, quantize
+
+# Full resolution, color
+INPUT_SPEC = InputSpec(max_pixels=pixel_budget("comic_art"))
+
+PALETTE_COLORS = 6
+
+# Pixels used to fit the palette; assignment still covers every pixel
+PALETTE_SAMPLE = int(os.environ.get("COMIC_PALETTE_SAMPLE", "20000"))
+PALETTE_ATTEMPTS = 10
+
+# Preview mode: a rougher palette fit (within a few percent of the
+# full fit's error) at a fraction of the k-means cost
+PREVIEW_PALETTE_SAMPLE = 5000
+PREVIEW_PALETTE_ATTEMPTS = 3
+
+
+def convert_to_comic_art_from_array(img: np.ndarray, preview: bool = False) -> np.ndarray:
     """
-    Converts an image to a comic-style effect:
+    Converts an image array (BGR) to a comic-style effect:
     - Bold outlines
     - Posterized flat colors
+
+    Args:
+        img (np.ndarray): Input image in BGR format
+        preview (bool): Fit the palette on a smaller sample
+
+    Returns:
+        np.ndarray: Comic art image in BGR format
     """
-    # --- Step 1: Read image ---
-    img = cv2.imread(input_path)
-    if img is None:
-        raise ValueError("Failed to read input image")
+    img = ensure_bgr(img)
 
-    # Convert to RGB
+    # --- Step 1: Convert to RGB ---
     img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
     # --- Step 2: Edge detection (bold) ---
@@ -25,24 +47,43 @@ def convert_to_comic_art(input_path: str, output_path: str) -> None:
     _, edges_binary = cv2.threshold(edges, 80, 255, cv2.THRESH_BINARY_INV)
 
     # --- Step 3: Posterize colors ---
-    # Reduce to 6 colors using k-means
-    data = img_rgb.reshape((-1, 3)).astype(np.float32)
-    K = 6
-    _, labels, centers = cv2.kmeans(
-        data, K, None,
-        (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.001),
-        10,
-        cv2.KMEANS_RANDOM_CENTERS
-    )
-    centers = np.uint8(centers)
-    posterized = centers[labels.flatten()].reshape(img_rgb.shape)
+    # Reduce to 6 colors: fit the palette on a pixel sample, then map
+    # every pixel to its nearest palette color through a color LUT
+    if preview:
+        centers = fit_palette(
+            img_rgb, PALETTE_COLORS,
+            sample_size=PREVIEW_PALETTE_SAMPLE,
+            attempts=PREVIEW_PALETTE_ATTEMPTS
+        )
+    else:
+        centers = fit_palette(
+            img_rgb, PALETTE_COLORS,
+            sample_size=PALETTE_SAMPLE,
+            attempts=PALETTE_ATTEMPTS
+        )
+    posterized = quantize(img_rgb, centers)
 
     # --- Step 4: Combine edges and posterized colors ---
     edges_rgb = cv2.cvtColor(edges_binary, cv2.COLOR_GRAY2RGB)
     comic = cv2.bitwise_and(posterized, edges_rgb)
 
-    # --- Step 5: Save output ---
-    cv2.imwrite(output_path, cv2.cvtColor(comic, cv2.COLOR_RGB2BGR))
+    return cv2.cvtColor(comic, cv2.COLOR_RGB2BGR)
+
+
+# -------------------------------------------------------------------
+# TEMPORARY COMPATIBILITY LAYER (DO NOT REMOVE YET)
+# -------------------------------------------------------------------
+
+def convert_to_comic_art(input_path: str, output_path: str) -> None:
+    """
+    Compatibility wrapper around convert_to_comic_art_from_array
+    for path-based callers.
+    """
+    img = cv2.imread(input_path)
+    if img is None:
+        raise ValueError("Failed to read input image")
+
+    cv2.imwrite(output_path, convert_to_comic_art_from_array(img))
 
     # Optional: delete input
     if os.path.exists(input_path):
@@ -3,21 +3,24 @@
 import cv2
 import numpy as np
 
+from app.utils.image_io import InputSpec, ensure_gray, pixel_budget
+
+# Full resolution, luminance only. Needs ~3 MB per megapixel, so it
+# accepts larger images than the default pixel budget
+INPUT_SPEC = InputSpec(gray=True, max_pixels=pixel_budget("gray_sketch", 80))
+
 def convert_to_gray_sketch(img: np.ndarray) -> np.ndarray:
     """
     Converts an image (NumPy array) to a pencil-style gray sketch.
 
     Args:
-        img (np.ndarray): Input image in BGR color space
+        img (np.ndarray): Input image, GRAY or BGR(A)
 
     Returns:
         np.ndarray: Grayscale sketch image
     """
-    if img is None:
-        raise ValueError("Input image is None")
-
-    # Convert to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # Convert to grayscale (no-op for gray decodes)
+    gray = ensure_gray(img)
 
     # Invert the grayscale
     inverted = 255 - gray
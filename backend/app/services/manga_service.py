@@ -4,13 +4,24 @@ import cv2
 import numpy as np
 import os
 
-def convert_to_manga(input_path: str, output_path: str) -> None:
+from app.utils.image_io import InputSpec, ensure_gray, pixel_budget
+from app.utils.textures import halftone_dots, cross_hatching
 
-    img = cv2.imread(input_path)
-    if img is None:
-        raise ValueError("Failed to read input image")
+# Full resolution, luminance only
+INPUT_SPEC = InputSpec(gray=True, max_pixels=pixel_budget("manga"))
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+def convert_to_manga_from_array(img: np.ndarray) -> np.ndarray:
+    """
+    Converts an image array (BGR) to a black & white manga panel:
+    bold edges, halftone dots and cross-hatching.
+
+    Args:
+        img (np.ndarray): Input image, GRAY or BGR(A)
+
+    Returns:
+        np.ndarray: Grayscale manga image
+    """
+    gray = ensure_gray(img)
 
     # --- smooth and denoise ---
     smooth = cv2.bilateralFilter(gray, 9, 75, 75)
@@ -23,27 +34,10 @@ def convert_to_manga(input_path: str, output_path: str) -> None:
     edges_inv = 255 - edges_dilated
 
     # --- halftone dots ---
-    h, w = gray.shape
-    halftone = np.ones_like(gray) * 255
-    step = 4
-    for y in range(0, h, step):
-        for x in range(0, w, step):
-            if smooth[y, x] < 128:
-                radius = 1 + (128 - smooth[y, x]) // 32
-                cv2.circle(halftone, (x, y), radius, 0, -1)
+    halftone = halftone_dots(smooth, step=4, threshold=128)
 
     # --- cross-hatching ---
-    hatching = np.ones_like(gray) * 255  # start white
-    hatch_step = 6
-    for y in range(0, h, hatch_step):
-        for x in range(0, w, hatch_step):
-            if smooth[y, x] < 180:
-                # 45° diagonal
-                if y + hatch_step < h and x + hatch_step < w:
-                    cv2.line(hatching, (x, y), (x + hatch_step, y + hatch_step), 0, 1)
-                # 135° diagonal
-                if y + hatch_step < h and x - hatch_step >= 0:
-                    cv2.line(hatching, (x, y), (x - hatch_step, y + hatch_step), 0, 1)
+    hatching = cross_hatching(smooth, step=6, threshold=180)
 
     # --- combine edges, halftone, and hatching ---
     manga_final = cv2.bitwise_and(edges_inv, halftone)
@@ -52,7 +46,23 @@ def convert_to_manga(input_path: str, output_path: str) -> None:
     # --- optional posterization ---
     manga_final = (manga_final // 32) * 32
 
-    cv2.imwrite(output_path, manga_final)
+    return manga_final
+
+
+# -------------------------------------------------------------------
+# TEMPORARY COMPATIBILITY LAYER (DO NOT REMOVE YET)
+# -------------------------------------------------------------------
+
+def convert_to_manga(input_path: str, output_path: str) -> None:
+    """
+    Compatibility wrapper around convert_to_manga_from_array
+    for path-based callers.
+    """
+    img = cv2.imread(input_path)
+    if img is None:
+        raise ValueError("Failed to read input image")
+
+    cv2.imwrite(output_path, convert_to_manga_from_array(img))
 
     if os.path.exists(input_path):
         try:
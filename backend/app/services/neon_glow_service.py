@@ -1,9 +1,69 @@
 # backend/app/services/neon_glow_service.py
 
-from PIL import Image, ImageFilter, ImageChops
+import math
+
 import numpy as np
 import cv2
 
+from app.utils.image_io import InputSpec, ensure_bgr, pixel_budget
+
+# Full resolution, color
+INPUT_SPEC = InputSpec(max_pixels=pixel_budget("neon_glow"))
+
+# Vibrant neon colors (in BGR format)
+NEON_COLORS = {
+    # Red hues (0-15, 165-180)
+    'red': (0, 0, 255),
+    # Orange hues (15-30)
+    'orange': (0, 165, 255),
+    # Yellow hues (30-45)
+    'yellow': (0, 255, 255),
+    # Green hues (45-90)
+    'green': (0, 255, 0),
+    # Cyan hues (90-110)
+    'cyan': (255, 255, 0),
+    # Blue hues (110-150)
+    'blue': (255, 0, 0),
+    # Magenta/Pink hues (150-180)
+    'pink': (255, 0, 255),
+}
+
+# Gaussian glow layers (standard deviations, in pixels) stacked on top
+# of the sharp neon strokes
+GLOW_SIGMAS = (8, 15, 25, 35)
+
+# Smallest blur (in pixels of a pyramid level) applied at that level;
+# below this a coarser level would alias
+_MIN_LEVEL_SIGMA = 1.25
+
+
+def _neon_name_for_hue(h: int) -> str:
+    """
+    Buckets an OpenCV hue (0-179) into one of the NEON_COLORS names.
+    """
+    if h < 15 or h > 165:
+        return 'red'
+    elif h < 30:
+        return 'orange'
+    elif h < 45:
+        return 'yellow'
+    elif h < 90:
+        return 'green'
+    elif h < 110:
+        return 'cyan'
+    elif h < 150:
+        return 'blue'
+    else:
+        return 'pink'
+
+
+# Hue -> neon BGR lookup table, one row per OpenCV hue value (0-179)
+_NEON_HUE_LUT = np.array(
+    [NEON_COLORS[_neon_name_for_hue(h)] for h in range(180)],
+    dtype=np.uint8
+)
+
+
 def get_vibrant_neon_color(bgr_color):
     """
     Maps an original BGR color to a vibrant neon equivalent.
@@ -18,61 +78,119 @@ def get_vibrant_neon_color(bgr_color):
     
     # Convert BGR to HSV for better color understanding
     color_array = np.uint8([[[b, g, r]]])
-    hsv = cv2.cvtColor(color_array, cv2.COLOR_BGR2HSV)[0, 0]
-    h, s, v = hsv
-    
-    # Map hue ranges to vibrant neon colors (in BGR format)
-    neon_colors = {
-        # Red hues (0-15, 165-180)
-        'red': (0, 0, 255),
-        # Orange hues (15-30)
-        'orange': (0, 165, 255),
-        # Yellow hues (30-45)
-        'yellow': (0, 255, 255),
-        # Green hues (45-90)
-        'green': (0, 255, 0),
-        # Cyan hues (90-110)
-        'cyan': (255, 255, 0),
-        # Blue hues (110-150)
-        'blue': (255, 0, 0),
-        # Magenta/Pink hues (150-180)
-        'pink': (255, 0, 255),
-    }
+    h = cv2.cvtColor(color_array, cv2.COLOR_BGR2HSV)[0, 0, 0]
     
-    # Determine which neon color based on hue
-    if h < 15 or h > 165:
-        return neon_colors['red']
-    elif h < 30:
-        return neon_colors['orange']
-    elif h < 45:
-        return neon_colors['yellow']
-    elif h < 90:
-        return neon_colors['green']
-    elif h < 110:
-        return neon_colors['cyan']
-    elif h < 150:
-        return neon_colors['blue']
-    else:
-        return neon_colors['pink']
+    return NEON_COLORS[_neon_name_for_hue(int(h))]
 
 
-def convert_to_neon_glow(input_path: str, output_path: str, use_color_mapping=True) -> None:
+def map_neon_colors(img: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Whole-array version of get_vibrant_neon_color.
+
+    Converts the image to HSV once and looks up the neon color of
+    every selected pixel in a precomputed hue table.
+
+    Args:
+        img: Original image in BGR format
+        mask: Boolean mask of the pixels to map
+
+    Returns:
+        (N, 3) array of BGR neon colors, in mask order
+    """
+    hue = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)[:, :, 0]
+    return _NEON_HUE_LUT[hue[mask]]
+
+
+def _level_variance(level: int) -> float:
+    """
+    Blur variance (in full-resolution pixels^2) added by `level`
+    pyrDown steps; pyrUp back to full resolution adds the same.
+    Each step's 5-tap kernel has variance 1 in that level's pixels.
+    """
+    return (4 ** level - 1) / 3.0
+
+
+def _glow_level(sigma: float) -> int:
+    """
+    Coarsest pyramid level where a blur of `sigma` (full-resolution
+    pixels) still leaves at least _MIN_LEVEL_SIGMA to apply there.
+    """
+    level = 0
+    while True:
+        nxt = level + 1
+        residual = sigma ** 2 - 2 * _level_variance(nxt)
+        if residual <= 0 or math.sqrt(residual) / 2 ** nxt < _MIN_LEVEL_SIGMA:
+            return level
+        level = nxt
+
+
+def pyramid_glow(layer: np.ndarray, sigmas=GLOW_SIGMAS) -> np.ndarray:
     """
-    Converts an image to a realistic neon glow sign effect with vibrant, 
-    multi-colored neon tubes based on original image colors.
+    Sum of Gaussian blurs of `layer` at several sigmas, saturated to
+    uint8 (what chained ImageChops.add of PIL GaussianBlur layers gives).
+
+    Wide blurs are computed on a downsampled pyramid: the layer is
+    pyrDown-ed once per level and every sigma is applied at the
+    coarsest level that can represent it, with the blur already
+    contributed by the down/up sampling subtracted. Glows are then
+    accumulated coarse to fine, so each pyrUp carries every wider glow
+    at once, and only the final sum is upsampled to full size.
+
+    Like PIL's box passes, every stage replicates its own borders.
+
+    Args:
+        layer: uint8 image (any number of channels)
+        sigmas: Gaussian standard deviations in full-resolution pixels
+
+    Returns:
+        uint8 glow image, same shape as layer
+    """
+    levels = {sigma: _glow_level(sigma) for sigma in sigmas}
+    depth = max(levels.values())
+
+    # Level 0 is the only full-size level and stays uint8; the rest
+    # are small, so keep them in float32 for precision
+    pyramid = [layer]
+    for _ in range(depth):
+        down = cv2.pyrDown(pyramid[-1], borderType=cv2.BORDER_REPLICATE)
+        pyramid.append(down.astype(np.float32))
+
+    glow = None
+    for level in range(depth, -1, -1):
+        if glow is not None:
+            h, w = pyramid[level].shape[:2]
+            if level == 0:
+                # Saturate before the full-size upsample so it runs on
+                # uint8, like the final composite
+                glow = np.clip(glow, 0, 255).astype(np.uint8)
+            # pyrUp only supports the default (reflected) border
+            glow = cv2.pyrUp(glow, dstsize=(w, h))
+
+        for sigma, at in levels.items():
+            if at != level:
+                continue
+            residual = math.sqrt(max(sigma ** 2 - 2 * _level_variance(level), 0.0)) / 2 ** level
+            blurred = cv2.GaussianBlur(
+                pyramid[level], (0, 0), residual, borderType=cv2.BORDER_REPLICATE
+            )
+            glow = blurred if glow is None else cv2.add(glow, blurred.astype(glow.dtype))
+
+    return np.clip(glow, 0, 255).astype(np.uint8)
+
+
+def convert_to_neon_glow_from_array(img: np.ndarray, use_color_mapping=True) -> np.ndarray:
+    """
+    Converts an image array (BGR) to a realistic neon glow sign effect with
+    vibrant, multi-colored neon tubes based on original image colors.
     
     Args:
-        input_path: Path to the input image
-        output_path: Path to save the neon glow result
+        img: Input image in BGR format
         use_color_mapping: If True, map colors to vibrant neon equivalents
+        
+    Returns:
+        Neon glow image in BGR format
     """
-    # --- Read image ---
-    img = cv2.imread(input_path)
-    if img is None:
-        raise ValueError(f"Cannot read image at {input_path}")
-    
-    if img.size == 0:
-        raise ValueError("Image is empty or corrupted")
+    img = ensure_bgr(img)
     
     # --- Step 1: Convert to grayscale for edge detection ---
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -89,40 +207,41 @@ def convert_to_neon_glow(input_path: str, output_path: str, use_color_mapping=Tr
     
     # --- Step 5: Create dark background ---
     h, w = img.shape[:2]
-    dark_bg = np.zeros((h, w, 3), dtype=np.uint8)
+    neon_layer = np.zeros((h, w, 3), dtype=np.uint8)
     
     # --- Step 6: Create color-mapped neon layer ---
-    neon_layer = dark_bg.copy()
+    edge_mask = edges_thick != 0
     
     if use_color_mapping:
-        # Map each edge pixel to a vibrant neon color based on nearby original color
-        edge_indices = np.where(edges_thick != 0)
-        for y, x in zip(edge_indices[0], edge_indices[1]):
-            # Get original color near this edge
-            original_color = img[y, x]
-            # Map to vibrant neon color
-            neon_color = get_vibrant_neon_color(original_color)
-            neon_layer[y, x] = neon_color
+        # Map each edge pixel to a vibrant neon color based on its original color
+        neon_layer[edge_mask] = map_neon_colors(img, edge_mask)
     else:
         # Fallback to single cyan color
-        neon_layer[edges_thick != 0] = (255, 255, 0)
-    
-    # --- Step 7: Create intense glow layers ---
-    neon_pil = Image.fromarray(cv2.cvtColor(neon_layer, cv2.COLOR_BGR2RGB))
+        neon_layer[edge_mask] = (255, 255, 0)
     
-    # Multiple glow layers for intense neon effect
-    glow_intense = neon_pil.filter(ImageFilter.GaussianBlur(radius=8))
-    glow_medium = neon_pil.filter(ImageFilter.GaussianBlur(radius=15))
-    glow_soft = neon_pil.filter(ImageFilter.GaussianBlur(radius=25))
+    # --- Step 7: Glow layers (built on an image pyramid) + sharp strokes ---
+    glow = pyramid_glow(neon_layer, GLOW_SIGMAS)
     
-    # Combine glow layers
-    result = ImageChops.add(glow_intense, glow_medium)
-    result = ImageChops.add(result, glow_soft)
-    result = ImageChops.add(result, neon_pil)  # Add sharp neon strokes
+    return cv2.add(glow, neon_layer)
+
+
+# -------------------------------------------------------------------
+# TEMPORARY COMPATIBILITY LAYER (DO NOT REMOVE YET)
+# -------------------------------------------------------------------
+
+def convert_to_neon_glow(input_path: str, output_path: str, use_color_mapping=True) -> None:
+    """
+    Compatibility wrapper around convert_to_neon_glow_from_array
+    for path-based callers.
     
-    # --- Step 8: Add extra glow for intensity ---
-    extra_glow = neon_pil.filter(ImageFilter.GaussianBlur(radius=35))
-    result = ImageChops.add(result, extra_glow)
+    Args:
+        input_path: Path to the input image
+        output_path: Path to save the neon glow result
+        use_color_mapping: If True, map colors to vibrant neon equivalents
+    """
+    img = cv2.imread(input_path)
+    if img is None:
+        raise ValueError(f"Cannot read image at {input_path}")
     
-    # --- Step 9: Save result ---
-    result.save(output_path, format="PNG")
+    result = convert_to_neon_glow_from_array(img, use_color_mapping=use_color_mapping)
+    cv2.imwrite(output_path, result)
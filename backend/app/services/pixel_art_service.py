@@ -2,12 +2,17 @@ import numpy as np
 from PIL import Image
 from typing import Dict
 
+from app.utils.image_io import InputSpec, pixel_budget
+
 # -------------------------------------------------------------------
 # Configuration
 # -------------------------------------------------------------------
 
 VALID_PIXEL_STYLES = ["8bit", "16bit", "modern", "mosaic"]
 
+# Output keeps the input size, so the full resolution is needed
+INPUT_SPEC = InputSpec(max_pixels=pixel_budget("pixel_art"))
+
 # Style presets (tuned for visual quality)
 STYLE_PRESETS: Dict[str, Dict] = {
     "8bit": {
@@ -4,18 +4,33 @@ import cv2
 import numpy as np
 import os
 
-def convert_to_popart(input_path: str, output_path: str) -> None:
+from app.utils.image_io import InputSpec, PREVIEW_MAX_SIZE, ensure_bgr, pixel_budget
+
+# Longest side of each panel
+PANEL_SIZE = 512
+
+# Panels are resized to PANEL_SIZE: larger images need not be decoded
+# at full size, and cost little memory (~6 MB per megapixel)
+INPUT_SPEC = InputSpec(max_size=PANEL_SIZE, max_pixels=pixel_budget("popart", 80))
+
+def convert_to_popart_from_array(img: np.ndarray, preview: bool = False) -> np.ndarray:
     """
-    Converts an input image to Pop Art / Warhol style.
+    Converts an image array (BGR) to Pop Art / Warhol style.
     Posterized colors, high contrast, optional repeated panels.
+
+    Args:
+        img (np.ndarray): Input image in BGR format
+        preview (bool): Panels at PREVIEW_MAX_SIZE instead of PANEL_SIZE
+
+    Returns:
+        np.ndarray: 2x2 pop art canvas in BGR format
     """
-    img = cv2.imread(input_path)
-    if img is None:
-        raise ValueError("Failed to read input image")
+    img = ensure_bgr(img)
 
     # Resize to a manageable size for processing
     h, w = img.shape[:2]
-    scale = 512 / max(h, w)
+    panel_size = min(PANEL_SIZE, PREVIEW_MAX_SIZE) if preview else PANEL_SIZE
+    scale = panel_size / max(h, w)
     img = cv2.resize(img, (int(w * scale), int(h * scale)))
 
     # Posterize colors: reduce to 4–6 levels per channel
@@ -39,7 +54,23 @@ def convert_to_popart(input_path: str, output_path: str) -> None:
     canvas[h:2*h, 0:w] = cv2.applyColorMap(img_contrast, cv2.COLORMAP_OCEAN)
     canvas[h:2*h, w:2*w] = cv2.applyColorMap(img_contrast, cv2.COLORMAP_PINK)
 
-    cv2.imwrite(output_path, canvas)
+    return canvas
+
+
+# -------------------------------------------------------------------
+# TEMPORARY COMPATIBILITY LAYER (DO NOT REMOVE YET)
+# -------------------------------------------------------------------
+
+def convert_to_popart(input_path: str, output_path: str) -> None:
+    """
+    Compatibility wrapper around convert_to_popart_from_array
+    for path-based callers.
+    """
+    img = cv2.imread(input_path)
+    if img is None:
+        raise ValueError("Failed to read input image")
+
+    cv2.imwrite(output_path, convert_to_popart_from_array(img))
 
     # Clean up temp input
     if os.path.exists(input_path):
@@ -1,17 +1,116 @@
 # backend/app/services/sticker_service.py
 
-from rembg import remove
-from PIL import Image
-import io
 import os
 from pathlib import Path
 
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.ml.onnx_backend import ORT_INTRA_OP_THREADS, OrtModel
+from app.ml.registry import model_registry
+from app.utils.image_io import InputSpec, pixel_budget
+
 # Resolve bundled model path
 BASE_DIR = Path(__file__).resolve().parents[2]
 MODEL_PATH = BASE_DIR / "models" / "u2net.onnx"
 
-# Ensure rembg sees the model path
-os.environ["RMBG_MODEL"] = str(MODEL_PATH)
+MODEL_NAME = "u2net"
+
+# ONNX Runtime intra-op threads for U²-Net (0 = let ORT decide)
+INTRA_OP_THREADS = int(os.environ.get("STICKER_INTRA_OP_THREADS", str(ORT_INTRA_OP_THREADS)))
+
+# U²-Net input size and ImageNet normalization (same as rembg's u2net session)
+INPUT_SIZE = 320
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# The mask is predicted at INPUT_SIZE but cut out of the full-resolution
+# image, with its alpha channel
+INPUT_SPEC = InputSpec(max_pixels=pixel_budget("sticker"))
+
+
+def _load_session() -> OrtModel:
+    if not MODEL_PATH.exists():
+        raise FileNotFoundError(f"Sticker model not found: {MODEL_PATH}")
+    return OrtModel(MODEL_PATH, intra_op_threads=INTRA_OP_THREADS)
+
+
+def _warmup_session(model: OrtModel) -> None:
+    sample = np.zeros((1, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+    model.session.run(None, {model.input_name: sample})
+
+
+# One long-lived session, loaded (and warmed up) at startup
+model_registry.register(MODEL_NAME, _load_session, warmup=_warmup_session)
+
+
+def _resize(img: np.ndarray, width: int, height: int) -> np.ndarray:
+    # Close to rembg's PIL Lanczos resize at any scale: OpenCV's LANCZOS4
+    # does not antialias when shrinking, so shrunk axes use INTER_AREA
+    h, w = img.shape[:2]
+    if (w > width) == (h > height):
+        interpolation = cv2.INTER_AREA if w > width else cv2.INTER_LANCZOS4
+        return cv2.resize(img, (width, height), interpolation=interpolation)
+
+    # One axis shrinks, the other grows: one pass each
+    img = cv2.resize(img, (width, h), interpolation=cv2.INTER_AREA if w > width else cv2.INTER_LANCZOS4)
+    return cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA if h > height else cv2.INTER_LANCZOS4)
+
+
+def predict_mask(rgb: np.ndarray) -> np.ndarray:
+    """
+    Foreground mask of an RGB image from U²-Net.
+
+    Args:
+        rgb: uint8 image, RGB channel order
+
+    Returns:
+        uint8 mask (255 = foreground), same height/width as rgb
+    """
+    h, w = rgb.shape[:2]
+    model = model_registry.get(MODEL_NAME)
+
+    small = _resize(rgb, INPUT_SIZE, INPUT_SIZE)
+    x = small.astype(np.float32) / max(float(small.max()), 1e-6)
+    x = (x - MEAN) / STD
+    x = x.transpose(2, 0, 1)[None]
+
+    pred = model.session.run(None, {model.input_name: x})[0][0, 0]
+
+    lo, hi = float(pred.min()), float(pred.max())
+    pred = (pred - lo) / max(hi - lo, 1e-6)
+
+    mask = (pred.clip(0, 1) * 255).astype(np.uint8)
+    return _resize(mask, w, h)
+
+
+def remove_background(img: np.ndarray) -> np.ndarray:
+    """
+    Cuts the foreground out of an RGB or RGBA image.
+
+    Every channel (alpha included) is scaled by the mask, the same
+    composite over a transparent background rembg produces.
+
+    Args:
+        img: uint8 image, RGB or RGBA channel order
+
+    Returns:
+        uint8 RGBA image with a transparent background
+    """
+    if img is None or img.ndim != 3 or img.shape[2] not in (3, 4):
+        raise ValueError("Invalid input image")
+
+    rgb = img[:, :, :3]
+    if img.shape[2] == 4:
+        rgba = img
+    else:
+        rgba = cv2.cvtColor(img, cv2.COLOR_RGB2RGBA)
+
+    mask = predict_mask(rgb)
+    mask_4ch = cv2.merge([mask, mask, mask, mask])
+    return cv2.multiply(rgba, mask_4ch, scale=1.0 / 255.0)
+
 
 def convert_to_sticker(pil_img: Image.Image) -> Image.Image:
     """
@@ -19,18 +118,7 @@ def convert_to_sticker(pil_img: Image.Image) -> Image.Image:
     Uses bundled U²-Net model.
     Returns RGBA image with transparent background.
     """
-
-    if pil_img.mode != "RGBA":
+    if pil_img.mode not in ("RGB", "RGBA"):
         pil_img = pil_img.convert("RGBA")
 
-    # Convert PIL image to bytes
-    buffer = io.BytesIO()
-    pil_img.save(buffer, format="PNG")
-    buffer.seek(0)
-
-    # Background removal
-    result_bytes = remove(buffer.read())
-
-    # Convert result back to PIL Image
-    result_img = Image.open(io.BytesIO(result_bytes)).convert("RGBA")
-    return result_img
+    return Image.fromarray(remove_background(np.asarray(pil_img)))
@@ -6,10 +6,15 @@ from pathlib import Path
 from PIL import Image
 import numpy as np
 import cv2
+import os
 
 from torchvision import transforms
 
 from app.ml.transformer_net import TransformerNet
+from app.ml.tiling import freeze_instance_norm, run_tiled
+from app.ml.onnx_backend import OrtModel, backend_for, ensure_onnx
+from app.ml.registry import model_registry
+from app.utils.image_io import InputSpec, PREVIEW_MAX_SIZE, pixel_budget
 
 # -------------------------------------------------------------------
 # Configuration
@@ -17,6 +22,10 @@ from app.ml.transformer_net import TransformerNet
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 MODEL_DIR = BASE_DIR / "models" / "instance_norm"
+ONNX_DIR = BASE_DIR / "models" / "onnx"
+
+# "torch" or "onnx" (falls back to INFERENCE_BACKEND)
+BACKEND = backend_for("STYLE_BACKEND")
 
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -30,20 +39,25 @@ STYLE_MAX_SIZE = {
     "udnie": 640,
 }
 
-# Cache for loaded models
-_loaded_models: dict[str, nn.Module] = {}
+# Tiled full-resolution mode (opt-in per request)
+TILE_SIZE = int(os.environ.get("STYLE_TILE_SIZE", "512"))
+TILE_OVERLAP = int(os.environ.get("STYLE_TILE_OVERLAP", "128"))
+TILE_WORKERS = int(os.environ.get("STYLE_TILE_WORKERS", "2"))
+# Longest side processed in tiled mode; larger uploads are downscaled to it
+TILED_MAX_SIZE = int(os.environ.get("STYLE_TILED_MAX_SIZE", "6144"))
+
+# Decode no larger than the biggest working size (regular / tiled mode)
+INPUT_SPEC = InputSpec(
+    max_size=max(STYLE_MAX_SIZE.values()),
+    max_pixels=pixel_budget("style_transfer")
+)
+TILED_INPUT_SPEC = InputSpec(max_size=TILED_MAX_SIZE, max_pixels=INPUT_SPEC.max_pixels)
 
 # -------------------------------------------------------------------
-# Model loader (cached, InstanceNorm-safe)
+# Model loader (InstanceNorm-safe, cached by the model registry)
 # -------------------------------------------------------------------
 
-def load_style_model(style_name: str) -> nn.Module:
-    if style_name not in VALID_STYLES:
-        raise ValueError(f"Invalid style '{style_name}'")
-
-    if style_name in _loaded_models:
-        return _loaded_models[style_name]
-
+def _load_torch_model(style_name: str) -> nn.Module:
     model_path = MODEL_DIR / f"{style_name}.pth"
     if not model_path.exists():
         raise FileNotFoundError(f"Style model not found: {model_path}")
@@ -64,10 +78,62 @@ def load_style_model(style_name: str) -> nn.Module:
 
     model.load_state_dict(clean_state_dict, strict=False)
     model.eval()
-
-    _loaded_models[style_name] = model
     return model
 
+def _load_onnx_model(style_name: str) -> OrtModel:
+    onnx_path = ensure_onnx(
+        load_style_model(style_name),
+        torch.zeros(1, 3, 256, 256),
+        ONNX_DIR / f"{style_name}.onnx",
+        source_path=MODEL_DIR / f"{style_name}.pth",
+        dynamic_spatial=True
+    )
+    return OrtModel(onnx_path)
+
+def _warmup(style_name: str):
+    size = STYLE_MAX_SIZE.get(style_name, 512)
+
+    def warmup(model) -> None:
+        with torch.no_grad():
+            model(torch.zeros(1, 3, size, size, device=DEVICE))
+    return warmup
+
+for _style in VALID_STYLES:
+    # The torch model is always needed (tiled mode, ONNX export);
+    # only the backend actually serving requests is warmed up.
+    model_registry.register(
+        f"style:{_style}",
+        lambda name=_style: _load_torch_model(name),
+        warmup=_warmup(_style) if BACKEND == "torch" else None
+    )
+    if BACKEND == "onnx":
+        model_registry.register(
+            f"style-onnx:{_style}",
+            lambda name=_style: _load_onnx_model(name),
+            warmup=_warmup(_style)
+        )
+
+def load_style_model(style_name: str) -> nn.Module:
+    if style_name not in VALID_STYLES:
+        raise ValueError(f"Invalid style '{style_name}'")
+
+    return model_registry.get(f"style:{style_name}")
+
+
+def load_style_runner(style_name: str):
+    """
+    Callable that runs the style network on a (N, 3, H, W) tensor,
+    using the configured backend. ONNX models are exported from the
+    .pth weights on first use.
+    """
+    if BACKEND == "torch":
+        return load_style_model(style_name)
+
+    if style_name not in VALID_STYLES:
+        raise ValueError(f"Invalid style '{style_name}'")
+
+    return model_registry.get(f"style-onnx:{style_name}")
+
 # -------------------------------------------------------------------
 # Image preprocessing
 # -------------------------------------------------------------------
@@ -124,35 +190,78 @@ def smooth_image(pil_img: Image.Image) -> Image.Image:
     img = cv2.bilateralFilter(img, d=9, sigmaColor=75, sigmaSpace=75)
     return Image.fromarray(img)
 
+# -------------------------------------------------------------------
+# Tiled inference
+# -------------------------------------------------------------------
+
+def stylize_tiled(model: nn.Module, pil_img: Image.Image, style_name: str) -> torch.Tensor:
+    """
+    Full-resolution inference over overlapping, feather-blended tiles.
+
+    InstanceNorm statistics are taken from the image at the style's
+    regular working size and frozen, so every tile is normalized the
+    same way and no seams appear between tiles.
+    """
+    stats_img = resize_image(pil_img, STYLE_MAX_SIZE.get(style_name, 512))
+    tiled_model = freeze_instance_norm(model, pil_to_tensor(stats_img))
+
+    return run_tiled(
+        tiled_model,
+        pil_to_tensor(pil_img),
+        tile_size=TILE_SIZE,
+        overlap=TILE_OVERLAP,
+        workers=TILE_WORKERS,
+    )
+
 # -------------------------------------------------------------------
 # Main service function
 # -------------------------------------------------------------------
 
-def convert_style_transfer(pil_img: Image.Image, style_name: str) -> Image.Image:
+def convert_style_transfer(
+    pil_img: Image.Image,
+    style_name: str,
+    tiled: bool = False,
+    preview: bool = False
+) -> Image.Image:
     """
     Apply fast neural style transfer to a PIL image.
     Returns a PIL image.
-    """
-    try:
-        # Style-aware resizing
-        max_size = STYLE_MAX_SIZE.get(style_name, 512)
-        pil_img = resize_image(pil_img, max_size)
-
-        # Load model (cached)
-        model = load_style_model(style_name)
 
-        # Convert to tensor
-        input_tensor = pil_to_tensor(pil_img)
+    With tiled=True the image keeps its full resolution (up to
+    TILED_MAX_SIZE) and is processed tile by tile. Tiled mode always
+    uses PyTorch, since it rewrites the model's InstanceNorm layers.
 
-        # Inference
-        with torch.no_grad():
-            output_tensor = model(input_tensor)
+    With preview=True the network runs at PREVIEW_MAX_SIZE and the
+    smoothing pass is skipped; tiled is ignored.
+    """
+    try:
+        if tiled and not preview:
+            # Load model (cached)
+            model = load_style_model(style_name)
+
+            pil_img = resize_image(pil_img, TILED_MAX_SIZE)
+            output_tensor = stylize_tiled(model, pil_img, style_name)
+        else:
+            # Style-aware resizing
+            max_size = STYLE_MAX_SIZE.get(style_name, 512)
+            if preview:
+                max_size = min(max_size, PREVIEW_MAX_SIZE)
+            pil_img = resize_image(pil_img, max_size)
+
+            # Convert to tensor
+            input_tensor = pil_to_tensor(pil_img)
+
+            # Inference (eager PyTorch or ONNX Runtime)
+            runner = load_style_runner(style_name)
+            with torch.no_grad():
+                output_tensor = runner(input_tensor)
 
         # Convert back to PIL
         output_img = tensor_to_pil(output_tensor)
 
-        # Optional smoothing (recommended)
-        output_img = smooth_image(output_img)
+        # Optional smoothing (recommended, skipped for previews)
+        if not preview:
+            output_img = smooth_image(output_img)
 
         return output_img
 
@@ -0,0 +1,470 @@
+# backend/app/utils/effects.py
+
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from app.services import (
+    cartoon_service,
+    color_sketch_service,
+    comic_art_service,
+    gray_sketch_service,
+    manga_service,
+    neon_glow_service,
+    pixel_art_service,
+    popart_service,
+    sticker_service,
+    style_transfer_service,
+)
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.executor import PoolSaturated, get_pool, run_effect
+from app.utils.encoding import OutputFormat, encode_result
+from app.utils.image_io import FULL_COLOR, InputSpec, cv_to_pil, decode_upload, ensure_gray, pil_to_cv
+from app.utils.result_cache import make_key, result_cache
+from app.utils.shared_array import SharedArray, call_with_shared
+
+
+# Image formats effects take (input_mode) and return (output_mode):
+#   "bgr":  OpenCV array, BGR(A) or GRAY - array inputs accept all three
+#   "gray": OpenCV single-channel array
+#   "rgb":  PIL image, RGB
+#   "rgba": PIL image, RGBA
+#   "pil":  PIL image as decoded (RGB or RGBA; input only)
+INPUT_MODES = ("bgr", "rgb", "pil")
+OUTPUT_MODES = ("bgr", "gray", "rgb", "rgba")
+
+# Cost classes, by time per megapixel on one core: "light" (under
+# ~150 ms), "heavy" (classical filters taking ~0.5 s) and "model"
+# (neural networks, seconds). Weights bound the work of one chain
+COST_WEIGHTS = {"light": 1, "heavy": 2, "model": 4}
+
+
+class DecodedImage:
+    """
+    One decoded upload, or one effect's result, shared by every effect
+    applied to it.
+
+    Color conversions are made at most once, and only when an effect
+    asks for that format; the OpenCV array (BGR(A), or GRAY for gray
+    decodes) is read-only, so no effect can alter what the others see.
+    With share=True it is also placed in shared memory on first use, so
+    process-pool effects read the same pixels instead of each getting
+    a pickled copy; close() releases it.
+
+    Conversions are slow on large images: Effect.apply() makes them in
+    a worker thread, and a lock keeps effects running in parallel from
+    converting (or sharing) twice.
+    """
+
+    def __init__(self, pil_img: Optional[Image.Image] = None, share: bool = False, array: Optional[np.ndarray] = None):
+        if (pil_img is None) == (array is None):
+            raise ValueError("DecodedImage needs either a PIL image or an array")
+        self.share = share
+        self._pil = pil_img
+        self._bgr: Optional[np.ndarray] = None
+        self._rgb: Optional[Image.Image] = None
+        self._shared: Optional[SharedArray] = None
+        self._closed = False
+        self._lock = threading.RLock()
+        if array is not None:
+            self._bgr = array
+            self._bgr.setflags(write=False)
+
+    @classmethod
+    def from_result(cls, result: Union[np.ndarray, Image.Image]) -> "DecodedImage":
+        """
+        Wraps an effect result as the input of the next effect.
+        """
+        if isinstance(result, np.ndarray):
+            return cls(array=result)
+        return cls(result)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        if self._pil is not None:
+            return self._pil.size
+        return self._bgr.shape[1], self._bgr.shape[0]
+
+    @property
+    def pil(self) -> Image.Image:
+        with self._lock:
+            if self._pil is None:
+                self._pil = Image.fromarray(self._bgr) if self._bgr.ndim == 2 else cv_to_pil(self._bgr)
+            return self._pil
+
+    @property
+    def bgr(self) -> np.ndarray:
+        with self._lock:
+            if self._bgr is None:
+                bgr = pil_to_cv(self._pil)
+                bgr.setflags(write=False)
+                self._bgr = bgr
+            return self._bgr
+
+    @property
+    def gray(self) -> np.ndarray:
+        # Straight from the decoded image: no BGR copy in between
+        if self._bgr is not None or self._pil.mode == "L":
+            return self.bgr if self.bgr.ndim == 2 else ensure_gray(self.bgr)
+        return np.asarray(self._pil.convert("L"))
+
+    @property
+    def rgb(self) -> Image.Image:
+        with self._lock:
+            if self._rgb is None:
+                pil_img = self.pil
+                self._rgb = pil_img if pil_img.mode == "RGB" else pil_img.convert("RGB")
+            return self._rgb
+
+    @property
+    def shared(self) -> SharedArray:
+        with self._lock:
+            if self._closed:
+                # A cancelled effect's conversion finishing late
+                raise RuntimeError("DecodedImage is closed")
+            if self._shared is None:
+                self._shared = SharedArray(self.bgr)
+            return self._shared
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            if self._shared is not None:
+                self._shared.close()
+                self._shared = None
+
+
+class Effect:
+    """
+    How to run one effect on an uploaded image, for endpoints that are
+    not tied to a single effect (batch, fan-out, chain).
+
+    Args:
+        name: Effect name, also its worker pool and cache namespace
+        fn: Service function
+        input_mode: Format fn takes: "bgr", "rgb" or "pil" (see
+            INPUT_MODES)
+        output_mode: Format fn returns: "bgr", "gray", "rgb" or "rgba"
+            (see OUTPUT_MODES)
+        cost: Cost class: "light", "heavy" or "model" (see COST_WEIGHTS)
+        styles: Valid styles, passed as the second argument to fn;
+            None if the effect takes no style
+        params: Extra keyword arguments for fn, also part of the cache key
+        preview_params: Extra keyword arguments for fn in preview mode
+            (e.g. to skip optional post-processing)
+        input_spec: Size and color mode to decode at (the service's
+            INPUT_SPEC)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        input_mode: str = "bgr",
+        output_mode: str = "bgr",
+        cost: str = "light",
+        styles: Optional[List[str]] = None,
+        params: Optional[Dict] = None,
+        preview_params: Optional[Dict] = None,
+        input_spec: InputSpec = FULL_COLOR
+    ):
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Invalid input mode '{input_mode}' for effect '{name}'")
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Invalid output mode '{output_mode}' for effect '{name}'")
+        if cost not in COST_WEIGHTS:
+            raise ValueError(f"Invalid cost class '{cost}' for effect '{name}'")
+
+        self.name = name
+        self.fn = fn
+        self.input_mode = input_mode
+        self.output_mode = output_mode
+        self.cost = cost
+        self.styles = styles
+        self.params = params or {}
+        self.preview_params = preview_params or {}
+        self.input_spec = input_spec
+
+    def check_style(self, style: Optional[str]) -> Optional[str]:
+        if self.styles is None:
+            return None
+        if style is None:
+            raise ValueError(f"Effect '{self.name}' requires a style: {', '.join(self.styles)}")
+        style = style.lower()
+        if style not in self.styles:
+            raise ValueError(f"Invalid {self.name} style '{style}'")
+        return style
+
+    def cache_key(
+        self,
+        contents: Union[bytes, "hashlib._Hash"],
+        style: Optional[str] = None,
+        preview: bool = False,
+        output: Optional[OutputFormat] = None
+    ) -> str:
+        # Same keys as the effect's own router, so both share results.
+        # contents: input bytes, or their sha256 (see make_key)
+        params = {**self.params, **(output or OutputFormat()).cache_params()}
+        if self.styles is None:
+            return make_key(self.name, contents, preview=preview, **params)
+        return make_key(self.name, contents, style=style, preview=preview, **params)
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "styles": self.styles,
+            "input": self.input_mode,
+            "output": self.output_mode,
+            "gray_input": self.input_spec.gray,
+            "max_size": self.input_spec.max_size,
+            "max_megapixels": self.input_spec.max_pixels / 1e6,
+            "cost": self.cost,
+            "pool": get_pool(self.name).kind,
+        }
+
+    async def apply(
+        self,
+        image,
+        style: Optional[str] = None,
+        preview: bool = False
+    ) -> Union[np.ndarray, Image.Image]:
+        """
+        Runs the effect in its worker pool and returns its result, in
+        output_mode format.
+
+        Args:
+            image: PIL image, or a DecodedImage shared with other effects
+                (already shrunk by the caller in preview mode)
+            style: Style, for effects that take one
+            preview: Use the preview settings
+        """
+        if not isinstance(image, DecodedImage):
+            image = DecodedImage(image)
+
+        extra = [style] if self.styles is not None else []
+        params = {**self.params, **self.preview_params} if preview else self.params
+
+        shared = self.input_mode == "bgr" and image.share and get_pool(self.name).kind == "process"
+        arg = await run_in_threadpool(self._input, image, shared)
+        if shared:
+            return await run_effect(self.name, call_with_shared, self.fn, arg, *extra, **params)
+        return await run_effect(self.name, self.fn, arg, *extra, **params)
+
+    def _input(self, image: DecodedImage, shared: bool):
+        # The argument fn takes, converted (or placed in shared memory)
+        # in a worker thread
+        if shared:
+            return image.shared.handle
+        if self.input_mode == "bgr":
+            return image.gray if self.input_spec.gray else image.bgr
+        return image.rgb if self.input_mode == "rgb" else image.pil
+
+    async def run(
+        self,
+        image,
+        style: Optional[str] = None,
+        preview: bool = False,
+        output: Optional[OutputFormat] = None
+    ) -> bytes:
+        """
+        Runs the effect (see apply) and returns the encoded bytes.
+        With preview=True the fastest encoding is used; output is the
+        output format (default: PNG).
+        """
+        result = await self.apply(image, style, preview)
+        return await encode_result(self.name, result, output or OutputFormat(), preview)
+
+
+EFFECTS: Dict[str, Effect] = {
+    effect.name: effect
+    for effect in [
+        Effect(
+            "gray_sketch",
+            gray_sketch_service.convert_to_gray_sketch,
+            output_mode="gray",
+            input_spec=gray_sketch_service.INPUT_SPEC
+        ),
+        Effect(
+            "color_sketch",
+            color_sketch_service.convert_to_color_sketch_from_array,
+            cost="heavy",
+            input_spec=color_sketch_service.INPUT_SPEC
+        ),
+        Effect(
+            "cartoon",
+            cartoon_service.convert_to_cartoon_from_array,
+            cost="model",
+            input_spec=cartoon_service.INPUT_SPEC
+        ),
+        Effect(
+            "manga",
+            manga_service.convert_to_manga_from_array,
+            output_mode="gray",
+            input_spec=manga_service.INPUT_SPEC
+        ),
+        Effect(
+            "comic_art",
+            comic_art_service.convert_to_comic_art_from_array,
+            cost="heavy",
+            preview_params={"preview": True},
+            input_spec=comic_art_service.INPUT_SPEC
+        ),
+        Effect(
+            "popart",
+            popart_service.convert_to_popart_from_array,
+            preview_params={"preview": True},
+            input_spec=popart_service.INPUT_SPEC
+        ),
+        Effect(
+            "neon_glow",
+            neon_glow_service.convert_to_neon_glow_from_array,
+            input_spec=neon_glow_service.INPUT_SPEC
+        ),
+        Effect(
+            "sticker",
+            sticker_service.convert_to_sticker,
+            input_mode="pil",
+            output_mode="rgba",
+            cost="model",
+            input_spec=sticker_service.INPUT_SPEC
+        ),
+        Effect(
+            "pixel_art",
+            pixel_art_service.convert_pixel_art,
+            input_mode="rgb",
+            output_mode="rgb",
+            styles=pixel_art_service.VALID_PIXEL_STYLES,
+            input_spec=pixel_art_service.INPUT_SPEC
+        ),
+        Effect(
+            "style_transfer",
+            style_transfer_service.convert_style_transfer,
+            input_mode="rgb",
+            output_mode="rgb",
+            cost="model",
+            styles=style_transfer_service.VALID_STYLES,
+            params={"tiled": False},
+            preview_params={"preview": True},
+            input_spec=style_transfer_service.INPUT_SPEC
+        ),
+    ]
+}
+
+
+def get_effect(name: str) -> Effect:
+    """
+    Looks up an effect by name; accepts the URL spelling too
+    (e.g. "gray-sketch", "pop-art").
+    """
+    key = name.lower().replace("-", "_")
+    key = {"pop_art": "popart"}.get(key, key)
+    if key not in EFFECTS:
+        raise ValueError(f"Unknown effect '{name}'")
+    return EFFECTS[key]
+
+
+# (effect, style, label)
+EffectSpec = Tuple[Effect, Optional[str], str]
+
+
+def parse_effects(spec: str, unique: bool = True, max_effects: Optional[int] = None) -> List[EffectSpec]:
+    """
+    Parses "gray-sketch,cartoon,pixel-art:8bit,style-transfer:candy"
+    into effects with their styles. With unique=True repeated entries
+    are dropped.
+    """
+    parsed: List[EffectSpec] = []
+    seen = set()
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        name, _, style = entry.partition(":")
+        effect = get_effect(name.strip())
+        style = effect.check_style(style.strip() or None)
+
+        label = effect.name if style is None else f"{effect.name}-{style}"
+        if not unique or label not in seen:
+            seen.add(label)
+            parsed.append((effect, style, label))
+
+    if not parsed:
+        raise ValueError("No effects requested")
+    if max_effects is not None and len(parsed) > max_effects:
+        raise ValueError(f"Too many effects (max {max_effects})")
+    return parsed
+
+
+async def run_chain(
+    steps: List[EffectSpec],
+    image: DecodedImage,
+    preview: bool = False
+) -> Union[np.ndarray, Image.Image]:
+    """
+    Applies effects one after the other, each to the previous one's
+    result, and returns the last result. Results stay in memory as
+    arrays or PIL images: nothing is encoded between steps, and a
+    result is converted only when the next effect takes another format
+    (e.g. cartoon's BGR array to RGB for pixel art). Alpha is dropped
+    when an array effect follows sticker. Each step runs in its own
+    worker pool and checks its own pixel budget.
+    """
+    current = image
+    result = None
+    for effect, style, _ in steps:
+        if result is not None:
+            current = DecodedImage.from_result(result)
+            effect.input_spec.check_pixels(current.size)
+        result = await effect.apply(current, style, preview)
+    return result
+
+
+async def render_effect(
+    name: str,
+    contents: bytes,
+    style: Optional[str] = None,
+    preview: bool = False,
+    output: Optional[OutputFormat] = None,
+    saturated_wait: float = 0
+) -> bytes:
+    """
+    Decodes `contents`, applies the effect and returns the encoded
+    result, going through the result cache like the per-effect routers.
+
+    With saturated_wait, a saturated worker pool is retried (with
+    backoff) for up to that many seconds before PoolSaturated is
+    raised. Only the effect is retried: hashing and decoding happen
+    once, in a worker thread.
+    """
+    effect = get_effect(name)
+    style = effect.check_style(style)
+
+    digest = await run_in_threadpool(hashlib.sha256, contents)
+    cache_key = effect.cache_key(digest, style, preview, output)
+    cached = await result_cache.get(effect.name, cache_key)
+    if cached is not None:
+        return cached
+
+    image = await decode_upload(contents, preview=preview, spec=effect.input_spec, effect=effect.name)
+
+    deadline = time.monotonic() + saturated_wait
+    delay = 0.05
+    while True:
+        try:
+            data = await effect.run(image, style, preview, output)
+            break
+        except PoolSaturated:
+            if time.monotonic() >= deadline:
+                raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    await result_cache.put(effect.name, cache_key, data)
+    return data
@@ -0,0 +1,295 @@
+# backend/app/utils/encoding.py
+
+import io
+import os
+import threading
+import time
+from typing import Dict, Optional, Union
+
+import numpy as np
+from fastapi import Header, HTTPException, Query
+from fastapi.responses import Response
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+from app.utils import profiling
+from app.utils.image_io import cv_to_pil
+from app.utils.metrics import Counter, record_stage, register_collector
+from app.utils.result_cache import cached_response
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# name -> (PIL format, media type, file extension)
+FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+MEDIA_TYPES = {media_type: name for name, (_, media_type, _) in FORMATS.items()}
+MEDIA_TYPES["image/jpg"] = "jpeg"
+
+# Format used when neither the query nor the Accept header picks one
+DEFAULT_FORMAT = os.environ.get("OUTPUT_FORMAT", "png")
+
+# Default quality of the lossy formats (1-100)
+JPEG_QUALITY = int(os.environ.get("OUTPUT_JPEG_QUALITY", "90"))
+WEBP_QUALITY = int(os.environ.get("OUTPUT_WEBP_QUALITY", "85"))
+
+# Encoder effort per speed setting. "default" matches Pillow's defaults;
+# previews use "fast" unless the request asks otherwise.
+SPEEDS = ("fast", "default", "small")
+PNG_COMPRESSION = {"fast": 1, "default": 6, "small": 9}
+WEBP_METHOD = {"fast": 0, "default": 4, "small": 6}
+# Optimized Huffman tables cost JPEG a second pass over the data
+JPEG_OPTIMIZE = {"fast": False, "default": False, "small": True}
+
+# Background for alpha images written as JPEG
+JPEG_BACKGROUND = (255, 255, 255)
+
+
+# -------------------------------------------------------------------
+# Output format
+# -------------------------------------------------------------------
+
+class OutputFormat:
+    """
+    Encoding requested for a result: format, quality and speed.
+
+    Args:
+        name: "png", "webp" or "jpeg"
+        quality: 1-100 for webp/jpeg (None = configured default);
+            ignored for png, which is lossless
+        speed: "fast", "default" or "small" (None = "fast" for
+            previews, "default" otherwise)
+    """
+
+    def __init__(self, name: str = DEFAULT_FORMAT, quality: Optional[int] = None, speed: Optional[str] = None):
+        name = name.lower()
+        name = FORMAT_ALIASES.get(name, name)
+        if name not in FORMATS:
+            raise ValueError(f"Unsupported output format '{name}', expected png, webp or jpeg")
+        if speed is not None and speed not in SPEEDS:
+            raise ValueError(f"Invalid speed '{speed}', expected fast, default or small")
+        if quality is not None and not 1 <= quality <= 100:
+            raise ValueError("Quality must be between 1 and 100")
+
+        self.name = name
+        self.quality = quality if name != "png" else None
+        self.speed = speed
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.name][1]
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.name][2]
+
+    def cache_params(self) -> dict:
+        # Part of the result cache key
+        return {"format": self.name, "quality": self.quality, "speed": self.speed}
+
+    def save_options(self, preview: bool = False) -> dict:
+        speed = self.speed or ("fast" if preview else "default")
+        if self.name == "png":
+            return {"compress_level": PNG_COMPRESSION[speed]}
+        if self.name == "webp":
+            return {"quality": self.quality or WEBP_QUALITY, "method": WEBP_METHOD[speed]}
+        return {"quality": self.quality or JPEG_QUALITY, "optimize": JPEG_OPTIMIZE[speed]}
+
+    def __repr__(self) -> str:
+        return f"OutputFormat({self.name!r}, quality={self.quality}, speed={self.speed!r})"
+
+
+def format_from_accept(accept: Optional[str]) -> str:
+    """
+    Picks the output format from an Accept header: the supported type
+    with the highest q value, explicit types before wildcards, then in
+    header order. Anything else (missing header, */*, only unsupported
+    types) gets DEFAULT_FORMAT.
+    """
+    best = None
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, _, params = part.partition(";")
+        media_type = media_type.strip().lower()
+
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        if q <= 0 or media_type not in MEDIA_TYPES:
+            continue
+
+        rank = (q, -position)
+        if best is None or rank > best[0]:
+            best = (rank, MEDIA_TYPES[media_type])
+
+    return best[1] if best else DEFAULT_FORMAT
+
+
+def _output_format(
+    format: Optional[str],
+    quality: Optional[int],
+    speed: Optional[str],
+    accept: Optional[str]
+) -> OutputFormat:
+    try:
+        return OutputFormat(format or format_from_accept(accept), quality, speed)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+
+def output_format(
+    format: Optional[str] = Query(None, description="Output format: png, webp or jpeg (default: from Accept)"),
+    quality: Optional[int] = Query(None, description="Quality for webp/jpeg, 1-100"),
+    speed: Optional[str] = Query(None, description="Encoder effort: fast, default or small"),
+    accept: Optional[str] = Header(None)
+) -> OutputFormat:
+    """
+    Dependency for single-image endpoints: the format comes from the
+    `format` query parameter, or else from the Accept header.
+    """
+    return _output_format(format, quality, speed, accept)
+
+
+def item_format(
+    format: Optional[str] = Query(None, description="Format of each image: png, webp or jpeg"),
+    quality: Optional[int] = Query(None, description="Quality for webp/jpeg, 1-100"),
+    speed: Optional[str] = Query(None, description="Encoder effort: fast, default or small")
+) -> OutputFormat:
+    """
+    Dependency for endpoints returning several images in a zip or
+    multipart body, where Accept describes the container instead.
+    """
+    return _output_format(format, quality, speed, None)
+
+
+# -------------------------------------------------------------------
+# Encoding
+# -------------------------------------------------------------------
+
+def encode_image(
+    img: Union[np.ndarray, Image.Image],
+    output: OutputFormat,
+    preview: bool = False
+) -> bytes:
+    """
+    Encodes an effect result: an OpenCV array (BGR, BGRA or GRAY) or a
+    PIL image. Gray results are written as 8-bit grayscale, a third of
+    the data an RGB copy would be. JPEG has no alpha, so transparent
+    results are flattened onto JPEG_BACKGROUND.
+    """
+    if isinstance(img, np.ndarray):
+        pil_img = Image.fromarray(img) if img.ndim == 2 else cv_to_pil(img)
+    else:
+        pil_img = img
+
+    if output.name == "jpeg" and pil_img.mode not in ("RGB", "L"):
+        rgba = pil_img.convert("RGBA")
+        pil_img = Image.new("RGB", rgba.size, JPEG_BACKGROUND)
+        pil_img.paste(rgba, mask=rgba.getchannel("A"))
+
+    buf = io.BytesIO()
+    pil_img.save(buf, format=FORMATS[output.name][0], **output.save_options(preview))
+    return buf.getvalue()
+
+
+class EncodeStats:
+    """
+    Encode time and output size per effect and format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    def record(self, effect: str, fmt: str, seconds: float, size: int) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(effect, {}).setdefault(
+                fmt, {"count": 0, "seconds": 0.0, "bytes": 0}
+            )
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["bytes"] += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                effect: {
+                    fmt: {
+                        "count": entry["count"],
+                        "total_seconds": round(entry["seconds"], 4),
+                        "mean_ms": round(1000 * entry["seconds"] / entry["count"], 2),
+                        "mean_bytes": round(entry["bytes"] / entry["count"]),
+                    }
+                    for fmt, entry in formats.items()
+                }
+                for effect, formats in self._stats.items()
+            }
+
+
+encode_stats = EncodeStats()
+
+
+def _collect_encode_metrics():
+    with encode_stats._lock:
+        entries = [
+            (effect, fmt, entry["count"], entry["bytes"])
+            for effect, formats in encode_stats._stats.items()
+            for fmt, entry in formats.items()
+        ]
+    encodes = Counter("encodes_total", "Results encoded", ("effect", "format"))
+    output_bytes = Counter("encoded_bytes_total", "Bytes of encoded results", ("effect", "format"))
+    for effect, fmt, count, size in entries:
+        encodes.set(count, effect, fmt)
+        output_bytes.set(size, effect, fmt)
+    return [encodes, output_bytes]
+
+
+register_collector(_collect_encode_metrics)
+
+
+def _timed_encode(img, output: OutputFormat, preview: bool):
+    started = time.perf_counter()
+    data = encode_image(img, output, preview)
+    return data, time.perf_counter() - started
+
+
+async def encode_result(
+    effect: str,
+    img: Union[np.ndarray, Image.Image],
+    output: OutputFormat,
+    preview: bool = False
+) -> bytes:
+    """
+    Encodes an effect result in a worker thread, keeping the event
+    loop free, and records the encode time and size.
+    """
+    (data, seconds), stats = await run_in_threadpool(
+        profiling.call_profiled, profiling.profile_requested(), _timed_encode, img, output, preview
+    )
+    profiling.add_stats(stats)
+    encode_stats.record(effect, output.name, seconds, len(data))
+    record_stage(effect, "encode", seconds)
+    return data
+
+
+def image_response(data: bytes, output: OutputFormat, cached: bool = False) -> Response:
+    """
+    Response carrying an encoded result (or a cache hit).
+    """
+    if cached:
+        response = cached_response(data, output.media_type)
+    else:
+        response = Response(content=data, media_type=output.media_type)
+    # The format may have been negotiated from Accept
+    response.headers["Vary"] = "Accept"
+    return response
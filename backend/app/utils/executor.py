@@ -0,0 +1,200 @@
+# backend/app/utils/executor.py
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.utils import profiling
+from app.utils.metrics import Counter, Gauge, record_stage, register_collector
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# Per-effect pool settings.
+#   kind:    "process" for classical OpenCV/NumPy effects,
+#            "thread" for model-backed effects (models live in-process)
+#   workers: jobs running at the same time
+#   queue:   extra jobs allowed to wait for a worker
+#
+# Every value can be overridden with environment variables, e.g.
+#   EFFECT_MANGA_POOL=thread  EFFECT_MANGA_WORKERS=4  EFFECT_MANGA_QUEUE=16
+EFFECT_POOLS: Dict[str, Dict] = {
+    "gray_sketch":    {"kind": "process", "workers": 2, "queue": 8},
+    "color_sketch":   {"kind": "process", "workers": 2, "queue": 8},
+    "manga":          {"kind": "process", "workers": 2, "queue": 8},
+    "comic_art":      {"kind": "process", "workers": 2, "queue": 8},
+    "popart":         {"kind": "process", "workers": 2, "queue": 8},
+    "neon_glow":      {"kind": "process", "workers": 2, "queue": 8},
+    "pixel_art":      {"kind": "thread",  "workers": 2, "queue": 8},
+    # cartoon workers feed the AnimeGAN micro-batcher, keep >= its batch size
+    "cartoon":        {"kind": "thread",  "workers": 4, "queue": 8},
+    "style_transfer": {"kind": "thread",  "workers": 1, "queue": 4},
+    "sticker":        {"kind": "thread",  "workers": 1, "queue": 4},
+}
+
+# Seconds a rejected client is asked to wait before retrying
+RETRY_AFTER_SECONDS = int(os.environ.get("EFFECT_RETRY_AFTER", "5"))
+
+
+def _pool_setting(effect: str, key: str, default):
+    value = os.environ.get(f"EFFECT_{effect.upper()}_{key.upper()}")
+    if value is None:
+        return default
+    return type(default)(value)
+
+
+# -------------------------------------------------------------------
+# Errors
+# -------------------------------------------------------------------
+
+class PoolSaturated(HTTPException):
+    """
+    Raised when an effect's workers and queue are all taken.
+    FastAPI turns it into a 503 with a Retry-After header.
+    """
+
+    def __init__(self, effect: str, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy processing '{effect}' requests, retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.effect = effect
+
+
+# -------------------------------------------------------------------
+# Bounded per-effect pool
+# -------------------------------------------------------------------
+
+class EffectPool:
+    """
+    A lazily created thread/process pool with a hard cap on
+    running + waiting jobs. Submissions beyond the cap fail fast
+    instead of piling up on the event loop.
+    """
+
+    def __init__(self, effect: str, kind: str, workers: int, queue: int):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Invalid pool kind '{kind}' for effect '{effect}'")
+
+        self.effect = effect
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue = max(0, queue)
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.pending - self.workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: never fork a process that already runs server threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=f"effect-{self.effect}",
+                )
+        return self._executor
+
+    async def submit(self, fn: Callable, *args, **kwargs):
+        # Only touched from the event loop thread, so no lock is needed
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise PoolSaturated(self.effect)
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            submitted = time.time()
+            started, result, stats = await loop.run_in_executor(
+                self._get_executor(),
+                functools.partial(_timed_call, profiling.profile_requested(), fn, *args, **kwargs),
+            )
+            # Wall clock: the worker may be another process
+            finished = time.time()
+            record_stage(self.effect, "queue", max(0.0, started - submitted))
+            record_stage(self.effect, "process", max(0.0, finished - started))
+            profiling.add_stats(stats)
+            return result
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _timed_call(profile: bool, fn: Callable, *args, **kwargs):
+    # Runs in the worker; the start time splits queue wait from work.
+    # In profiled requests fn's profile comes back with its result
+    started = time.time()
+    result, stats = profiling.call_profiled(profile, fn, *args, **kwargs)
+    return started, result, stats
+
+
+_pools: Dict[str, EffectPool] = {}
+
+
+def get_pool(effect: str) -> EffectPool:
+    if effect not in _pools:
+        defaults = EFFECT_POOLS.get(
+            effect, {"kind": "thread", "workers": 1, "queue": 4}
+        )
+        _pools[effect] = EffectPool(
+            effect,
+            kind=_pool_setting(effect, "pool", defaults["kind"]),
+            workers=_pool_setting(effect, "workers", defaults["workers"]),
+            queue=_pool_setting(effect, "queue", defaults["queue"]),
+        )
+    return _pools[effect]
+
+
+async def run_effect(effect: str, fn: Callable, *args, **kwargs):
+    """
+    Runs a CPU-bound service function in the effect's pool.
+    Raises PoolSaturated (503) when the pool's queue is full.
+    """
+    return await get_pool(effect).submit(fn, *args, **kwargs)
+
+
+def _collect_pool_metrics():
+    workers = Gauge("effect_workers", "Worker threads/processes per effect pool", ("effect", "kind"))
+    in_flight = Gauge("effect_in_flight", "Effect jobs running or queued", ("effect",))
+    queue_depth = Gauge("effect_queue_depth", "Effect jobs waiting for a worker", ("effect",))
+    rejected = Counter("effect_rejected_total", "Effect jobs rejected with 503 (pool saturated)", ("effect",))
+    for effect in sorted(set(EFFECT_POOLS) | set(_pools)):
+        pool = get_pool(effect)
+        workers.set(pool.workers, effect, pool.kind)
+        in_flight.set(pool.pending, effect)
+        queue_depth.set(pool.queued, effect)
+        rejected.set(pool.rejected, effect)
+    return [workers, in_flight, queue_depth, rejected]
+
+
+register_collector(_collect_pool_metrics)
+
+
+def shutdown_pools() -> None:
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
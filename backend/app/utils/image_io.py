@@ -1,48 +1,605 @@
 # backend/app/utils/image_io.py
 
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
+import hashlib
 import io
+import math
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Optional, Tuple, Union
 import numpy as np
 import cv2
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.utils import profiling
+from app.utils.metrics import Counter, Gauge, StageTimer, observe_pixels, register_collector
 
 ALLOWED_MIME_TYPES = ["image/jpeg", "image/png", "image/webp"]
 
+# Preview mode: longest side of the working image
+PREVIEW_MAX_SIZE = int(os.environ.get("PREVIEW_MAX_SIZE", "384"))
+
+# Largest accepted image file, and largest request body (batches carry
+# several files or a zip); 0 disables the limit
+MAX_UPLOAD_BYTES = int(float(os.environ.get("UPLOAD_MAX_MB", "50")) * 1024 * 1024)
+MAX_REQUEST_BYTES = int(float(os.environ.get("UPLOAD_MAX_REQUEST_MB", "512")) * 1024 * 1024)
+
+# Uploads are copied in chunks of this size; copies larger than
+# UPLOAD_SPOOL_MB spill to a temporary file instead of staying in memory
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_KB", "256")) * 1024
+UPLOAD_SPOOL_BYTES = int(float(os.environ.get("UPLOAD_SPOOL_MB", "2")) * 1024 * 1024)
+
+# Default pixel budget per image (width x height, read from the header
+# before decoding). Effects declare their own with pixel_budget(), and
+# every budget can be overridden, e.g. EFFECT_MANGA_MAX_MEGAPIXELS=24
+MAX_MEGAPIXELS = float(os.environ.get("UPLOAD_MAX_MEGAPIXELS", "40"))
+
 
-async def read_upload_file(upload_file: UploadFile) -> Image.Image:
+def pixel_budget(effect: str, megapixels: Optional[float] = None) -> int:
     """
-    Reads a FastAPI UploadFile and returns a PIL Image.
-    Preserves alpha if present.
+    Largest image, in pixels, an effect accepts: `megapixels` (default
+    UPLOAD_MAX_MEGAPIXELS) unless EFFECT_<NAME>_MAX_MEGAPIXELS is set.
+    """
+    value = os.environ.get(f"EFFECT_{effect.upper()}_MAX_MEGAPIXELS")
+    if value is None:
+        value = MAX_MEGAPIXELS if megapixels is None else megapixels
+    return int(float(value) * 1_000_000)
+
+
+# -------------------------------------------------------------------
+# Errors
+# -------------------------------------------------------------------
+
+class UploadTooLarge(HTTPException):
+    """
+    Raised when an upload or request body exceeds its byte limit.
+    """
+
+    def __init__(self, limit: int, what: str = "Uploaded file"):
+        super().__init__(
+            status_code=413,
+            detail=f"{what} too large (max {limit / (1024 * 1024):g} MB)"
+        )
+
+
+class ImageTooLarge(HTTPException):
+    """
+    Raised when an image's dimensions exceed the effect's pixel budget,
+    before any pixel is decoded.
+    """
+
+    def __init__(self, size: Tuple[int, int], limit: int):
+        w, h = size
+        super().__init__(
+            status_code=413,
+            detail=f"Image too large: {w}x{h} ({w * h / 1e6:.1f} MP), "
+                   f"max {limit / 1e6:g} MP for this effect"
+        )
+
+
+class InputSpec:
+    """
+    What an effect needs from the decoder. Declared by each service
+    as INPUT_SPEC.
+
+    Args:
+        max_size: Longest side the effect works at (it downsizes larger
+            images itself); None if it needs full resolution
+        gray: The effect only uses luminance
+        max_pixels: Largest image accepted (see pixel_budget());
+            None = UPLOAD_MAX_MEGAPIXELS
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        gray: bool = False,
+        max_pixels: Optional[int] = None
+    ):
+        self.max_size = max_size
+        self.gray = gray
+        self.max_pixels = max_pixels if max_pixels is not None else int(MAX_MEGAPIXELS * 1_000_000)
+
+    def merge(self, other: "InputSpec") -> "InputSpec":
+        """
+        Spec of one decode that can serve both effects. Its pixel budget
+        is the larger one; each effect still checks its own.
+        """
+        if self.max_size is None or other.max_size is None:
+            max_size = None
+        else:
+            max_size = max(self.max_size, other.max_size)
+        return InputSpec(
+            max_size,
+            self.gray and other.gray,
+            max(self.max_pixels, other.max_pixels)
+        )
+
+    def check_pixels(self, size: Tuple[int, int]) -> None:
+        """
+        Raises ImageTooLarge (413) if an image of `size` is over budget.
+        """
+        if size[0] * size[1] > self.max_pixels:
+            raise ImageTooLarge(size, self.max_pixels)
+
+    def __repr__(self) -> str:
+        return (
+            f"InputSpec(max_size={self.max_size}, gray={self.gray}, "
+            f"max_pixels={self.max_pixels})"
+        )
+
+
+# Full resolution, color (alpha preserved)
+FULL_COLOR = InputSpec()
+
+
+# -------------------------------------------------------------------
+# Upload ingestion
+# -------------------------------------------------------------------
+
+class UploadStats:
+    """
+    Upload counters, plus the memory held by requests for their input:
+    upload bytes not spilled to disk and the decoded pixels.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.bytes = 0
+        self.spilled = 0
+        self.rejected = {"bytes": 0, "pixels": 0}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.request_memory = 0
+        self.max_request_memory = 0
+
+    def record_upload(self, size: int, spilled: bool) -> None:
+        with self._lock:
+            self.uploads += 1
+            self.bytes += size
+            self.spilled += int(spilled)
+
+    def record_rejected(self, reason: str) -> None:
+        with self._lock:
+            self.rejected[reason] += 1
+
+    def acquire(self, nbytes: int) -> None:
+        with self._lock:
+            self.in_flight += nbytes
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self, nbytes: int, request_peak: int) -> None:
+        with self._lock:
+            self.in_flight -= nbytes
+            self.requests += 1
+            self.request_memory += request_peak
+            self.max_request_memory = max(self.max_request_memory, request_peak)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "bytes": self.bytes,
+                "spilled_to_disk": self.spilled,
+                "rejected": dict(self.rejected),
+                "in_flight_memory_bytes": self.in_flight,
+                "peak_in_flight_memory_bytes": self.peak_in_flight,
+                "mean_request_memory_bytes": round(self.request_memory / self.requests) if self.requests else 0,
+                "max_request_memory_bytes": self.max_request_memory,
+            }
+
+
+upload_stats = UploadStats()
+
+
+def _collect_upload_metrics():
+    stats = upload_stats.stats()
+    uploads = Counter("uploads_total", "Uploads read")
+    uploads.set(stats["uploads"])
+    upload_bytes = Counter("upload_bytes_total", "Bytes of uploads read")
+    upload_bytes.set(stats["bytes"])
+    spilled = Counter("uploads_spilled_total", "Uploads spilled to disk while read")
+    spilled.set(stats["spilled_to_disk"])
+    rejected = Counter("uploads_rejected_total", "Uploads rejected with 413", ("reason",))
+    for reason, count in stats["rejected"].items():
+        rejected.set(count, reason)
+    memory = Gauge("input_memory_bytes", "Memory held by requests for their input (upload + decode)")
+    memory.set(stats["in_flight_memory_bytes"])
+    return [uploads, upload_bytes, spilled, rejected, memory]
+
+
+register_collector(_collect_upload_metrics)
+
+
+def spool_upload(
+    src: BinaryIO,
+    limit: int = MAX_UPLOAD_BYTES,
+    digest=None
+) -> Tuple[tempfile.SpooledTemporaryFile, int]:
+    """
+    Copies an upload in UPLOAD_CHUNK_BYTES chunks into a file that
+    spills to disk past UPLOAD_SPOOL_BYTES, feeding `digest` (a hashlib
+    object) on the way. Raises UploadTooLarge as soon as the copy
+    passes `limit` bytes (0 = no limit).
+
+    Returns the copy, rewound, and its size.
+    """
+    copy = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    size = 0
+    try:
+        src.seek(0)
+        while True:
+            chunk = src.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if limit and size > limit:
+                upload_stats.record_rejected("bytes")
+                raise UploadTooLarge(limit)
+            if digest is not None:
+                digest.update(chunk)
+            copy.write(chunk)
+    except BaseException:
+        copy.close()
+        raise
+
+    copy.seek(0)
+    upload_stats.record_upload(size, size > UPLOAD_SPOOL_BYTES)
+    return copy, size
+
+
+def _read_header(fp: BinaryIO) -> Image.Image:
+    """
+    Opens an image without decoding it: only the header is parsed, so
+    the size is known before any pixel memory is allocated.
+    """
+    fp.seek(0)
+    try:
+        return Image.open(fp)
+    except UnidentifiedImageError:
+        raise ValueError("Cannot decode image")
+    except Image.DecompressionBombError as e:
+        # Far over any budget: Pillow refuses it while parsing the header
+        upload_stats.record_rejected("pixels")
+        raise HTTPException(status_code=413, detail=f"Image too large: {e}")
+
+
+def _check_pixels(spec: InputSpec, size: Tuple[int, int]) -> None:
+    try:
+        spec.check_pixels(size)
+    except ImageTooLarge:
+        upload_stats.record_rejected("pixels")
+        raise
+
+
+class Upload:
+    """
+    One uploaded image, copied by spool_upload(): in memory when small,
+    on disk otherwise. Its format and size are read from the header at
+    upload time; decode_image_bytes() decodes it.
+
+    The memory it holds (the in-memory copy and every decode) is counted
+    in upload_stats until close().
+    """
+
+    def __init__(self, file: tempfile.SpooledTemporaryFile, size: int, sha256):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+        header = _read_header(file)
+        self.format = header.format
+        self.dimensions: Tuple[int, int] = header.size
+
+        self.memory = 0
+        self.peak_memory = 0
+        if size <= UPLOAD_SPOOL_BYTES:
+            self.track(size)
+
+    def check_pixels(self, spec: InputSpec) -> None:
+        _check_pixels(spec, self.dimensions)
+
+    def open(self) -> Image.Image:
+        self.file.seek(0)
+        return Image.open(self.file)
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def track(self, nbytes: int) -> None:
+        self.memory += nbytes
+        self.peak_memory = max(self.peak_memory, self.memory)
+        upload_stats.acquire(nbytes)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            upload_stats.release(self.memory, self.peak_memory)
+            self.memory = 0
+
+
+def _ingest(src: BinaryIO, spec: Optional[InputSpec]) -> Upload:
+    digest = hashlib.sha256()
+    copy, size = spool_upload(src, MAX_UPLOAD_BYTES, digest)
+    if size == 0:
+        copy.close()
+        raise ValueError("Uploaded file is empty")
+
+    try:
+        upload = Upload(copy, size, digest)
+    except BaseException:
+        copy.close()
+        raise
+
+    if spec is not None:
+        try:
+            upload.check_pixels(spec)
+        except BaseException:
+            upload.close()
+            raise
+    return upload
+
+
+async def read_upload(
+    upload_file: UploadFile,
+    spec: Optional[InputSpec] = None,
+    effect: Optional[str] = None
+) -> Upload:
+    """
+    Validates and copies a FastAPI UploadFile without ever holding it in
+    memory whole. Raises ValueError for unsupported or unreadable files,
+    and a 413 for files over UPLOAD_MAX_MB or, when `spec` is given,
+    images over its pixel budget. The caller must close() the result.
+
+    Its `sha256` (input bytes digest) is what make_key() takes.
+    `effect` labels the "read" stage metrics.
     """
     if upload_file.content_type not in ALLOWED_MIME_TYPES:
         raise ValueError(f"Unsupported file type: {upload_file.content_type}")
 
-    contents = await upload_file.read()
-    if not contents:
-        raise ValueError("Uploaded file is empty")
+    with StageTimer(effect, "read"):
+        return await run_in_threadpool(_ingest, upload_file.file, spec)
+
+
+class RequestSizeLimit:
+    """
+    ASGI middleware answering 413 to request bodies over `max_bytes`:
+    up front from Content-Length, or as soon as a streamed body passes
+    the limit, before the multipart parser has written it all to disk.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        error = UploadTooLarge(self.max_bytes, "Request body")
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": error.detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise error
+            return message
 
-    pil_img = Image.open(io.BytesIO(contents))
+        await self.app(scope, limited_receive, send)
+
+
+def _draft(pil_img: Image.Image, max_size: Optional[int], gray: bool) -> None:
+    """
+    Asks the decoder for the smallest scale that still covers max_size
+    (JPEG DCT scaling: 1/2, 1/4 or 1/8), and for luma only if gray.
+    Other formats have no draft mode and decode at full size.
+    """
+    w, h = pil_img.size
+    scale = min(1.0, max_size / max(w, h)) if max_size else 1.0
+    size = (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale)))
+    pil_img.draft("L" if gray else None, size)
+
+
+def decode_image_bytes(
+    contents: Union[bytes, Upload],
+    preview: bool = False,
+    spec: InputSpec = FULL_COLOR,
+    effect: Optional[str] = None
+) -> Image.Image:
+    """
+    Decodes encoded image bytes (or an Upload) into a PIL Image, at the
+    size and in the color mode the effect will use (see InputSpec):
+
+    - Images over spec.max_pixels are rejected with a 413 before
+      decoding, from the dimensions in their header.
+    - JPEGs bigger than spec.max_size are decoded at a reduced scale,
+      never below max_size; the effect does the final resize.
+    - Gray effects get an "L" image; JPEGs then decode only the luma
+      channel. Otherwise RGB, or RGBA if the image has alpha.
+
+    With preview=True the image is shrunk to PREVIEW_MAX_SIZE.
+    `effect` labels the "decode" stage and input pixel metrics.
+    """
+    with StageTimer(effect, "decode"):
+        return _decode(contents, preview, spec, effect)
+
+
+def _decode(
+    contents: Union[bytes, Upload],
+    preview: bool,
+    spec: InputSpec,
+    effect: Optional[str]
+) -> Image.Image:
+    if isinstance(contents, Upload):
+        contents.check_pixels(spec)
+        pil_img = contents.open()
+    else:
+        pil_img = _read_header(io.BytesIO(contents))
+        _check_pixels(spec, pil_img.size)
+    observe_pixels(effect, pil_img.width * pil_img.height)
+
+    max_size = spec.max_size
+    if preview:
+        max_size = min(max_size or PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE)
+    _draft(pil_img, max_size, spec.gray)
 
     # Normalize image mode
-    if pil_img.mode not in ("RGB", "RGBA"):
+    if spec.gray:
+        if pil_img.mode != "L":
+            pil_img = pil_img.convert("L")
+    elif pil_img.mode not in ("RGB", "RGBA"):
         pil_img = pil_img.convert("RGB")
 
+    if preview:
+        pil_img.thumbnail((PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
+
+    # Decode now, while the upload is open
+    pil_img.load()
+    if isinstance(contents, Upload):
+        contents.track(pil_img.width * pil_img.height * len(pil_img.getbands()))
+
+    return pil_img
+
+
+def _decode_as(
+    contents: Union[bytes, Upload],
+    preview: bool,
+    spec: InputSpec,
+    effect: Optional[str],
+    mode: Optional[str]
+):
+    pil_img = decode_image_bytes(contents, preview=preview, spec=spec, effect=effect)
+    if mode == "cv":
+        return pil_to_cv(pil_img)
+    if mode is not None and pil_img.mode != mode:
+        return pil_img.convert(mode)
     return pil_img
 
 
+async def _decode_in_thread(contents, preview, spec, effect, mode):
+    image, stats = await run_in_threadpool(
+        profiling.call_profiled, profiling.profile_requested(), _decode_as, contents, preview, spec, effect, mode
+    )
+    profiling.add_stats(stats)
+    return image
+
+
+async def decode_upload(
+    contents: Union[bytes, Upload],
+    preview: bool = False,
+    spec: InputSpec = FULL_COLOR,
+    effect: Optional[str] = None,
+    mode: Optional[str] = None
+) -> Image.Image:
+    """
+    decode_image_bytes() in a worker thread, so a large decode never
+    stalls the event loop. With `mode` (e.g. "RGB") the image is
+    converted there too.
+    """
+    return await _decode_in_thread(contents, preview, spec, effect, mode)
+
+
+async def decode_upload_array(
+    contents: Union[bytes, Upload],
+    preview: bool = False,
+    spec: InputSpec = FULL_COLOR,
+    effect: Optional[str] = None
+) -> np.ndarray:
+    """
+    Like decode_upload(), returning the OpenCV array (BGR(A), or GRAY
+    for gray specs); the conversion also runs in the worker thread.
+    """
+    return await _decode_in_thread(contents, preview, spec, effect, "cv")
+
+
+async def read_upload_file(
+    upload_file: UploadFile,
+    preview: bool = False,
+    spec: InputSpec = FULL_COLOR
+) -> Image.Image:
+    """
+    Reads a FastAPI UploadFile and returns a PIL Image.
+    Preserves alpha if present.
+    """
+    upload = await read_upload(upload_file, spec)
+    try:
+        return await decode_upload(upload, preview=preview, spec=spec)
+    finally:
+        upload.close()
+
+
 def pil_to_cv(pil_img: Image.Image) -> np.ndarray:
     """
     Converts a PIL Image to an OpenCV NumPy array.
-    Handles RGB and RGBA correctly.
+    Handles RGB, RGBA and L (returned as a single-channel array);
+    other modes (e.g. palette results) go through RGB(A) first.
     """
+    if pil_img.mode not in ("L", "RGB", "RGBA"):
+        has_alpha = "A" in pil_img.getbands() or "transparency" in pil_img.info
+        pil_img = pil_img.convert("RGBA" if has_alpha else "RGB")
+
     img_array = np.array(pil_img)
 
+    if pil_img.mode == "L":
+        return img_array
+
     if pil_img.mode == "RGBA":
         return cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGRA)
 
     return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
 
 
+def ensure_bgr(cv_img: np.ndarray) -> np.ndarray:
+    """
+    Normalizes an OpenCV image to 3-channel BGR.
+    Drops alpha (like cv2.imread does) and expands GRAY.
+    """
+    if cv_img is None or cv_img.size == 0:
+        raise ValueError("Invalid input image")
+
+    if len(cv_img.shape) == 2:
+        return cv2.cvtColor(cv_img, cv2.COLOR_GRAY2BGR)
+
+    if cv_img.shape[2] == 4:
+        return cv2.cvtColor(cv_img, cv2.COLOR_BGRA2BGR)
+
+    return cv_img
+
+
+def ensure_gray(cv_img: np.ndarray) -> np.ndarray:
+    """
+    Normalizes an OpenCV image to single-channel GRAY.
+    Accepts GRAY, BGR and BGRA (alpha is dropped).
+    """
+    if cv_img is None or cv_img.size == 0:
+        raise ValueError("Invalid input image")
+
+    if len(cv_img.shape) == 2:
+        return cv_img
+
+    if cv_img.shape[2] == 4:
+        return cv2.cvtColor(cv_img, cv2.COLOR_BGRA2GRAY)
+
+    return cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+
+
 def cv_to_pil(cv_img: np.ndarray) -> Image.Image:
     """
     Converts an OpenCV NumPy array to a PIL Image.
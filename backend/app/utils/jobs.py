@@ -0,0 +1,634 @@
+# backend/app/utils/jobs.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.metrics import Counter, Gauge, register_collector
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# Job store: "memory" (lost on restart) or "sqlite" (jobs and results
+# under JOBS_DIR survive restarts; unfinished jobs are then failed)
+STORE = os.environ.get("JOBS_STORE", "memory").lower()
+JOBS_DIR = Path(os.environ.get(
+    "JOBS_DIR",
+    Path(tempfile.gettempdir()) / "image-transform-jobs"
+))
+
+# Jobs running at the same time (each still waits for its effect pool)
+WORKERS = int(os.environ.get("JOBS_WORKERS", "2"))
+
+# Jobs allowed to wait; submissions beyond get a 503
+MAX_QUEUED = int(os.environ.get("JOBS_MAX_QUEUED", "100"))
+
+# How long finished jobs and their results are kept
+RESULT_TTL_SECONDS = float(os.environ.get("JOBS_RESULT_TTL_MINUTES", "60")) * 60
+
+# Results kept by the memory store; beyond it the oldest expire early
+MEMORY_BUDGET = int(float(os.environ.get("JOBS_MEMORY_MB", "256")) * 1024 * 1024)
+
+# Seconds between sweeps deleting expired jobs
+SWEEP_SECONDS = 60
+
+# Least seconds between two progress saves of one running job
+PROGRESS_SAVE_SECONDS = 1.0
+
+# Chunk size when reading stored results
+READ_CHUNK_BYTES = 256 * 1024
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+# -------------------------------------------------------------------
+# Errors
+# -------------------------------------------------------------------
+
+class JobQueueFull(HTTPException):
+    """
+    Raised when MAX_QUEUED jobs are already waiting.
+    FastAPI turns it into a 503 with a Retry-After header.
+    """
+
+    def __init__(self, retry_after: int = 30):
+        super().__init__(
+            status_code=503,
+            detail="Too many queued jobs, retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class JobFailed(Exception):
+    """
+    Ends a job as failed, with an HTTP-like status for the client.
+    """
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# -------------------------------------------------------------------
+# Jobs
+# -------------------------------------------------------------------
+
+class Job:
+    """
+    One submitted render. Everything but the inputs (which live in the
+    runner until the job ends) and the result (in the store).
+
+    Args:
+        effect: Effect name
+        style: Style, for effects that take one
+        params: Other request parameters (preview, output format...)
+        kind: "image" (result is one image) or "zip" (batch archive)
+        items: Images to render
+    """
+
+    FIELDS = (
+        "id", "effect", "style", "params", "kind", "items", "status",
+        "completed", "failed", "error", "status_code", "media_type",
+        "filename", "size", "created", "started", "finished", "expires"
+    )
+
+    def __init__(
+        self,
+        effect: str,
+        style: Optional[str] = None,
+        params: Optional[Dict] = None,
+        kind: str = "image",
+        items: int = 1
+    ):
+        self.id = uuid.uuid4().hex
+        self.effect = effect
+        self.style = style
+        self.params = params or {}
+        self.kind = kind
+        self.items = items
+        self.status = "queued"
+        self.completed = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.media_type: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.size: Optional[int] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.expires: Optional[float] = None
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires is not None and self.expires <= (now or time.time())
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        job = cls(data["effect"])
+        for name in cls.FIELDS:
+            setattr(job, name, data.get(name))
+        return job
+
+
+# -------------------------------------------------------------------
+# Stores
+# -------------------------------------------------------------------
+
+class _MemoryResult:
+    def __init__(self, store: "MemoryJobStore", job_id: str):
+        self._store = store
+        self._job_id = job_id
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self._chunks.append(bytes(data))
+
+    def commit(self) -> int:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        self._store._put_result(self._job_id, data)
+        return len(data)
+
+    def discard(self) -> None:
+        # Drops the result, committed or not
+        self._chunks = []
+        self._store._drop_result(self._job_id)
+
+
+class MemoryJobStore:
+    """
+    Jobs and results in process memory, lost on restart. Results past
+    MEMORY_BUDGET expire early, oldest first.
+    """
+
+    def __init__(self, budget: int = MEMORY_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, dict] = {}
+        self._results: "OrderedDict[str, bytes]" = OrderedDict()
+        self._result_bytes = 0
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job.to_dict()
+
+    def update(self, job: Job) -> bool:
+        # Like save(), but never brings back a deleted job
+        with self._lock:
+            if job.id not in self._jobs:
+                return False
+            self._jobs[job.id] = job.to_dict()
+            return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            data = self._jobs.get(job_id)
+        return Job.from_dict(data) if data is not None else None
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            data = self._results.pop(job_id, None)
+            if data is not None:
+                self._result_bytes -= len(data)
+
+    def expired(self, now: float) -> List[str]:
+        with self._lock:
+            return [
+                job_id for job_id, data in self._jobs.items()
+                if data["expires"] is not None and data["expires"] <= now
+            ]
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATUSES, 0)
+        with self._lock:
+            for data in self._jobs.values():
+                counts[data["status"]] += 1
+        return counts
+
+    def fail_unfinished(self, message: str) -> int:
+        # Nothing survives a restart
+        return 0
+
+    def result_writer(self, job_id: str) -> _MemoryResult:
+        return _MemoryResult(self, job_id)
+
+    def _drop_result(self, job_id: str) -> None:
+        with self._lock:
+            data = self._results.pop(job_id, None)
+            if data is not None:
+                self._result_bytes -= len(data)
+
+    def remove_orphans(self) -> int:
+        """
+        Drops results whose job is gone.
+        """
+        with self._lock:
+            orphans = [job_id for job_id in self._results if job_id not in self._jobs]
+        for job_id in orphans:
+            self._drop_result(job_id)
+        return len(orphans)
+
+    def _put_result(self, job_id: str, data: bytes) -> None:
+        with self._lock:
+            self._results[job_id] = data
+            self._result_bytes += len(data)
+            while self._result_bytes > self.budget and len(self._results) > 1:
+                old_id, old = self._results.popitem(last=False)
+                self._result_bytes -= len(old)
+                self._jobs.pop(old_id, None)
+
+    def read_result(self, job_id: str) -> Optional[Iterator[bytes]]:
+        with self._lock:
+            data = self._results.get(job_id)
+        if data is None:
+            return None
+        view = memoryview(data)
+        return (bytes(view[i:i + READ_CHUNK_BYTES]) for i in range(0, len(data), READ_CHUNK_BYTES))
+
+
+class _FileResult:
+    def __init__(self, path: Path):
+        self.path = path
+        self._partial = path.with_suffix(".part")
+        self._file = open(self._partial, "wb")
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def commit(self) -> int:
+        self._file.close()
+        os.replace(self._partial, self.path)
+        return self.path.stat().st_size
+
+    def discard(self) -> None:
+        # Drops the result, committed or not
+        self._file.close()
+        self._partial.unlink(missing_ok=True)
+        self.path.unlink(missing_ok=True)
+
+
+class SqliteJobStore:
+    """
+    Jobs in a SQLite database, results as files next to it, so both
+    survive restarts. Statements are short; one connection is shared
+    under a lock. Every call blocks on SQLite: the runner makes them
+    from worker threads.
+    """
+
+    def __init__(self, root: Path = JOBS_DIR):
+        self.root = Path(root)
+        self.results_dir = self.root / "results"
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / "jobs.sqlite3"), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # Durable across crashes of the process; only a power loss
+            # may drop the last commits (WAL keeps the database intact)
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, expires REAL, data TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)")
+
+    def _result_path(self, job_id: str) -> Path:
+        return self.results_dir / job_id
+
+    def save(self, job: Job) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, expires, data) VALUES (?, ?, ?, ?)",
+                (job.id, job.status, job.expires, json.dumps(job.to_dict()))
+            )
+
+    def update(self, job: Job) -> bool:
+        # Like save(), but never brings back a deleted job
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, expires = ?, data = ? WHERE id = ?",
+                (job.status, job.expires, json.dumps(job.to_dict()), job.id)
+            )
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_dict(json.loads(row[0])) if row else None
+
+    def delete(self, job_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self._result_path(job_id).unlink(missing_ok=True)
+
+    def expired(self, now: float) -> List[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM jobs WHERE expires <= ?", (now,)).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATUSES, 0)
+        with self._lock:
+            for status, count in self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+                counts[status] = count
+        return counts
+
+    def fail_unfinished(self, message: str) -> int:
+        """
+        Fails the jobs a previous server process left queued or
+        running: their inputs were in that process's memory.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        now = time.time()
+        for (data,) in rows:
+            job = Job.from_dict(json.loads(data))
+            job.status, job.status_code, job.error = "failed", 500, message
+            job.finished, job.expires = now, now + RESULT_TTL_SECONDS
+            self.save(job)
+        return len(rows)
+
+    def result_writer(self, job_id: str) -> _FileResult:
+        return _FileResult(self._result_path(job_id))
+
+    def remove_orphans(self) -> int:
+        """
+        Deletes result files (and partial ones) whose job is gone, e.g.
+        left by a crash mid-write. Jobs are stored before their result
+        is written, so a file without a row is never in use.
+        """
+        files = list(self.results_dir.iterdir())
+        with self._lock:
+            known = {row[0] for row in self._db.execute("SELECT id FROM jobs")}
+        removed = 0
+        for path in files:
+            if path.stem not in known:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def read_result(self, job_id: str) -> Optional[Iterator[bytes]]:
+        try:
+            f = open(self._result_path(job_id), "rb")
+        except FileNotFoundError:
+            return None
+
+        def chunks():
+            with f:
+                while True:
+                    data = f.read(READ_CHUNK_BYTES)
+                    if not data:
+                        break
+                    yield data
+
+        return chunks()
+
+
+def create_store(kind: str = STORE):
+    if kind == "memory":
+        return MemoryJobStore()
+    if kind == "sqlite":
+        return SqliteJobStore()
+    raise ValueError(f"Invalid JOBS_STORE '{kind}', expected memory or sqlite")
+
+
+# -------------------------------------------------------------------
+# Runner
+# -------------------------------------------------------------------
+
+# Renders a job: writes its result with writer.write() and updates the
+# job's progress fields; raises JobFailed (or anything) to fail it
+JobWork = Callable[[Job, object], Awaitable[None]]
+
+
+class JobRunner:
+    """
+    Runs submitted jobs in order on WORKERS asyncio workers and deletes
+    expired ones. The rendering itself happens in the effect worker
+    pools, so workers only bound how many jobs compete for them. Store
+    calls run in worker threads, never on the event loop.
+    """
+
+    def __init__(self, store, workers: int = WORKERS, max_queued: int = MAX_QUEUED):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queued = max(0, max_queued)
+        self.rejected = 0
+        # job id -> (work, cleanup), in submission order
+        self._pending: "OrderedDict[str, Tuple[JobWork, Callable[[], None]]]" = OrderedDict()
+        self._running: Dict[str, asyncio.Task] = {}
+        # job id -> time of its last progress save
+        self._progress_saved: Dict[str, float] = {}
+        self._wakeup: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        failed = await run_in_threadpool(
+            self.store.fail_unfinished, "Server restarted before the job finished"
+        )
+        if failed:
+            print(f"[jobs] {failed} unfinished job(s) from a previous run marked failed")
+        self._wakeup = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._sweeper()))
+
+    async def stop(self) -> None:
+        for task in [*self._tasks, *self._running.values()]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._running.values(), return_exceptions=True)
+        self._tasks = []
+        for job_id, (_, cleanup) in list(self._pending.items()):
+            cleanup()
+        self._pending.clear()
+
+    async def submit(self, job: Job, work: JobWork, cleanup: Callable[[], None]) -> int:
+        """
+        Queues a job and returns its position (0 = next to run).
+        cleanup() releases its inputs once it ended or was cancelled.
+        """
+        if self._wakeup is None:
+            raise RuntimeError("Job runner not started")
+        if len(self._pending) >= self.max_queued:
+            self.rejected += 1
+            raise JobQueueFull()
+
+        # Holds its queue slot while the job is stored
+        self._pending[job.id] = (work, cleanup)
+        try:
+            await run_in_threadpool(self.store.save, job)
+        except BaseException:
+            self._pending.pop(job.id, None)
+            raise
+        self._wakeup.put_nowait(job.id)
+        return self.position(job.id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        for position, pending_id in enumerate(self._pending):
+            if pending_id == job_id:
+                return position
+        return None
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """
+        The job, or None if unknown or expired.
+        """
+        job = await run_in_threadpool(self.store.get, job_id)
+        if job is not None and job.expired():
+            await run_in_threadpool(self.store.delete, job_id)
+            return None
+        return job
+
+    async def save_progress(self, job: Job) -> None:
+        """
+        Stores a running job's progress fields, at most once every
+        PROGRESS_SAVE_SECONDS; the final state is always stored when
+        the job ends.
+        """
+        now = time.monotonic()
+        if now - self._progress_saved.get(job.id, 0.0) < PROGRESS_SAVE_SECONDS:
+            return
+        self._progress_saved[job.id] = now
+        await run_in_threadpool(self.store.update, job)
+
+    async def read_result(self, job_id: str) -> Optional[Iterator[bytes]]:
+        return await run_in_threadpool(self.store.read_result, job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Drops a job, running or not, with its result.
+        """
+        entry = self._pending.pop(job_id, None)
+        if entry is not None:
+            entry[1]()
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        found = await run_in_threadpool(self._delete, job_id)
+        return found or entry is not None or task is not None
+
+    def _delete(self, job_id: str) -> bool:
+        found = self.store.get(job_id) is not None
+        self.store.delete(job_id)
+        return found
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._wakeup.get()
+            entry = self._pending.pop(job_id, None)
+            if entry is None:
+                # Cancelled while queued
+                continue
+            task = asyncio.ensure_future(self._run(job_id, *entry))
+            self._running[job_id] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # The worker itself is being stopped
+                    task.cancel()
+                    raise
+            finally:
+                self._running.pop(job_id, None)
+                self._progress_saved.pop(job_id, None)
+
+    async def _run(self, job_id: str, work: JobWork, cleanup: Callable[[], None]) -> None:
+        job = await run_in_threadpool(self.store.get, job_id)
+        if job is None:
+            cleanup()
+            return
+
+        job.status, job.started = "running", time.time()
+        if not await run_in_threadpool(self.store.update, job):
+            # Cancelled meanwhile
+            cleanup()
+            return
+        writer = await run_in_threadpool(self.store.result_writer, job.id)
+        try:
+            await work(job, writer)
+            job.size = await self._commit(writer)
+            job.status, job.status_code = "done", 200
+        except asyncio.CancelledError:
+            await run_in_threadpool(writer.discard)
+            raise
+        except JobFailed as e:
+            await run_in_threadpool(writer.discard)
+            job.status, job.status_code, job.error = "failed", e.status_code, str(e)
+        except HTTPException as e:
+            await run_in_threadpool(writer.discard)
+            job.status, job.status_code, job.error = "failed", e.status_code, str(e.detail)
+        except Exception as e:
+            await run_in_threadpool(writer.discard)
+            job.status, job.status_code, job.error = "failed", 500, f"{type(e).__name__}: {e}"
+        finally:
+            cleanup()
+
+        job.finished = time.time()
+        job.expires = job.finished + RESULT_TTL_SECONDS
+        if not await run_in_threadpool(self.store.update, job):
+            # Deleted meanwhile: drop the result committed after it
+            await run_in_threadpool(writer.discard)
+
+    @staticmethod
+    async def _commit(writer) -> int:
+        # A cancel must not interrupt the commit midway: the file would
+        # be renamed into place after the discard that should remove it
+        commit = asyncio.ensure_future(run_in_threadpool(writer.commit))
+        try:
+            return await asyncio.shield(commit)
+        except asyncio.CancelledError:
+            await asyncio.gather(commit, return_exceptions=True)
+            raise
+
+    def _sweep(self) -> None:
+        for job_id in self.store.expired(time.time()):
+            self.store.delete(job_id)
+        self.store.remove_orphans()
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(SWEEP_SECONDS)
+            try:
+                await run_in_threadpool(self._sweep)
+            except Exception as e:
+                # A locked or broken database must not stop the sweeps
+                print(f"[jobs] Expiry sweep failed: {e}")
+
+
+job_runner = JobRunner(create_store())
+
+
+def _collect_job_metrics():
+    jobs = Gauge("jobs", "Jobs by status (stored, not yet expired)", ("status",))
+    for status, count in job_runner.store.counts().items():
+        jobs.set(count, status)
+    queued = Gauge("jobs_queue_depth", "Jobs waiting for a job worker")
+    queued.set(job_runner.queued)
+    rejected = Counter("jobs_rejected_total", "Job submissions rejected with a full queue")
+    rejected.set(job_runner.rejected)
+    return [jobs, queued, rejected]
+
+
+register_collector(_collect_job_metrics)
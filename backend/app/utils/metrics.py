@@ -0,0 +1,342 @@
+# backend/app/utils/metrics.py
+
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# Prefix of every metric name
+NAMESPACE = "image_transform"
+
+# Set METRICS_ENABLED=0 to skip all recording (/metrics then only has
+# the values read from the other stats at scrape time)
+ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Histogram buckets: seconds, and input pixels
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+PIXEL_BUCKETS = (
+    100_000, 300_000, 1_000_000, 2_000_000, 4_000_000, 8_000_000,
+    12_000_000, 16_000_000, 24_000_000, 40_000_000, 80_000_000
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Set SERVER_TIMING=0 to drop the Server-Timing response header
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1").lower() not in ("0", "false", "no")
+
+
+# -------------------------------------------------------------------
+# Metric types (Prometheus text format)
+# -------------------------------------------------------------------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    A metric family: one value (or histogram) per label combination.
+    Label values are passed positionally, in `labelnames` order.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = f"{NAMESPACE}_{name}"
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _lines(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._lines())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, value: float, *labels) -> None:
+        # For counters kept elsewhere and copied at scrape time
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """
+    Fixed-bucket histogram. An observation is one bisect and a few
+    additions under a lock.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # [per-bucket counts (+Inf last), sum]
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _lines(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(
+                ((labels, (list(counts), total)) for labels, (counts, total) in self._values.items()),
+                key=lambda item: tuple(map(str, item[0]))
+            )
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {_format_value(total)}"
+            yield f"{self.name}_count{label_str} {cumulative}"
+
+
+# -------------------------------------------------------------------
+# Registry
+# -------------------------------------------------------------------
+
+_metrics: List[Metric] = []
+_collectors: List[Callable[[], Iterable[Metric]]] = []
+
+
+def register(metric: Metric) -> Metric:
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector: Callable[[], Iterable[Metric]]) -> None:
+    """
+    Adds a function called at scrape time, returning metrics built from
+    state kept elsewhere (pool sizes, cache counters, model stats...).
+    Nothing is recorded between scrapes.
+    """
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    """
+    Every metric, in Prometheus text exposition format.
+    """
+    families = list(_metrics)
+    for collector in _collectors:
+        families.extend(collector())
+    return "\n".join(metric.render() for metric in families) + "\n"
+
+
+# -------------------------------------------------------------------
+# Request metrics
+# -------------------------------------------------------------------
+
+# Stages of an effect request: read (upload copy), decode, queue (wait
+# for a worker), process (the effect itself), encode
+STAGE_SECONDS = register(Histogram(
+    "stage_seconds", "Time spent per effect and request stage", ("effect", "stage")
+))
+INPUT_PIXELS = register(Histogram(
+    "input_pixels", "Pixels of decoded input images", ("effect",), PIXEL_BUCKETS
+))
+HTTP_REQUESTS = register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+))
+HTTP_SECONDS = register(Histogram(
+    "http_request_seconds", "HTTP request latency, until the response is sent", ("route",)
+))
+HTTP_IN_FLIGHT = register(Gauge(
+    "http_requests_in_flight", "HTTP requests being handled"
+))
+
+
+# Stages recorded while handling the current request, as (effect,
+# stage, seconds); set by ServerTimingMiddleware, None elsewhere
+_request_stages: ContextVar[Optional[list]] = ContextVar("request_stages", default=None)
+
+
+def record_stage(effect: Optional[str], stage: str, seconds: float) -> None:
+    if effect is None:
+        return
+    if ENABLED:
+        STAGE_SECONDS.observe(seconds, effect, stage)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((effect, stage, seconds))
+
+
+def observe_pixels(effect: Optional[str], pixels: int) -> None:
+    if ENABLED and effect is not None:
+        INPUT_PIXELS.observe(pixels, effect)
+
+
+class StageTimer:
+    """
+    Times a block as one stage of an effect request:
+
+        with StageTimer("gray_sketch", "decode"):
+            ...
+
+    Failed stages are recorded too. effect=None records nothing.
+    """
+
+    __slots__ = ("effect", "stage", "started")
+
+    def __init__(self, effect: Optional[str], stage: str):
+        self.effect = effect
+        self.stage = stage
+
+    def __enter__(self) -> "StageTimer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        record_stage(self.effect, self.stage, time.perf_counter() - self.started)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting HTTP requests per route template (e.g.
+    "/pixel-art/{style_name}/") and status, with their latency and the
+    number in flight.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Set by the router once the request matched a route
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(scope["method"], route, status)
+            HTTP_SECONDS.observe(time.perf_counter() - started, route)
+
+
+def server_timing(stages: Sequence[Tuple[str, str, float]], total: float) -> str:
+    """
+    Server-Timing header value: one entry per effect and stage (repeats
+    summed), in the order first recorded, then the time spent in the
+    app until the response started, e.g.
+        decode;desc="gray_sketch";dur=12.4, process;desc="gray_sketch";dur=80.1, app;dur=95.0
+    """
+    totals: Dict[Tuple[str, str], float] = {}
+    for effect, stage, seconds in stages:
+        totals[(effect, stage)] = totals.get((effect, stage), 0.0) + seconds
+    entries = [
+        f'{stage};desc="{_escape(effect)}";dur={seconds * 1000:.1f}'
+        for (effect, stage), seconds in totals.items()
+    ]
+    entries.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware adding a Server-Timing header with the stages
+    (read, decode, queue, process, encode) recorded by the request so
+    far. Streamed responses (batch, fan-out) send their headers before
+    the effects run, so they only report the read stage.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SERVER_TIMING:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stages: list = []
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                value = server_timing(stages, time.perf_counter() - started)
+                message["headers"] = [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        token = _request_stages.set(stages)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
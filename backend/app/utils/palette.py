@@ -0,0 +1,128 @@
+# backend/app/utils/palette.py
+
+import cv2
+import numpy as np
+
+
+def fit_palette(
+    pixels: np.ndarray,
+    k: int,
+    sample_size: int = 20000,
+    attempts: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Fits a k-color palette with k-means on a random pixel sample.
+
+    The cost of k-means grows with pixels x iterations x attempts, but a
+    few thousand pixels already pin down the dominant colors, so the
+    sample size (not the image size) bounds the work. Sampling and
+    center initialization are seeded: the same image always gets the
+    same palette.
+
+    Args:
+        pixels: (N, 3) uint8 or float32 colors
+        k: Number of palette colors
+        sample_size: Pixels used for fitting (all of them if N is smaller)
+        attempts: k-means restarts, best compactness wins
+        seed: Seed for sampling and initialization
+
+    Returns:
+        (k, 3) float32 palette; (n, 3) with the n distinct colors of
+        inputs of at most k pixels
+    """
+    pixels = pixels.reshape(-1, 3)
+    if len(pixels) > sample_size:
+        rng = np.random.default_rng(seed)
+        pixels = pixels[rng.integers(0, len(pixels), sample_size)]
+
+    data = pixels.astype(np.float32)
+    if len(data) <= k:
+        # Nothing to cluster (and cv2.kmeans mishandles a single sample):
+        # the palette is the sample's colors
+        return np.unique(data, axis=0)
+
+    # theRNG() is per thread, so this does not affect other requests
+    cv2.setRNGSeed(seed)
+    _, _, centers = cv2.kmeans(
+        data, k, None,
+        (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.001),
+        attempts,
+        cv2.KMEANS_RANDOM_CENTERS
+    )
+    return centers
+
+
+# palette_lut() marker for cells that straddle a palette boundary
+AMBIGUOUS = 255
+
+
+def palette_lut(centers: np.ndarray, bits: int = 6) -> np.ndarray:
+    """
+    3D lookup table mapping quantized colors to their nearest palette
+    index.
+
+    Each channel keeps its top `bits` bits, so a table cell is a small
+    color cube. Voronoi regions are convex: if all 8 corners of a cube
+    share a nearest center, every color inside does too and the cell
+    gets that index. Cells crossed by a palette boundary are marked
+    AMBIGUOUS and must be resolved per pixel with nearest_center().
+
+    Returns:
+        uint8 array of shape (2**bits,) * 3
+    """
+    size = 1 << bits
+    step = 256 // size
+
+    # Nearest center at every cube corner
+    axis = np.arange(size + 1, dtype=np.float32) * step
+    grid = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1)
+    corners = nearest_center(grid, centers).reshape(size + 1, size + 1, size + 1)
+
+    lut = corners[:-1, :-1, :-1].copy()
+    for dr in (0, 1):
+        for dg in (0, 1):
+            for db in (0, 1):
+                other = corners[dr:size + dr, dg:size + dg, db:size + db]
+                lut[other != lut] = AMBIGUOUS
+    return lut
+
+
+def nearest_center(pixels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    Index of the nearest center (squared Euclidean) for (N, 3) pixels.
+    """
+    pixels = pixels.reshape(-1, 3).astype(np.float32)
+    centers = centers.astype(np.float32)
+
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2; |p|^2 is the same for every c
+    scores = pixels @ (-2.0 * centers.T) + (centers * centers).sum(axis=1)
+    return scores.argmin(axis=1).astype(np.uint8)
+
+
+def quantize(img: np.ndarray, centers: np.ndarray, bits: int = 6) -> np.ndarray:
+    """
+    Maps every pixel of a 3-channel uint8 image to its nearest palette
+    color. Most pixels are resolved with one palette_lut() lookup; only
+    pixels in cells crossed by a palette boundary (typically a few
+    percent) get an exact distance computation.
+
+    Images with fewer pixels than the table has corners are cheaper to
+    resolve directly, and skip the table.
+
+    Returns:
+        uint8 image with the same shape as img
+    """
+    if img.shape[0] * img.shape[1] <= ((1 << bits) + 1) ** 3:
+        labels = nearest_center(img, centers).reshape(img.shape[:2])
+        return np.uint8(centers)[labels]
+
+    lut = palette_lut(centers, bits)
+    shift = 8 - bits
+    labels = lut[img[..., 0] >> shift, img[..., 1] >> shift, img[..., 2] >> shift]
+
+    ambiguous = labels == AMBIGUOUS
+    if ambiguous.any():
+        labels[ambiguous] = nearest_center(img[ambiguous], centers)
+
+    return np.uint8(centers)[labels]
@@ -0,0 +1,206 @@
+# backend/app/utils/profiling.py
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import secrets
+import tempfile
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# Set PROFILING_ENABLED=1 to profile requests sending the X-Profile
+# header. Off by default: the middleware is then not even installed
+ENABLED = os.environ.get("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# Request header asking for a profile, and response header naming it
+HEADER = b"x-profile"
+
+# Where profiles are written (cProfile/pstats format), and how many of
+# the most recent ones are kept
+PROFILE_DIR = Path(os.environ.get(
+    "PROFILING_DIR", os.path.join(tempfile.gettempdir(), "image-transform-profiles")
+))
+KEEP_PROFILES = int(os.environ.get("PROFILING_KEEP", "50"))
+
+# Functions listed in the text report
+REPORT_LINES = 40
+
+_ID_PATTERN = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}$")
+
+# Stats of the pooled calls (effects, encodes) made by the request being
+# profiled; None outside a profiled request
+_pooled_stats: ContextVar[Optional[List[dict]]] = ContextVar("pooled_stats", default=None)
+
+
+# -------------------------------------------------------------------
+# Pooled calls
+# -------------------------------------------------------------------
+
+def profile_requested() -> bool:
+    """
+    True inside a profiled request: its pooled calls should then run
+    through call_profiled(profile=True) and hand their stats to
+    add_stats().
+    """
+    return _pooled_stats.get() is not None
+
+
+def call_profiled(profile: bool, fn: Callable, *args, **kwargs) -> Tuple[object, Optional[dict]]:
+    """
+    Calls fn, under cProfile if `profile` is set, in the worker thread
+    or process running it. Returns the result and the raw stats (a
+    picklable dict), or None when not profiled.
+    """
+    if not profile:
+        return fn(*args, **kwargs), None
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active in this thread
+        return fn(*args, **kwargs), None
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+def add_stats(stats: Optional[dict]) -> None:
+    """
+    Adds a pooled call's stats (see call_profiled) to the profile of
+    the current request.
+    """
+    collected = _pooled_stats.get()
+    if stats is not None and collected is not None:
+        collected.append(stats)
+
+
+class _RawStats:
+    # What pstats.Stats() loads: an object with create_stats() and stats
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+# -------------------------------------------------------------------
+# Stored profiles
+# -------------------------------------------------------------------
+
+def _new_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """
+    Path of a stored profile, or None for unknown (or malformed) ids.
+    """
+    if not _ID_PATTERN.match(profile_id):
+        return None
+    path = PROFILE_DIR / f"{profile_id}.prof"
+    return path if path.is_file() else None
+
+
+def profile_report(path: Path, sort: str = "cumulative") -> str:
+    """
+    Text summary of a stored profile: the REPORT_LINES functions with
+    the most time, by `sort` ("cumulative", "tottime" or "calls").
+    """
+    if sort not in ("cumulative", "tottime", "calls"):
+        raise ValueError(f"Invalid sort '{sort}', expected cumulative, tottime or calls")
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(REPORT_LINES)
+    return out.getvalue()
+
+
+def _store(profiler: cProfile.Profile, pooled: List[dict], profile_id: str) -> None:
+    # The loop thread's profile plus every pooled call's
+    stats = pstats.Stats(profiler)
+    for raw in pooled:
+        stats.add(_RawStats(raw))
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stats.dump_stats(str(PROFILE_DIR / f"{profile_id}.prof"))
+
+    # Drop the oldest beyond KEEP_PROFILES (ids sort by time)
+    stored = sorted(PROFILE_DIR.glob("*.prof"))
+    for old in stored[:max(0, len(stored) - KEEP_PROFILES)]:
+        old.unlink(missing_ok=True)
+
+
+# -------------------------------------------------------------------
+# Middleware
+# -------------------------------------------------------------------
+
+class ProfileMiddleware:
+    """
+    ASGI middleware profiling requests that send "X-Profile: 1" with
+    cProfile, from the first byte received to the last byte sent.
+
+    The profile merges two parts:
+    - The event loop thread: routing, upload reads and everything else
+      on the loop, including other requests handled meanwhile.
+    - Every pooled call of this request only (effects in their worker
+      threads or processes, decodes, encodes), profiled where it runs.
+      run_effect() and encode_result() do this when profile_requested().
+    Only one request is profiled at a time; others get
+    "X-Profile: busy".
+
+    The profile is written under PROFILE_DIR and its id returned in the
+    X-Profile response header; GET /debug/profiles/{id} serves it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Only touched from the event loop thread
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = "busy" if self._active else _new_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (HEADER, profile_id.encode())]
+            await send(message)
+
+        if self._active:
+            await self.app(scope, receive, send_with_id)
+            return
+
+        self._active = True
+        pooled: List[dict] = []
+        token = _pooled_stats.set(pooled)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            _pooled_stats.reset(token)
+            self._active = False
+            await run_in_threadpool(_store, profiler, pooled, profile_id)
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == HEADER:
+                return value.strip().lower() in (b"1", b"true", b"yes")
+        return False
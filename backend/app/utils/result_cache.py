@@ -0,0 +1,298 @@
+# backend/app/utils/result_cache.py
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.metrics import Counter, Gauge, register_collector
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+
+# In-memory LRU budget, in bytes of encoded results
+MEMORY_BUDGET = int(float(os.environ.get("RESULT_CACHE_MEMORY_MB", "64")) * 1024 * 1024)
+
+# Disk tier budget (0 disables the disk tier)
+DISK_BUDGET = int(float(os.environ.get("RESULT_CACHE_DISK_MB", "512")) * 1024 * 1024)
+DISK_DIR = Path(os.environ.get(
+    "RESULT_CACHE_DIR",
+    Path(tempfile.gettempdir()) / "image-transform-cache"
+))
+
+# Comma-separated effects that must never be cached, e.g. "sticker,cartoon"
+DISABLED_EFFECTS = {
+    name.strip()
+    for name in os.environ.get("RESULT_CACHE_DISABLED", "").split(",")
+    if name.strip()
+}
+
+
+def make_key(effect: str, data: Union[bytes, "hashlib._Hash"], style: Optional[str] = None, **params) -> str:
+    """
+    Content address of a result: input bytes + effect + style + parameters.
+    `data` may also be a sha256 object already fed with the input bytes
+    (Upload.sha256), which gives the same key without the bytes in memory.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        digest = hashlib.sha256(data)
+    else:
+        digest = data.copy()
+    digest.update(json.dumps(
+        {"effect": effect, "style": style, "params": params},
+        sort_keys=True,
+        default=str
+    ).encode())
+    return digest.hexdigest()
+
+
+# -------------------------------------------------------------------
+# Tiers
+# -------------------------------------------------------------------
+
+class _MemoryTier:
+    """
+    LRU over encoded results, bounded by total bytes.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.size = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.budget:
+            return
+
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key))
+
+        self._entries[key] = value
+        self.size += len(value)
+
+        while self.size > self.budget:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class _DiskTier:
+    """
+    Files under `root`, sharded by key prefix, evicted least recently
+    used first once the total size exceeds the budget.
+
+    Only the index is updated under the lock; files are read, written
+    and deleted outside it (callers run get/put in worker threads).
+    """
+
+    def __init__(self, root: Path, budget: int):
+        self.root = root
+        self.budget = budget
+        self.size = 0
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _load_index(self) -> None:
+        # Rebuild LRU order from modification times (touched on every hit)
+        files = [p for p in self.root.glob("*/*") if p.is_file() and not p.name.endswith(".tmp")]
+        files.sort(key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._index[path.name] = size
+            self.size += size
+        self._delete(self._evict())
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            value = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            # Deleted meanwhile (evicted, or removed by hand)
+            with self._lock:
+                if key in self._index:
+                    self.size -= self._index.pop(key)
+            return None
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.budget:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        # Write-then-rename so readers never see a partial file; the
+        # temp name is per thread, as two requests may store one key
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(value)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if key in self._index:
+                self.size -= self._index.pop(key)
+            self._index[key] = len(value)
+            self.size += len(value)
+            evicted = self._evict()
+        self._delete(evicted)
+
+    def _evict(self) -> List[str]:
+        # Drops index entries over budget; the caller deletes their
+        # files once the lock is released
+        evicted = []
+        while self.size > self.budget and self._index:
+            key, size = self._index.popitem(last=False)
+            self.size -= size
+            evicted.append(key)
+        return evicted
+
+    def _delete(self, keys: List[str]) -> None:
+        for key in keys:
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+
+# -------------------------------------------------------------------
+# Cache
+# -------------------------------------------------------------------
+
+class ResultCache:
+    """
+    Two-tier (memory, then disk) cache of encoded effect results, used
+    from the event loop. Disk reads and writes run in worker threads;
+    the lock only guards the memory tier and counters.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = MEMORY_BUDGET,
+        disk_budget: int = DISK_BUDGET,
+        disk_dir: Path = DISK_DIR,
+        disabled_effects=DISABLED_EFFECTS
+    ):
+        self._lock = threading.Lock()
+        self._memory = _MemoryTier(memory_budget)
+        self._disk = None
+        if disk_budget > 0:
+            try:
+                self._disk = _DiskTier(Path(disk_dir), disk_budget)
+            except OSError:
+                # Fall back to memory only if the cache dir is unusable
+                self._disk = None
+        self.disabled_effects = set(disabled_effects)
+
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def enabled(self, effect: str) -> bool:
+        return effect not in self.disabled_effects
+
+    def _count(self, effect: str, name: str) -> None:
+        counters = self.counters.setdefault(
+            effect, {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        )
+        counters[name] += 1
+
+    async def get(self, effect: str, key: str) -> Optional[bytes]:
+        if not self.enabled(effect):
+            return None
+
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._count(effect, "memory_hits")
+                return value
+
+        if self._disk is not None and key in self._disk:
+            value = await run_in_threadpool(self._disk.get, key)
+            if value is not None:
+                with self._lock:
+                    self._memory.put(key, value)
+                    self._count(effect, "disk_hits")
+                return value
+
+        with self._lock:
+            self._count(effect, "misses")
+        return None
+
+    async def put(self, effect: str, key: str, value: bytes) -> None:
+        if not self.enabled(effect):
+            return
+
+        with self._lock:
+            self._memory.put(key, value)
+        if self._disk is not None:
+            try:
+                await run_in_threadpool(self._disk.put, key, value)
+            except OSError:
+                # A full or read-only disk must never fail a request
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_bytes": self._memory.size,
+                "memory_budget": self._memory.budget,
+                "disk_bytes": self._disk.size if self._disk else 0,
+                "disk_budget": self._disk.budget if self._disk else 0,
+                "disabled_effects": sorted(self.disabled_effects),
+                "effects": {k: dict(v) for k, v in self.counters.items()},
+            }
+
+
+result_cache = ResultCache()
+
+
+def _collect_cache_metrics():
+    stats = result_cache.stats()
+    lookups = Counter("cache_lookups_total", "Result cache lookups by outcome", ("effect", "result"))
+    for effect, counters in stats["effects"].items():
+        lookups.set(counters["memory_hits"], effect, "memory_hit")
+        lookups.set(counters["disk_hits"], effect, "disk_hit")
+        lookups.set(counters["misses"], effect, "miss")
+    size = Gauge("cache_bytes", "Result cache size", ("tier",))
+    size.set(stats["memory_bytes"], "memory")
+    size.set(stats["disk_bytes"], "disk")
+    return [lookups, size]
+
+
+register_collector(_collect_cache_metrics)
+
+
+def cached_response(value: bytes, media_type: str = "image/png") -> Response:
+    """
+    Response for a cache hit.
+    """
+    return Response(
+        content=value,
+        media_type=media_type,
+        headers={"X-Cache": "HIT"}
+    )
@@ -0,0 +1,56 @@
+# backend/app/utils/shared_array.py
+
+from multiprocessing import shared_memory
+from typing import Callable, Tuple
+
+import numpy as np
+
+# (shared memory name, shape, dtype) - cheap to pickle to a worker
+SharedHandle = Tuple[str, Tuple[int, ...], str]
+
+
+class SharedArray:
+    """
+    A read-only NumPy array placed once in shared memory, so several
+    process-pool workers can read it without each getting a pickled copy.
+
+    The creator owns the block and must close() it once every worker
+    using it has finished.
+    """
+
+    def __init__(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)
+        view[...] = array
+        del view
+
+        self.handle: SharedHandle = (self._shm.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def call_with_shared(fn: Callable, handle: SharedHandle, *args, **kwargs):
+    """
+    Runs fn(array, *args, **kwargs) on the shared array, in the worker.
+    The array is a read-only view of the shared block, never a copy.
+    """
+    name, shape, dtype = handle
+    # Workers are spawned by the server process and share its resource
+    # tracker, so attaching does not make them owners of the block
+    shm = shared_memory.SharedMemory(name=name)
+
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    array.flags.writeable = False
+    try:
+        result = fn(array, *args, **kwargs)
+        if isinstance(result, np.ndarray) and np.shares_memory(result, array):
+            result = result.copy()
+        return result
+    finally:
+        del array
+        shm.close()
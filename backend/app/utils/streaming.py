@@ -0,0 +1,122 @@
+# backend/app/utils/streaming.py
+
+import io
+import json
+import uuid
+import zipfile
+from typing import AsyncIterator, List
+
+from fastapi.responses import StreamingResponse
+
+# Results streamed by these helpers are dicts with at least:
+#   index     position of the item in the request
+#   status    HTTP-like status of the item (200 = success)
+#   filename  output name (successes)
+#   output    encoded image bytes (successes)
+#   error     message (failures)
+# Any other keys are reported in the manifest / error parts.
+
+
+def manifest_entry(result: dict) -> dict:
+    return {k: v for k, v in result.items() if k != "output"}
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    Write-only, unseekable file for zipfile: collects what was written
+    since the last drain() so it can be streamed out.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(results: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """
+    Zip archive of the outputs in completion order; manifest.json at
+    the end lists every item with its status or error.
+    """
+    sink = _ZipSink()
+    manifest = []
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        async for result in results:
+            manifest.append(manifest_entry(result))
+            if result["status"] == 200:
+                # Encoded images are already compressed; store them as-is
+                archive.writestr(result["filename"], result["output"])
+                yield sink.drain()
+
+        archive.writestr("manifest.json", json.dumps({"items": manifest}, indent=2))
+    yield sink.drain()
+
+
+async def stream_multipart(
+    results: AsyncIterator[dict],
+    boundary: str,
+    header_prefix: str = "X-Item"
+) -> AsyncIterator[bytes]:
+    """
+    multipart/mixed body, one part per item in completion order:
+    the image for successes, application/json for per-item errors.
+    """
+    async for result in results:
+        if result["status"] == 200:
+            body = result["output"]
+            content_type = result.get("media_type", "image/png")
+            filename = result["filename"]
+        else:
+            body = json.dumps(manifest_entry(result)).encode()
+            content_type = "application/json"
+            filename = f"{result['index']:04d}_error.json"
+
+        headers = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: attachment; filename=\"{filename}\"\r\n"
+            f"{header_prefix}-Index: {result['index']}\r\n"
+            f"{header_prefix}-Status: {result['status']}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        yield headers.encode() + body + b"\r\n"
+
+    yield f"--{boundary}--\r\n".encode()
+
+
+def multi_result_response(
+    results: AsyncIterator[dict],
+    output: str,
+    zip_name: str,
+    header_prefix: str,
+    headers: dict = None
+) -> StreamingResponse:
+    """
+    Streams several results as a zip archive or multipart/mixed body.
+    """
+    headers = dict(headers or {})
+
+    if output == "multipart":
+        boundary = uuid.uuid4().hex
+        return StreamingResponse(
+            stream_multipart(results, boundary, header_prefix),
+            media_type=f"multipart/mixed; boundary={boundary}",
+            headers=headers
+        )
+
+    headers["Content-Disposition"] = f"attachment; filename=\"{zip_name}\""
+    return StreamingResponse(
+        stream_zip(results),
+        media_type="application/zip",
+        headers=headers
+    )
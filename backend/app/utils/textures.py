@@ -0,0 +1,216 @@
+# backend/app/utils/textures.py
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# Budget for cached size-dependent textures (per worker process)
+TEXTURE_CACHE_BUDGET = int(float(os.environ.get("TEXTURE_CACHE_MB", "128")) * 1024 * 1024)
+
+
+def _sample_grid(gray: np.ndarray, step: int) -> np.ndarray:
+    """
+    Returns a full-size mask that is True only on the grid cells
+    (every `step` pixels, starting at 0,0).
+    """
+    grid = np.zeros(gray.shape, dtype=bool)
+    grid[::step, ::step] = True
+    return grid
+
+
+def _stamp(centers: np.ndarray, tile: np.ndarray, anchor: tuple) -> np.ndarray:
+    """
+    Stamps `tile` at every non-zero pixel of `centers` in one pass.
+
+    Morphological dilation is exactly "draw this shape at every center",
+    so this replaces a Python loop of draw calls with a single OpenCV call.
+
+    Args:
+        centers: uint8 mask (255 where a tile should be stamped)
+        tile: uint8 structuring element (non-zero = ink)
+        anchor: (x, y) position of the tile that lands on the center
+
+    Returns:
+        uint8 mask with 255 where any stamped tile has ink
+    """
+    if not centers.any():
+        return centers
+
+    # dilate() samples src at (p + offset - anchor), so flip the tile
+    # to get (center + offset) as the drawn pixels.
+    th, tw = tile.shape
+    flipped = cv2.flip(tile, -1)
+    flipped_anchor = (tw - 1 - anchor[0], th - 1 - anchor[1])
+
+    return cv2.dilate(centers, flipped, anchor=flipped_anchor)
+
+
+def _disc_tile(radius: int) -> np.ndarray:
+    """
+    Filled disc tile matching cv2.circle(..., thickness=-1) rasterization.
+    """
+    size = 2 * radius + 1
+    tile = np.zeros((size, size), dtype=np.uint8)
+    cv2.circle(tile, (radius, radius), radius, 1, -1)
+    return tile
+
+
+def halftone_dots(
+    gray: np.ndarray,
+    step: int = 4,
+    threshold: int = 128,
+    level_size: int = 32
+) -> np.ndarray:
+    """
+    Builds a halftone dot texture from a grayscale image.
+
+    Every `step` pixels the image is sampled; darker samples (below
+    `threshold`) get a black filled dot whose radius grows by one for
+    every `level_size` steps of darkness. Each quantized darkness level
+    is stamped in bulk, so there is no per-cell Python work.
+
+    Args:
+        gray: Single-channel uint8 image
+        step: Spacing of the dot grid in pixels
+        threshold: Samples below this value receive a dot
+        level_size: Darkness range covered by one radius level
+
+    Returns:
+        uint8 texture (white background, black dots), same size as gray
+    """
+    if gray is None or gray.ndim != 2:
+        raise ValueError("halftone_dots expects a single-channel image")
+
+    grid = _sample_grid(gray, step)
+    dark = grid & (gray < threshold)
+
+    # radius = 1 + (threshold - value) // level_size, per grid sample
+    radius = np.zeros(gray.shape, dtype=np.int32)
+    radius[dark] = 1 + (threshold - gray[dark].astype(np.int32)) // level_size
+
+    ink = np.zeros(gray.shape, dtype=np.uint8)
+    for r in np.unique(radius[dark]):
+        centers = np.where(radius == r, 255, 0).astype(np.uint8)
+        ink |= _stamp(centers, _disc_tile(int(r)), (int(r), int(r)))
+
+    return 255 - ink
+
+
+def cross_hatching(
+    gray: np.ndarray,
+    step: int = 6,
+    threshold: int = 180
+) -> np.ndarray:
+    """
+    Builds a cross-hatching texture from a grayscale image.
+
+    Every `step` pixels the image is sampled; samples darker than
+    `threshold` get a 45° and a 135° one-pixel stroke spanning one cell.
+    Strokes that would leave the image are skipped, matching the
+    per-cell cv2.line implementation.
+
+    Args:
+        gray: Single-channel uint8 image
+        step: Spacing of the hatching grid in pixels
+        threshold: Samples below this value are hatched
+
+    Returns:
+        uint8 texture (white background, black strokes), same size as gray
+    """
+    if gray is None or gray.ndim != 2:
+        raise ValueError("cross_hatching expects a single-channel image")
+
+    h, w = gray.shape
+    dark = _sample_grid(gray, step) & (gray < threshold)
+
+    # Strokes are only drawn when the whole cell fits in the image
+    rows = np.arange(h)[:, None]
+    cols = np.arange(w)[None, :]
+    fits_down = rows + step < h
+    diag_45 = dark & fits_down & (cols + step < w)
+    diag_135 = dark & fits_down & (cols - step >= 0)
+
+    tile_45 = np.eye(step + 1, dtype=np.uint8)
+    tile_135 = np.fliplr(tile_45).copy()
+
+    ink = _stamp(diag_45.astype(np.uint8) * 255, tile_45, (0, 0))
+    ink |= _stamp(diag_135.astype(np.uint8) * 255, tile_135, (step, 0))
+
+    return 255 - ink
+
+
+# -------------------------------------------------------------------
+# Size-dependent textures
+# -------------------------------------------------------------------
+
+class _TextureCache:
+    """
+    LRU of generated textures keyed by (name, shape), bounded by bytes.
+    Cached arrays are read-only so they can be shared between threads.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.size = 0
+        self._entries: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: tuple, build) -> np.ndarray:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+
+        value = build()
+        value.setflags(write=False)
+        if value.nbytes > self.budget:
+            return value
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self.size += value.nbytes
+            while self.size > self.budget:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.nbytes
+        return value
+
+
+_texture_cache = _TextureCache(TEXTURE_CACHE_BUDGET)
+
+
+def _draw_diagonal_hatching(h: int, w: int) -> np.ndarray:
+    hatching_1 = np.zeros((h, w), dtype=np.uint8)
+    for i in range(0, h, 4):
+        cv2.line(hatching_1, (0, i), (w, i + w), 200, 1)
+
+    hatching_2 = np.zeros((h, w), dtype=np.uint8)
+    for i in range(-w, h, 4):
+        cv2.line(hatching_2, (0, i), (w, i + w), 180, 1)
+
+    hatching = cv2.bitwise_or(hatching_1, hatching_2)
+    return cv2.GaussianBlur(hatching, (3, 3), 0)
+
+
+def diagonal_hatching(shape: Tuple[int, int], weight: float = 1.0) -> np.ndarray:
+    """
+    Blurred diagonal pencil hatching used by the color sketch effect,
+    as float32 in [0, weight] with shape (h, w, 1) so it broadcasts
+    over BGR images.
+
+    The texture depends only on the image size, so it is generated once
+    per (size, weight) and served from an LRU cache afterwards. The
+    returned array is read-only.
+    """
+    h, w = shape[:2]
+
+    def build():
+        hatching = _draw_diagonal_hatching(h, w)
+        return (hatching.astype(np.float32) / 255.0 * weight)[:, :, None]
+
+    return _texture_cache.get_or_build(("diagonal_hatching", h, w, weight), build)
@@ -0,0 +1,421 @@
+"""
+Micro-benchmarks for every effect service function, on synthetic images.
+
+Usage (from backend/):
+    python benchmark_services.py run -o before.json
+    python benchmark_services.py run --services gray_sketch,manga --sizes 640x480,1920x1080
+    python benchmark_services.py compare before.json after.json
+
+`run` benchmarks each service in a fresh process: a warmup call (model
+loads happen there and are reported as first_ms), then --repeat timed
+calls recording wall time and CPU time of the whole process (all
+threads). Peak memory, above the resident size before the call, is
+measured in a second process where glibc returns freed buffers to the
+system (see MEMORY_ENV); otherwise a call reusing memory freed by the
+previous one shows no growth. Results and the environment (versions,
+thread counts, git commit) go to a JSON file.
+
+`compare` matches two runs by service, style and size, prints the
+change of each measure and exits with status 1 when any result got
+slower or bigger beyond the thresholds. Slower means the median wall
+time grew by more than --threshold percent and even the fastest new
+call is slower than the base median, so one noisy call in either run
+does not flag a regression.
+
+Images are deterministic for a given --seed, so runs are comparable
+across commits. Models are the ones in models/; a service whose model
+is missing is reported with its error and skipped.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+DEFAULT_SIZES = "640x480,1920x1080,4000x3000"
+DEFAULT_REPEAT = 5
+DEFAULT_WARMUP = 1
+
+# Environment of the memory-measuring process: a fixed mmap threshold
+# (glibc's adapts to freed block sizes), so large buffers are unmapped
+# when freed and every call's working memory shows in its peak RSS
+MEMORY_ENV = {"MALLOC_MMAP_THRESHOLD_": "65536"}
+
+# Regressions smaller than this are noise, whatever the percentage
+MIN_WALL_DELTA_MS = 2.0
+MIN_MEMORY_DELTA_MB = 4.0
+
+
+# -------------------------------------------------------------------
+# Synthetic input
+# -------------------------------------------------------------------
+
+def synthetic_image(width: int, height: int, seed: int = 0):
+    """
+    A photo-like BGR image: smooth color gradients, flat shapes with
+    hard edges, and mild sensor-like noise. Same seed, same pixels.
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+
+    coarse = rng.integers(0, 256, (max(2, height // 96), max(2, width // 96), 3), dtype=np.uint8)
+    img = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    scale = max(width, height)
+    for _ in range(16):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        if rng.random() < 0.5:
+            cv2.circle(img, center, int(rng.integers(scale // 40, scale // 8)), color, -1, cv2.LINE_AA)
+        else:
+            corner = (center[0] + int(rng.integers(scale // 30, scale // 6)),
+                      center[1] + int(rng.integers(scale // 30, scale // 6)))
+            cv2.rectangle(img, center, corner, color, -1)
+
+    noise = rng.integers(-6, 7, img.shape, dtype=np.int16)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def parse_size(text: str):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+# -------------------------------------------------------------------
+# Measurement (runs in the per-service child process)
+# -------------------------------------------------------------------
+
+def _rss_kb(field: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def _reset_peak() -> bool:
+    # Linux: "5" resets VmHWM (peak RSS) to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _measure(call):
+    """
+    Runs call() once: (wall ms, CPU ms, peak MB above the RSS before).
+    Without /proc (not Linux) the peak is the growth of the process
+    maximum, so only calls that raise it show up.
+    """
+    if _reset_peak():
+        before = _rss_kb("VmRSS")
+        peak = lambda: _rss_kb("VmHWM")
+    else:
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = call()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    memory = max(0, peak() - before) / 1024
+    del result
+    return wall * 1000, cpu * 1000, memory
+
+
+def _summary(values):
+    return {
+        "min": round(min(values), 3),
+        "median": round(statistics.median(values), 3),
+        "mean": round(statistics.fmean(values), 3),
+        "stdev": round(statistics.stdev(values), 3) if len(values) > 1 else 0.0,
+    }
+
+
+def _bench_service(name: str, style, sizes, repeat: int, warmup: int, seed: int, memory: bool = False):
+    sys.path.insert(0, str(BASE_DIR))
+    import cv2
+    from PIL import Image
+
+    from app.utils.effects import EFFECTS
+
+    effect = EFFECTS[name]
+    if effect.styles is not None:
+        style = style or effect.styles[0]
+    extra = [style] if effect.styles is not None else []
+
+    results = []
+    for width, height in sizes:
+        entry = {
+            "service": name,
+            "function": effect.fn.__name__,
+            "style": style if effect.styles is not None else None,
+            "size": f"{width}x{height}",
+            "pixels": width * height,
+        }
+        image = call = None
+        try:
+            bgr = synthetic_image(width, height, seed)
+            if effect.input_mode == "bgr":
+                image = bgr
+            else:
+                image = Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+            del bgr
+
+            call = lambda image=image: effect.fn(image, *extra, **effect.params)
+
+            first = time.perf_counter()
+            for _ in range(max(1, warmup)):
+                call()
+            entry["first_ms"] = round((time.perf_counter() - first) * 1000 / max(1, warmup), 3)
+
+            walls, cpus, memories = [], [], []
+            for _ in range(repeat):
+                wall, cpu, peak = _measure(call)
+                walls.append(wall)
+                cpus.append(cpu)
+                memories.append(peak)
+
+            if memory:
+                entry["peak_memory_mb"] = round(max(memories), 1)
+            else:
+                entry.update(repeat=repeat, wall_ms=_summary(walls), cpu_ms=_summary(cpus))
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        results.append(entry)
+        # Free this size's input before the next one is measured
+        del image, call
+
+    return results
+
+
+# -------------------------------------------------------------------
+# run
+# -------------------------------------------------------------------
+
+def _environment() -> dict:
+    sys.path.insert(0, str(BASE_DIR))
+    import cv2
+    import numpy
+    import PIL
+    import torch
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "pillow": PIL.__version__,
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def _in_child(fn, *args, env=None):
+    """
+    Runs fn in a fresh process: no caches, models or heap shared with
+    other services. `env` is added to the child's environment.
+    """
+    saved = {key: os.environ.get(key) for key in env or {}}
+    os.environ.update(env or {})
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            return pool.submit(fn, *args).result()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def run(args) -> int:
+    sys.path.insert(0, str(BASE_DIR))
+    from app.utils.effects import EFFECTS
+
+    names = list(EFFECTS) if args.services == "all" else [n.strip() for n in args.services.split(",")]
+    unknown = [n for n in names if n not in EFFECTS]
+    if unknown:
+        print(f"Unknown services: {', '.join(unknown)} (expected {', '.join(EFFECTS)})")
+        return 2
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": _environment(),
+        "config": {
+            "sizes": [f"{w}x{h}" for w, h in sizes],
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+
+    for name in names:
+        results = _in_child(_bench_service, name, args.style, sizes, args.repeat, args.warmup, args.seed)
+        peaks = _in_child(
+            _bench_service, name, args.style, sizes, 1, args.warmup, args.seed, True, env=MEMORY_ENV
+        )
+        for entry, peak in zip(results, peaks):
+            if "error" not in entry:
+                entry["peak_memory_mb"] = peak.get("peak_memory_mb")
+
+        for entry in results:
+            report["results"].append(entry)
+            if "error" in entry:
+                print(f"{name:<15} {entry['size']:>10}  ERROR {entry['error']}")
+            else:
+                print(
+                    f"{name:<15} {entry['size']:>10}  "
+                    f"wall {entry['wall_ms']['median']:9.1f} ms  "
+                    f"cpu {entry['cpu_ms']['median']:9.1f} ms  "
+                    f"peak {entry['peak_memory_mb']:7.1f} MB  "
+                    f"(first {entry['first_ms']:.0f} ms)"
+                )
+
+    Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Wrote {args.output}")
+    return 0
+
+
+# -------------------------------------------------------------------
+# compare
+# -------------------------------------------------------------------
+
+def _key(entry):
+    return entry["service"], entry.get("style"), entry["size"]
+
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(args) -> int:
+    base = json.loads(Path(args.base).read_text())
+    new = json.loads(Path(args.new).read_text())
+    base_results = {_key(e): e for e in base["results"] if "error" not in e}
+    new_results = {_key(e): e for e in new["results"] if "error" not in e}
+
+    print(f"base: {args.base} ({base['environment'].get('commit')})")
+    print(f"new:  {args.new} ({new['environment'].get('commit')})")
+    for field in ("cpu_count", "torch_threads", "opencv_threads", "numpy", "opencv", "torch"):
+        if base["environment"].get(field) != new["environment"].get(field):
+            print(f"warning: {field} differs "
+                  f"({base['environment'].get(field)} -> {new['environment'].get(field)})")
+    print()
+    print(f"{'service':<15} {'size':>10} {'wall ms':>21} {'change':>8} "
+          f"{'cpu ms':>21} {'change':>8} {'peak MB':>17} {'change':>8}")
+
+    regressions = []
+    for key in sorted(base_results.keys() & new_results.keys(), key=str):
+        before, after = base_results[key], new_results[key]
+        wall = (before["wall_ms"]["median"], after["wall_ms"]["median"])
+        cpu = (before["cpu_ms"]["median"], after["cpu_ms"]["median"])
+        memory = (before["peak_memory_mb"], after["peak_memory_mb"])
+
+        flags = []
+        if (
+            _change(*wall) > args.threshold and
+            wall[1] - wall[0] > MIN_WALL_DELTA_MS and
+            after["wall_ms"]["min"] > wall[0]
+        ):
+            flags.append("SLOWER")
+        if (_change(*memory) > args.memory_threshold and memory[1] - memory[0] > MIN_MEMORY_DELTA_MB):
+            flags.append("MORE MEMORY")
+        if flags:
+            regressions.append((key, flags))
+
+        service, style, size = key
+        label = service if style is None else f"{service}:{style}"
+        print(
+            f"{label:<15} {size:>10} "
+            f"{wall[0]:>9.1f} -> {wall[1]:>9.1f} {_change(*wall):>+7.1f}% "
+            f"{cpu[0]:>9.1f} -> {cpu[1]:>9.1f} {_change(*cpu):>+7.1f}% "
+            f"{memory[0]:>7.1f} -> {memory[1]:>7.1f} {_change(*memory):>+7.1f}% "
+            f"{' '.join(flags)}"
+        )
+
+    for key in sorted(base_results.keys() ^ new_results.keys(), key=str):
+        where = "base" if key in base_results else "new"
+        print(f"only in {where}: {' '.join(str(k) for k in key if k is not None)}")
+
+    print()
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:g}% wall time "
+              f"/ {args.memory_threshold:g}% peak memory")
+        return 1
+    print("No regressions")
+    return 0
+
+
+# -------------------------------------------------------------------
+# CLI
+# -------------------------------------------------------------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Benchmark services and write JSON")
+    run_parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file to write")
+    run_parser.add_argument("--services", default="all",
+                            help="Comma-separated effect names (default: all)")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                            help=f"Comma-separated WIDTHxHEIGHT (default: {DEFAULT_SIZES})")
+    run_parser.add_argument("--style", default=None,
+                            help="Style for pixel_art / style_transfer (default: the first one)")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed calls per size")
+    run_parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="Untimed calls per size")
+    run_parser.add_argument("--seed", type=int, default=0, help="Synthetic image seed")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two runs, flag regressions")
+    compare_parser.add_argument("base", help="JSON of the reference run")
+    compare_parser.add_argument("new", help="JSON of the run to check")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="Median wall time increase flagged, in %% (default: 10)")
+    compare_parser.add_argument("--memory-threshold", type=float, default=20.0,
+                                help="Peak memory increase flagged, in %% (default: 20)")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
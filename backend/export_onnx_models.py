@@ -0,0 +1,70 @@
+"""
+Export the PyTorch models to ONNX and compare both backends.
+
+Usage (from backend/):
+    python export_onnx_models.py            # export + parity/latency report
+    python export_onnx_models.py --force    # re-export even if up to date
+
+Set ORT_INTRA_OP_THREADS to compare at the thread count you deploy with.
+"""
+
+import sys
+
+import torch
+
+from app.ml.animegan_generator import Generator
+from app.ml.onnx_backend import OrtModel, compare_backends, ensure_onnx, export_onnx
+from app.services import style_transfer_service as style
+
+BASE_DIR = style.BASE_DIR
+CARTOON_MODEL = BASE_DIR / "models" / "face_paint_512_v2.pt"
+CARTOON_ONNX = BASE_DIR / "models" / "onnx" / "face_paint_512_v2.onnx"
+
+
+def report(name, torch_model, onnx_path, inputs):
+    stats = compare_backends(torch_model, OrtModel(onnx_path), inputs)
+    print(
+        f"{name:<16} max|diff| {stats['max_abs_diff']:.2e}  "
+        f"mean|diff| {stats['mean_abs_diff']:.2e}  "
+        f"torch {stats['torch_ms']:8.1f} ms  onnx {stats['onnx_ms']:8.1f} ms  "
+        f"speedup {stats['torch_ms'] / stats['onnx_ms']:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    force = "--force" in sys.argv
+    torch.manual_seed(0)
+
+    # --- AnimeGAN cartoon generator (fixed 512x512 input) ---
+    if CARTOON_MODEL.exists():
+        generator = Generator()
+        generator.load_state_dict(torch.load(CARTOON_MODEL, map_location="cpu"))
+        generator.eval()
+
+        sample = torch.zeros(1, 3, 512, 512)
+        if force:
+            export_onnx(generator, sample, CARTOON_ONNX)
+        else:
+            ensure_onnx(generator, sample, CARTOON_ONNX, source_path=CARTOON_MODEL)
+        report("animegan", generator, CARTOON_ONNX, [torch.randn(1, 3, 512, 512)])
+    else:
+        print(f"Skipping animegan, model not found: {CARTOON_MODEL}")
+
+    # --- TransformerNet styles (dynamic height/width) ---
+    for style_name in style.VALID_STYLES:
+        weights = style.MODEL_DIR / f"{style_name}.pth"
+        if not weights.exists():
+            print(f"Skipping {style_name}, model not found: {weights}")
+            continue
+
+        model = style.load_style_model(style_name)
+        onnx_path = style.ONNX_DIR / f"{style_name}.onnx"
+        sample = torch.zeros(1, 3, 256, 256)
+        if force:
+            export_onnx(model, sample, onnx_path, dynamic_spatial=True)
+        else:
+            ensure_onnx(model, sample, onnx_path, source_path=weights, dynamic_spatial=True)
+
+        max_size = style.STYLE_MAX_SIZE.get(style_name, 512)
+        inputs = [torch.randn(1, 3, max_size, max_size * 3 // 4), torch.randn(1, 3, 300, 200)]
+        report(style_name, model, onnx_path, inputs)
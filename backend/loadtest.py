@@ -0,0 +1,445 @@
+"""
+Load generator for the effect endpoints, with latency percentiles.
+
+Usage (from backend/):
+    python loadtest.py --mix gray-sketch=3,cartoon=1 --concurrency 1,2,4,8 --duration 20
+    python loadtest.py --mix pixel-art:8bit --sizes 640x480=3,1920x1080=1 --rate 5
+    python loadtest.py --url http://127.0.0.1:8000 --mix manga -o manga.json
+
+By default the app from app.main runs in this process (its lifespan
+included) behind an in-process ASGI transport: no network, no server to
+start. The client then shares the event loop, and this core, with the
+server, so absolute numbers are a little pessimistic. --url targets a
+running server instead, e.g.
+    uvicorn app.main:app --port 8000 --workers 1
+
+Load:
+- closed loop (default): --concurrency clients, each sending its next
+  request as soon as the previous one returns. A comma-separated list
+  runs one stage per level, which shows where throughput stops growing
+  while latency keeps climbing: the saturation point.
+- open loop (--rate): requests arrive as a Poisson process at that many
+  per second, whatever the response times, up to --concurrency in
+  flight (arrivals beyond that count as dropped).
+
+Each request picks an endpoint from --mix and an image size from
+--sizes by weight (seeded, so runs repeat). Images are JPEGs of
+synthetic photos; each upload gets a unique JPEG comment, so the
+result cache never answers (--cache to allow it).
+
+Reported per endpoint and overall, per stage: requests, throughput,
+error rate (any status other than 200, by status) and p50/p95/p99/max
+latency. -o writes everything as JSON.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import struct
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+# Effect name -> endpoint ({style} for effects taking one)
+EFFECT_PATHS = {
+    "gray_sketch": "/gray-sketch/",
+    "color_sketch": "/color-sketch/",
+    "cartoon": "/cartoon/",
+    "manga": "/manga/",
+    "comic_art": "/comic-art/",
+    "popart": "/pop-art/",
+    "neon_glow": "/neon-glow/",
+    "sticker": "/sticker/",
+    "pixel_art": "/pixel-art/{style}/",
+    "style_transfer": "/style-transfer/{style}/",
+}
+DEFAULT_STYLES = {"pixel_art": "8bit", "style_transfer": "candy"}
+
+# Distinct images generated per size (each upload is still made unique)
+IMAGES_PER_SIZE = 3
+
+# Stage throughput growing less than this means the endpoint saturated
+SATURATION_GAIN = 0.10
+
+REQUEST_TIMEOUT = 300.0
+
+
+# -------------------------------------------------------------------
+# Workload
+# -------------------------------------------------------------------
+
+def parse_weights(spec: str) -> List[Tuple[str, float]]:
+    """
+    "a=3,b,c=0.5" -> [("a", 3.0), ("b", 1.0), ("c", 0.5)]
+    """
+    weights = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, weight = entry.partition("=")
+        weights.append((name.strip(), float(weight) if weight else 1.0))
+    if not weights or any(w < 0 for _, w in weights) or sum(w for _, w in weights) <= 0:
+        raise ValueError(f"Invalid weights: '{spec}'")
+    return weights
+
+
+def endpoint_path(entry: str) -> str:
+    """
+    "pixel-art:16bit" -> "/pixel-art/16bit/"; paths pass through.
+    """
+    if entry.startswith("/"):
+        return entry
+    name, _, style = entry.partition(":")
+    name = name.lower().replace("-", "_")
+    name = {"pop_art": "popart"}.get(name, name)
+    if name not in EFFECT_PATHS:
+        raise ValueError(f"Unknown effect '{entry}' (expected one of {', '.join(EFFECT_PATHS)})")
+    return EFFECT_PATHS[name].format(style=style or DEFAULT_STYLES.get(name, ""))
+
+
+def make_images(sizes: List[Tuple[str, float]], seed: int, quality: int = 90) -> Dict[str, List[bytes]]:
+    from PIL import Image
+
+    from benchmark_services import parse_size, synthetic_image
+
+    images = {}
+    for size, _ in sizes:
+        width, height = parse_size(size)
+        images[size] = []
+        for index in range(IMAGES_PER_SIZE):
+            rgb = synthetic_image(width, height, seed + index)[:, :, ::-1]
+            buf = io.BytesIO()
+            Image.fromarray(rgb).save(buf, format="JPEG", quality=quality)
+            images[size].append(buf.getvalue())
+    return images
+
+
+def unique_jpeg(data: bytes, tag: int) -> bytes:
+    # A COM segment right after SOI: new bytes (so a new cache key),
+    # same pixels and decode cost
+    comment = b"loadtest %d" % tag
+    return data[:2] + b"\xff\xfe" + struct.pack(">H", len(comment) + 2) + comment + data[2:]
+
+
+class Workload:
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.endpoints = [(endpoint_path(e), w) for e, w in parse_weights(args.mix)]
+        self.sizes = parse_weights(args.sizes)
+        self.images = make_images(self.sizes, args.seed)
+        self.unique = not args.cache
+        self.params = {}
+        if args.preview:
+            self.params["preview"] = "true"
+        if args.format:
+            self.params["format"] = args.format
+        self._counter = 0
+
+    def _pick(self, weighted):
+        names = [name for name, _ in weighted]
+        return self.rng.choices(names, weights=[w for _, w in weighted])[0]
+
+    def next_request(self) -> Tuple[str, str, bytes]:
+        path = self._pick(self.endpoints)
+        size = self._pick(self.sizes)
+        data = self.rng.choice(self.images[size])
+        if self.unique:
+            self._counter += 1
+            data = unique_jpeg(data, self._counter)
+        return path, size, data
+
+
+# -------------------------------------------------------------------
+# Results
+# -------------------------------------------------------------------
+
+class Sample:
+    __slots__ = ("path", "size", "status", "seconds", "finished")
+
+    def __init__(self, path: str, size: str, status: int, seconds: float, finished: float):
+        self.path = path
+        self.size = size
+        self.status = status
+        self.seconds = seconds
+        self.finished = finished
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    # Nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: List[Sample], seconds: float) -> dict:
+    latencies = sorted(s.seconds for s in samples)
+    statuses = Counter(s.status for s in samples)
+    errors = sum(count for status, count in statuses.items() if status != 200)
+    ok = statuses.get(200, 0)
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(ok / seconds, 3) if seconds else 0.0,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+    }
+
+
+def stage_report(samples: List[Sample], seconds: float) -> dict:
+    by_path = defaultdict(list)
+    for sample in samples:
+        by_path[sample.path].append(sample)
+    return {
+        "seconds": round(seconds, 2),
+        "overall": summarize(samples, seconds),
+        "endpoints": {path: summarize(group, seconds) for path, group in sorted(by_path.items())},
+    }
+
+
+def print_stage(label: str, report: dict) -> None:
+    print(f"\n== {label}: {report['seconds']:.1f} s")
+    if not report["endpoints"]:
+        print("no requests started after the warmup; raise --duration")
+        return
+    print(f"{'endpoint':<26} {'reqs':>6} {'rps':>8} {'errors':>7} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    rows = list(report["endpoints"].items())
+    if len(rows) > 1:
+        rows.append(("(all)", report["overall"]))
+    for path, stats in rows:
+        latency = stats["latency_ms"]
+        print(
+            f"{path:<26} {stats['requests']:>6} {stats['throughput_rps']:>8.2f} "
+            f"{stats['error_rate'] * 100:>6.1f}% "
+            f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} {latency['max']:>9.1f}  "
+            f"{' '.join(f'{s}:{n}' for s, n in stats['statuses'].items())}"
+        )
+
+
+def saturation(stages: List[dict]) -> Dict[str, dict]:
+    """
+    Per endpoint, the first closed-loop stage after which adding
+    clients raised throughput by less than SATURATION_GAIN.
+    """
+    found = {}
+    paths = {path for stage in stages for path in stage["report"]["endpoints"]}
+    for path in sorted(paths) + ["(all)"]:
+        series = [
+            (stage["concurrency"],
+             stage["report"]["overall"] if path == "(all)" else stage["report"]["endpoints"].get(path))
+            for stage in stages
+        ]
+        series = [(c, s) for c, s in series if s]
+        for (concurrency, stats), (_, following) in zip(series, series[1:]):
+            if following["throughput_rps"] < stats["throughput_rps"] * (1 + SATURATION_GAIN):
+                found[path] = {
+                    "concurrency": concurrency,
+                    "throughput_rps": stats["throughput_rps"],
+                    "p95_ms": stats["latency_ms"]["p95"],
+                }
+                break
+    return found
+
+
+# -------------------------------------------------------------------
+# Load
+# -------------------------------------------------------------------
+
+async def _send(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    samples: List[Sample],
+    record: bool,
+    request: Optional[Tuple[str, bytes]] = None
+):
+    if request is None:
+        path, size, data = workload.next_request()
+    else:
+        (path, data), size = request, ""
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            path, params=workload.params, files={"file": ("image.jpg", data, "image/jpeg")}
+        )
+        await response.aread()
+        status = response.status_code
+    except httpx.HTTPError:
+        # Connection failures and timeouts
+        status = 0
+    finished = time.perf_counter()
+    if record:
+        samples.append(Sample(path, size, status, finished - started, finished))
+
+
+async def closed_loop(client, workload, concurrency: int, duration: float, warmup: float) -> Tuple[List[Sample], float]:
+    samples: List[Sample] = []
+    start = time.perf_counter()
+    measure_from = start + warmup
+    end = measure_from + duration
+
+    async def client_loop():
+        while time.perf_counter() < end:
+            await _send(client, workload, samples, time.perf_counter() >= measure_from)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    # Requests started before the end may finish after it
+    return samples, max(duration, time.perf_counter() - measure_from)
+
+
+async def open_loop(client, workload, rate: float, max_in_flight: int, duration: float, warmup: float):
+    samples: List[Sample] = []
+    rng = random.Random(workload.rng.random())
+    start = time.perf_counter()
+    measure_from = start + warmup
+    end = measure_from + duration
+    in_flight = set()
+    dropped = 0
+
+    next_arrival = start
+    while next_arrival < end:
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        record = time.perf_counter() >= measure_from
+        if len(in_flight) >= max_in_flight:
+            dropped += int(record)
+        else:
+            task = asyncio.ensure_future(_send(client, workload, samples, record))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        next_arrival += rng.expovariate(rate)
+
+    await asyncio.gather(*in_flight)
+    return samples, max(duration, time.perf_counter() - measure_from), dropped
+
+
+@asynccontextmanager
+async def make_client(url: Optional[str]):
+    timeout = httpx.Timeout(REQUEST_TIMEOUT)
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            yield client
+        return
+
+    from app.main import app
+
+    # Run the app's lifespan (model preload, pool shutdown) around the test
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            yield client
+
+
+async def main_async(args) -> int:
+    workload = Workload(args)
+    levels = [int(c) for c in str(args.concurrency).split(",")]
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": args.url or "in-process",
+        "config": {
+            "mix": args.mix,
+            "sizes": args.sizes,
+            "concurrency": levels,
+            "rate": args.rate,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "preview": args.preview,
+            "format": args.format,
+            "cache": args.cache,
+            "seed": args.seed,
+        },
+        "stages": [],
+    }
+
+    async with make_client(args.url) as client:
+        # One untimed request per endpoint: worker pools spawn and
+        # models load on first use, not in the first stage
+        for path, _ in workload.endpoints:
+            data = workload.images[workload.sizes[0][0]][0]
+            await _send(client, workload, [], False, (path, unique_jpeg(data, 0)))
+
+        if args.rate:
+            samples, seconds, dropped = await open_loop(
+                client, workload, args.rate, max(levels), args.duration, args.warmup
+            )
+            stage = stage_report(samples, seconds)
+            stage["dropped"] = dropped
+            report["stages"].append({"rate": args.rate, "report": stage})
+            print_stage(f"{args.rate:g} requests/s (max {max(levels)} in flight, {dropped} dropped)", stage)
+        else:
+            for concurrency in levels:
+                samples, seconds = await closed_loop(
+                    client, workload, concurrency, args.duration, args.warmup
+                )
+                stage = stage_report(samples, seconds)
+                report["stages"].append({"concurrency": concurrency, "report": stage})
+                print_stage(f"concurrency {concurrency}", stage)
+
+    if len(report["stages"]) > 1:
+        report["saturation"] = saturation(report["stages"])
+        print("\nSaturation (more clients gained < "
+              f"{SATURATION_GAIN * 100:.0f}% throughput):")
+        for path in sorted({p for stage in report["stages"] for p in stage["report"]["endpoints"]}) + ["(all)"]:
+            point = report["saturation"].get(path)
+            if point:
+                print(f"  {path:<26} {point['throughput_rps']:.2f} rps at concurrency "
+                      f"{point['concurrency']} (p95 {point['p95_ms']:.0f} ms)")
+            else:
+                print(f"  {path:<26} not reached, try higher --concurrency")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nWrote {args.output}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=None,
+                        help="Server to load, e.g. http://127.0.0.1:8000 (default: app in process)")
+    parser.add_argument("--mix", default="gray-sketch",
+                        help="Weighted endpoints: effect[:style][=weight] or /path/, comma-separated")
+    parser.add_argument("--sizes", default="1280x960",
+                        help="Weighted image sizes: WIDTHxHEIGHT[=weight], comma-separated")
+    parser.add_argument("--concurrency", default="4",
+                        help="Clients (closed loop); a comma-separated list runs one stage per level. "
+                             "With --rate: most requests in flight")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Open loop: Poisson arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per stage")
+    parser.add_argument("--warmup", type=float, default=3.0,
+                        help="Seconds of load before measuring, per stage")
+    parser.add_argument("--preview", action="store_true", help="Request previews")
+    parser.add_argument("--format", default=None, help="Output format: png, webp or jpeg")
+    parser.add_argument("--cache", action="store_true",
+                        help="Let repeated images hit the result cache")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of images and request order")
+    parser.add_argument("-o", "--output", default=None, help="JSON report to write")
+    args = parser.parse_args()
+
+    try:
+        return asyncio.run(main_async(args))
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())